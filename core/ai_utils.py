@@ -1,39 +1,175 @@
 # core/ai_utils.py
+import asyncio
+import hashlib
 import json
-from typing import Tuple
+import threading
+import weakref
+from concurrent.futures import Future
+from contextlib import asynccontextmanager, contextmanager
+from typing import AsyncIterator, Iterator, NamedTuple, Tuple
 
-from langchain_groq import ChatGroq
 from django.conf import settings
+from django.core.cache import caches
+
+from . import metrics, ratelimit
+from .screening import age_band
+
+LLM_MODEL = "openai/gpt-oss-20b"
+
+# instance LLM module-level (reuse), dibuat saat pertama dipakai lewat get_llm():
+# import langchain_groq berat, jadi view statis / manage.py tidak perlu ikut membayarnya
+llm = None
+_llm_lock = threading.Lock()
+
+
+def get_llm():
+    global llm
+    if llm is None:
+        with _llm_lock:
+            if llm is None:
+                from langchain_groq import ChatGroq
+
+                # max_tokens di sini hanya batas atas; tiap panggilan memakai budget profilnya
+                llm = ChatGroq(
+                    model=LLM_MODEL,
+                    temperature=0.1,
+                    max_tokens=2048,
+                    reasoning_format="parsed",
+                    timeout=getattr(settings, 'EYERIS_LLM_TIMEOUT', 30.0),
+                    max_retries=1,
+                )
+    return llm
 
-# buat instance LLM module-level (reuse)
-llm = ChatGroq(
-    model="openai/gpt-oss-20b",
-    temperature=0.1,
-    max_tokens=2048,
-    reasoning_format="parsed",
-    timeout=None,
-    max_retries=2,
-)
 
-def ask_ai(variable: str, question: str, system_prompt: str = None) -> Tuple[str, dict]:
+class Profile(NamedTuple):
+    """Budget satu jenis panggilan LLM (dikirim sebagai parameter per panggilan)."""
+    max_tokens: int
+    # gpt-oss: token reasoning ikut dihitung di max_tokens, jadi effort rendah = jawaban lebih cepat
+    reasoning_effort: str
+
+
+def profile(name) -> Profile:
     """
-    Memanggil LLM dan mengembalikan (answer_text, raw_response).
-    - variable: string yang ingin kamu masukkan ke prompt
-    - question: pertanyaan user/trigger
-    - system_prompt: jika None pakai default
+    summary : analisis hasil screening di dashboard, pendek dan latency-nya harus stabil
+    qa      : tanya-jawab bebas (/api/ai-answer/, tombol Analyze)
     """
+    if name == "summary":
+        return Profile(getattr(settings, 'EYERIS_LLM_SUMMARY_MAX_TOKENS', 512), "low")
+    if name == "qa":
+        return Profile(getattr(settings, 'EYERIS_LLM_QA_MAX_TOKENS', 1024), "medium")
+    raise ValueError(f"Profil LLM tidak dikenal: {name}")
+
+
+class LLMUnavailable(Exception):
+    """Semua slot LLM sedang terpakai, atau Groq tidak menjawab dalam EYERIS_LLM_TIMEOUT."""
+
+
+_slots = None
+
+
+def llm_slots() -> ratelimit.Slots:
+    """Batas panggilan LLM bersamaan per proses (EYERIS_LLM_MAX_CONCURRENCY)."""
+    global _slots
+    if _slots is None:
+        with _llm_lock:
+            if _slots is None:
+                _slots = ratelimit.Slots(getattr(settings, 'EYERIS_LLM_MAX_CONCURRENCY', 16))
+    return _slots
+
+
+def _is_timeout(exc) -> bool:
+    # groq.APITimeoutError / httpx.ReadTimeout, dicek lewat nama supaya SDK tidak perlu di-import di sini
+    return isinstance(exc, TimeoutError) or 'Timeout' in type(exc).__name__
+
+
+def _busy():
+    metrics.LLM_REJECTED.inc(reason='busy')
+    return LLMUnavailable("Layanan AI sedang sibuk, silakan coba lagi sebentar lagi.")
+
+
+def _timed_out(exc):
+    metrics.LLM_REJECTED.inc(reason='timeout')
+    return LLMUnavailable("Layanan AI tidak merespons, silakan coba lagi nanti.")
+
+
+@contextmanager
+def _llm_call(profile_name):
+    """Ambil slot LLM (tunggu paling lama EYERIS_LLM_QUEUE_TIMEOUT detik) lalu ukur stage `llm`."""
+    slots = llm_slots()
+    if not slots.acquire(timeout=getattr(settings, 'EYERIS_LLM_QUEUE_TIMEOUT', 2.0)):
+        raise _busy()
+    try:
+        with metrics.stage("llm"), metrics.timed(metrics.LLM_SECONDS, profile=profile_name):
+            yield
+    except Exception as e:
+        if _is_timeout(e):
+            raise _timed_out(e) from e
+        raise
+    finally:
+        slots.release()
+
+
+@asynccontextmanager
+async def _allm_call(profile_name):
+    """Versi async dari _llm_call: menunggu slot tanpa memblokir event loop."""
+    slots = llm_slots()
+    if not await slots.aacquire(timeout=getattr(settings, 'EYERIS_LLM_QUEUE_TIMEOUT', 2.0)):
+        raise _busy()
+    try:
+        with metrics.stage("llm"), metrics.timed(metrics.LLM_SECONDS, profile=profile_name):
+            yield
+    except Exception as e:
+        if _is_timeout(e):
+            raise _timed_out(e) from e
+        raise
+    finally:
+        slots.release()
+
+DEFAULT_SYSTEM_PROMPT = "Kamu adalah seorang yang paham tentang medis, khususnya tentang diagnostik penyakit mata."
+
+
+def _build_messages(variable: str, question: str, system_prompt: str = None):
     if system_prompt is None:
-        system_prompt = "Kamu adalah seorang yang paham tentang medis, khususnya tentang diagnostik penyakit mata."
+        system_prompt = DEFAULT_SYSTEM_PROMPT
 
-    # Susun messages sesuai pattern yang kamu pakai
-    messages = [
+    # data (`variable`) cukup dikirim sekali; pertanyaan tidak perlu mengulanginya
+    variable = (variable or "").strip()
+    human = f"Data:\n{variable}\n\nPertanyaan: {question}" if variable else question
+    return [
         ("system", system_prompt),
-        ("human", f"Saya punya variabel: `{variable}`. Pertanyaan: {question}. Jawab fokus pada `{variable}`.")
+        ("human", human),
     ]
 
+
+def ask_ai(variable: str, question: str, system_prompt: str = None, profile_name: str = "qa") -> Tuple[str, dict]:
+    """
+    Memanggil LLM dan mengembalikan (answer_text, raw_response).
+    - variable: data yang dibahas (dikirim sekali, di atas pertanyaan)
+    - question: pertanyaan user/trigger
+    - system_prompt: jika None pakai default
+    - profile_name: budget token panggilan ini (lihat profile())
+    """
+    messages = _build_messages(variable, question, system_prompt)
+
     # panggil LLM (synchronous)
-    resp = llm.invoke(messages)
+    with _llm_call(profile_name):
+        resp = get_llm().invoke(messages, **profile(profile_name)._asdict())
+    metrics.record_llm_usage(resp, mode="invoke", profile=profile_name)
 
+    # return jawaban dan raw resp supaya caller bisa log / simpan metadata
+    return _extract_answer(resp), resp
+
+
+async def aask_ai(variable: str, question: str, system_prompt: str = None, profile_name: str = "qa") -> Tuple[str, dict]:
+    """Versi async dari ask_ai (llm.ainvoke): tidak memakai thread selama menunggu Groq."""
+    messages = _build_messages(variable, question, system_prompt)
+    async with _allm_call(profile_name):
+        resp = await get_llm().ainvoke(messages, **profile(profile_name)._asdict())
+    metrics.record_llm_usage(resp, mode="ainvoke", profile=profile_name)
+    return _extract_answer(resp), resp
+
+
+def _extract_answer(resp) -> str:
     # extract content jika ada attribute content, fallback ke str(resp)
     answer = getattr(resp, "content", None)
     if answer is None:
@@ -42,37 +178,238 @@ def ask_ai(variable: str, question: str, system_prompt: str = None) -> Tuple[str
             answer = json.dumps(resp)
         except Exception:
             answer = str(resp)
+    return answer
 
-    # return jawaban dan raw resp supaya caller bisa log / simpan metadata
-    return answer, resp
+
+def ask_ai_stream(variable: str, question: str, system_prompt: str = None, profile_name: str = "qa") -> Iterator[str]:
+    """
+    Versi streaming dari ask_ai: yield potongan teks jawaban segera setelah
+    diterima dari LLM, jadi caller bisa menampilkan token pertama tanpa
+    menunggu seluruh jawaban selesai.
+    """
+    messages = _build_messages(variable, question, system_prompt)
+    metrics.LLM_REQUESTS.inc(mode="stream", profile=profile_name)
+    with _llm_call(profile_name):
+        for chunk in get_llm().stream(messages, **profile(profile_name)._asdict()):
+            metrics.record_llm_usage(chunk, profile=profile_name)
+            text = getattr(chunk, "content", None)
+            if text:
+                yield text
+
+
+async def aask_ai_stream(variable: str, question: str, system_prompt: str = None, profile_name: str = "qa") -> AsyncIterator[str]:
+    """Versi async dari ask_ai_stream (llm.astream)."""
+    messages = _build_messages(variable, question, system_prompt)
+    metrics.LLM_REQUESTS.inc(mode="astream", profile=profile_name)
+    async with _allm_call(profile_name):
+        async for chunk in get_llm().astream(messages, **profile(profile_name)._asdict()):
+            metrics.record_llm_usage(chunk, profile=profile_name)
+            text = getattr(chunk, "content", None)
+            if text:
+                yield text
+
+
+class SingleFlight:
+    """
+    Gabungkan panggilan bersamaan dengan key yang sama jadi satu panggilan:
+    pemanggil pertama menjalankan fungsi, sisanya menunggu hasil yang sama.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, fn):
+        """Kembalikan (hasil, shared) — shared=True kalau ikut menunggu panggilan lain."""
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = self._calls[key] = Future()
+        if not leader:
+            return future.result(), True
+        try:
+            result = fn()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result, False
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+
+
+class AsyncSingleFlight:
+    """SingleFlight untuk coroutine. Panggilan hanya digabung di event loop yang sama."""
+
+    def __init__(self):
+        self._loops = weakref.WeakKeyDictionary()
+
+    async def do(self, key, coro_fn):
+        calls = self._loops.setdefault(asyncio.get_running_loop(), {})
+        task = calls.get(key)
+        if task is not None:
+            # shield: pembatalan satu penunggu tidak membatalkan panggilan bersama
+            return await asyncio.shield(task), True
+        task = calls[key] = asyncio.ensure_future(coro_fn())
+        try:
+            return await asyncio.shield(task), False
+        finally:
+            if task.done():
+                calls.pop(key, None)
+            else:
+                task.add_done_callback(lambda _: calls.pop(key, None))
+
+
+_analysis_flight = SingleFlight()
+_async_analysis_flight = AsyncSingleFlight()
+analysis_cache_stats = {"hits": 0, "misses": 0, "coalesced": 0}
+_stats_lock = threading.Lock()
+
+
+def _count(name):
+    with _stats_lock:
+        analysis_cache_stats[name] += 1
+
+
+def _normalize_prediction(prediction) -> str:
+    lines = [" ".join(line.split()) for line in str(prediction or "").strip().splitlines()]
+    return "\n".join(line for line in lines if line)
+
+
+ANALYSIS_SYSTEM_PROMPT = (
+    "Kamu adalah asisten medis ahli dalam diagnostik mata. "
+    "Berdasarkan hasil deteksi penyakit mata dari model AI, "
+    "berikan penjelasan singkat tentang kondisi mata pasien, rekomendasi, dan saran tindak lanjut. "
+    "Jawab dalam bahasa Indonesia, singkat dan jelas."
+    "Jangan halu dan katakan jika informasi tidak cukup."
+    "Jika hasilnya other disease, jelaskan bahwa hasilnya tidak spesifik dan sarankan pemeriksaan lebih lanjut."
+    "Jangan gunakan format markdown dalam jawaban."
+    "Gunakan format yang simpel dalam jawaban."
+)
+
+
+def _analysis_prompt(patient_age, patient_gender, prediction):
+    """Susun (variable, question, cache_key) dari input yang sudah dinormalisasi."""
+    prediction = _normalize_prediction(prediction)
+    gender = (patient_gender or "").strip().upper() or "-"
+    # hasil deteksi hanya ada di `variable`; pertanyaan cukup merujuknya
+    question = (
+        f"Pasien: Umur={age_band(patient_age)} tahun, Gender={gender}. "
+        f"Berikan analisis dan rekomendasi medis untuk hasil deteksi model di atas."
+    )
+    prompt = json.dumps(
+        [ANALYSIS_SYSTEM_PROMPT, prediction, question, LLM_MODEL, profile("summary")], ensure_ascii=False
+    )
+    key = "analysis:" + hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+    return prediction, question, key
 
 
 def analyze_eye_prediction(patient_name: str, patient_age: int, patient_gender: str, prediction: str) -> str:
     """
     Analisis hasil prediksi penyakit mata menggunakan AI.
-    - patient_name: nama pasien
-    - patient_age: umur pasien
+    - patient_name: nama pasien (tidak dikirim ke LLM dan tidak masuk key cache)
+    - patient_age: umur pasien (dikirim sebagai kelompok umur)
     - patient_gender: jenis kelamin pasien
     - prediction: hasil prediksi dari model (format: "Mata Kiri: ...\nMata Kanan: ...")
-    
+
+    Jawaban di-cache (lihat CACHES['llm']) dengan key dari prompt yang sudah
+    dinormalisasi, dan panggilan bersamaan dengan prompt sama digabung jadi satu.
+
     Returns: string analisis dari AI
     """
-    system_prompt = (
-        "Kamu adalah asisten medis ahli dalam diagnostik mata. "
-        "Berdasarkan hasil deteksi penyakit mata dari model AI, "
-        "berikan penjelasan singkat tentang kondisi mata pasien, rekomendasi, dan saran tindak lanjut. "
-        "Jawab dalam bahasa Indonesia, singkat dan jelas."
-        "Jangan halu dan katakan jika informasi tidak cukup."
-        "Jika hasilnya other disease, jelaskan bahwa hasilnya tidak spesifik dan sarankan pemeriksaan lebih lanjut."
-        "Jangan gunakan format markdown dalam jawaban."
-        "Gunakan format yang simpel dalam jawaban."
-    )
-    
-    question = (
-        f"Pasien dengan data: Nama={patient_name}, Umur={patient_age}, Gender={patient_gender}. "
-        f"Hasil deteksi dari model:\n{prediction}\n"
-        f"Berikan analisis dan rekomendasi medis untuk hasil deteksi ini."
-    )
-    
-    answer, _ = ask_ai(variable=prediction, question=question, system_prompt=system_prompt)
+    variable, question, key = _analysis_prompt(patient_age, patient_gender, prediction)
+    cache = caches["llm"]
+
+    answer = cache.get(key)
+    if answer is not None:
+        _count("hits")
+        return answer
+
+    def call():
+        # cek ulang: bisa saja sudah diisi oleh flight sebelumnya yang baru selesai
+        cached = cache.get(key)
+        if cached is not None:
+            return cached
+        result, _ = ask_ai(
+            variable=variable, question=question, system_prompt=ANALYSIS_SYSTEM_PROMPT, profile_name="summary",
+        )
+        cache.set(key, result)
+        return result
+
+    answer, shared = _analysis_flight.do(key, call)
+    _count("coalesced" if shared else "misses")
     return answer
+
+
+async def aanalyze_eye_prediction(patient_name: str, patient_age: int, patient_gender: str, prediction: str) -> str:
+    """Versi async dari analyze_eye_prediction (cache + single-flight yang sama, lewat llm.ainvoke)."""
+    variable, question, key = _analysis_prompt(patient_age, patient_gender, prediction)
+    cache = caches["llm"]
+
+    answer = await cache.aget(key)
+    if answer is not None:
+        _count("hits")
+        return answer
+
+    async def call():
+        cached = await cache.aget(key)
+        if cached is not None:
+            return cached
+        result, _ = await aask_ai(
+            variable=variable, question=question, system_prompt=ANALYSIS_SYSTEM_PROMPT, profile_name="summary",
+        )
+        await cache.aset(key, result)
+        return result
+
+    answer, shared = await _async_analysis_flight.do(key, call)
+    _count("coalesced" if shared else "misses")
+    return answer
+
+
+def analyze_eye_prediction_stream(patient_name: str, patient_age: int, patient_gender: str, prediction: str) -> Iterator[str]:
+    """
+    Sama seperti analyze_eye_prediction tapi yield potongan teks. Kalau jawaban
+    sudah ada di cache, langsung di-yield sekaligus; kalau tidak, hasil stream
+    disimpan ke cache setelah selesai.
+    """
+    variable, question, key = _analysis_prompt(patient_age, patient_gender, prediction)
+    cache = caches["llm"]
+
+    answer = cache.get(key)
+    if answer is not None:
+        _count("hits")
+        yield answer
+        return
+
+    _count("misses")
+    parts = []
+    for text in ask_ai_stream(
+        variable=variable, question=question, system_prompt=ANALYSIS_SYSTEM_PROMPT, profile_name="summary",
+    ):
+        parts.append(text)
+        yield text
+    cache.set(key, "".join(parts))
+
+
+async def aanalyze_eye_prediction_stream(patient_name: str, patient_age: int, patient_gender: str, prediction: str) -> AsyncIterator[str]:
+    """Versi async dari analyze_eye_prediction_stream (llm.astream)."""
+    variable, question, key = _analysis_prompt(patient_age, patient_gender, prediction)
+    cache = caches["llm"]
+
+    answer = await cache.aget(key)
+    if answer is not None:
+        _count("hits")
+        yield answer
+        return
+
+    _count("misses")
+    parts = []
+    async for text in aask_ai_stream(
+        variable=variable, question=question, system_prompt=ANALYSIS_SYSTEM_PROMPT, profile_name="summary",
+    ):
+        parts.append(text)
+        yield text
+    await cache.aset(key, "".join(parts))
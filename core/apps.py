@@ -1,6 +1,32 @@
+import os
+import sys
+
 from django.apps import AppConfig
+from django.conf import settings
+
+# perintah manage.py yang memang melayani inference; perintah lain (migrate,
+# collectstatic, ...) tidak perlu ikut me-load TensorFlow saat startup
+_SERVING_COMMANDS = {'runserver', 'screening_worker'}
+
+
+def _is_admin_command():
+    return os.path.basename(sys.argv[0]) == 'manage.py' and len(sys.argv) > 1 and sys.argv[1] not in _SERVING_COMMANDS
 
 
 class CoreConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'core'
+
+    def ready(self):
+        from django.db.backends.signals import connection_created
+
+        from . import query_budget
+
+        # hitung query per request (budget view, lihat query_budget.py)
+        connection_created.connect(query_budget.install, dispatch_uid='eyeris_query_budget')
+
+        # warm-up model di awal worker (opsional, lihat EYERIS_MODEL_WARMUP)
+        if getattr(settings, 'EYERIS_MODEL_WARMUP', False) and not _is_admin_command():
+            from . import model_registry
+
+            model_registry.preload()
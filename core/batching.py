@@ -0,0 +1,258 @@
+# core/batching.py
+"""
+Micro-batching untuk inference.
+
+Request screening yang datang bersamaan tidak lagi memanggil `predict` sendiri-sendiri
+(batch 2 gambar), tapi dimasukkan ke antrian. Satu thread worker menggabungkan
+beberapa pasangan mata menjadi satu `predict` yang lebih besar, lalu membagikan
+kembali baris hasil ke masing-masing pemanggil.
+
+Batch di-flush kalau jumlah baris sudah mencapai `max_batch_size` atau
+`max_wait_ms` sudah lewat sejak item pertama masuk.
+"""
+import asyncio
+import logging
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import numpy as np
+from django.conf import settings
+
+from . import metrics, model_registry
+
+logger = logging.getLogger(__name__)
+
+
+class _Item:
+    __slots__ = ("images", "future", "enqueued_at")
+
+    def __init__(self, images):
+        self.images = images
+        self.future = Future()
+        self.enqueued_at = time.perf_counter()
+
+
+class InferenceBatcher:
+    """Antrian inference dengan flush berdasarkan ukuran batch atau deadline."""
+
+    # interval cek apakah thread batcher masih hidup selama menunggu hasil
+    WATCHDOG_INTERVAL = 1.0
+
+    def __init__(self, max_batch_size=32, max_wait_ms=5.0, model_getter=None, history=256, timeout=30.0):
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+        self.timeout = float(timeout)
+        self.model_getter = model_getter or model_registry.get_model
+        self._queue = queue.Queue()
+        self._carry = None
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._history = deque(maxlen=history)
+        self._batches = 0
+        self._rows = 0
+        self._requests = 0
+
+    def start(self):
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="inference-batcher", daemon=True)
+                self._thread.start()
+
+    def submit(self, images) -> Future:
+        """
+        Masukkan array (n, 224, 224, 3) ke antrian; hasilnya (n, num_classes) lewat Future.
+
+        Array disalin: pemanggil boleh memakai ulang buffernya, dan setelah timeout
+        buffer itu bisa sudah ditimpa request berikutnya sebelum batch ini sempat
+        diproses.
+        """
+        images = np.array(images, copy=True)
+        if images.ndim != 4:
+            raise ValueError(f"images harus 4 dimensi, dapat shape {images.shape}")
+        self.start()
+        item = _Item(images)
+        self._queue.put(item)
+        return item.future
+
+    def _check_alive(self):
+        """Thread batcher mati (bug di luar predict): jalankan ulang supaya antrian tetap diproses."""
+        if self._thread is not None and not self._thread.is_alive():
+            logger.error("Thread inference-batcher mati, dijalankan ulang")
+            self.start()
+
+    def predict(self, images, timeout=None):
+        """Tunggu hasil paling lama `timeout` detik (default self.timeout), lalu TimeoutError."""
+        future = self.submit(images)
+        deadline = time.monotonic() + (self.timeout if timeout is None else timeout)
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise TimeoutError("Inference tidak selesai dalam batas waktu")
+            try:
+                return future.result(timeout=min(remaining, self.WATCHDOG_INTERVAL))
+            except TimeoutError:
+                self._check_alive()
+
+    async def apredict(self, images, timeout=None):
+        """Versi async dari predict (menunggu tanpa memblokir event loop)."""
+        future = asyncio.wrap_future(self.submit(images))
+        deadline = time.monotonic() + (self.timeout if timeout is None else timeout)
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise TimeoutError("Inference tidak selesai dalam batas waktu")
+            try:
+                return await asyncio.wait_for(asyncio.shield(future), min(remaining, self.WATCHDOG_INTERVAL))
+            except TimeoutError:
+                self._check_alive()
+
+    # ---- worker ----
+
+    def _next_item(self, timeout=None):
+        if self._carry is not None:
+            item, self._carry = self._carry, None
+            return item
+        return self._queue.get(timeout=timeout)
+
+    def _collect(self):
+        first = self._next_item()
+        batch = [first]
+        rows = len(first.images)
+        deadline = first.enqueued_at + self.max_wait
+        while rows < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                item = self._next_item(timeout=remaining)
+            except queue.Empty:
+                break
+            if rows + len(item.images) > self.max_batch_size:
+                # simpan untuk batch berikutnya supaya batch tidak melebihi batas
+                self._carry = item
+                break
+            batch.append(item)
+            rows += len(item.images)
+        return batch, rows
+
+    def _run(self):
+        while True:
+            batch, rows = self._collect()
+            flushed_at = time.perf_counter()
+            try:
+                stacked = batch[0].images if len(batch) == 1 else np.concatenate([it.images for it in batch], axis=0)
+                model = self.model_getter()
+                with metrics.stage("predict"):
+                    outputs = np.asarray(model.predict(stacked))
+            except Exception as exc:
+                for it in batch:
+                    it.future.set_exception(exc)
+                continue
+            predict_ms = (time.perf_counter() - flushed_at) * 1000
+
+            offset = 0
+            for it in batch:
+                n = len(it.images)
+                it.future.set_result(outputs[offset:offset + n])
+                offset += n
+
+            wait_ms = max((flushed_at - it.enqueued_at) * 1000 for it in batch)
+            self._record(len(batch), rows, wait_ms, predict_ms)
+
+    def _record(self, requests, rows, wait_ms, predict_ms):
+        entry = {
+            "requests": requests,
+            "rows": rows,
+            "max_wait_ms": round(wait_ms, 3),
+            "predict_ms": round(predict_ms, 3),
+            "at": time.time(),
+        }
+        with self._stats_lock:
+            self._batches += 1
+            self._rows += rows
+            self._requests += requests
+            self._history.append(entry)
+        logger.debug("Inference batch: %s", entry)
+
+    def metrics(self) -> dict:
+        with self._stats_lock:
+            history = list(self._history)
+            batches, rows, requests = self._batches, self._rows, self._requests
+        recent = history[-50:]
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000,
+            "queue_depth": self._queue.qsize(),
+            "batches": batches,
+            "rows": rows,
+            "requests": requests,
+            "avg_rows_per_batch": rows / batches if batches else 0.0,
+            "avg_predict_ms": sum(b["predict_ms"] for b in recent) / len(recent) if recent else 0.0,
+            "recent": recent,
+        }
+
+
+_batcher = None
+_batcher_lock = threading.Lock()
+
+
+def get_batcher() -> InferenceBatcher:
+    global _batcher
+    if _batcher is None:
+        with _batcher_lock:
+            if _batcher is None:
+                _batcher = InferenceBatcher(
+                    max_batch_size=getattr(settings, 'EYERIS_BATCH_MAX_SIZE', 32),
+                    max_wait_ms=getattr(settings, 'EYERIS_BATCH_MAX_WAIT_MS', 5.0),
+                    timeout=getattr(settings, 'EYERIS_BATCH_TIMEOUT', 30.0),
+                )
+    return _batcher
+
+
+def _local_batching() -> bool:
+    return getattr(settings, 'EYERIS_BATCHING', True) and not model_registry.is_remote()
+
+
+def predict(images):
+    """
+    Entry point inference untuk view. Kalau batching dimatikan
+    (EYERIS_BATCHING=0) langsung memanggil model di thread pemanggil; kalau
+    memakai daemon inference, batching dilakukan di daemon.
+    """
+    if not _local_batching():
+        model = model_registry.get_model()
+        with metrics.stage("predict"):
+            return model.predict(images)
+    return get_batcher().predict(images)
+
+
+_offload = None
+_offload_lock = threading.Lock()
+
+
+def offload_executor() -> ThreadPoolExecutor:
+    """
+    Executor terbatas (EYERIS_INFERENCE_THREADS) untuk kerja CPU dari view async,
+    supaya decode/predict tidak memblokir event loop dan tidak memakai thread tanpa batas.
+    """
+    global _offload
+    if _offload is None:
+        with _offload_lock:
+            if _offload is None:
+                _offload = ThreadPoolExecutor(
+                    max_workers=getattr(settings, 'EYERIS_INFERENCE_THREADS', 4),
+                    thread_name_prefix='inference-offload',
+                )
+    return _offload
+
+
+async def apredict(images):
+    """Versi async dari predict: menunggu hasil batch tanpa memblokir event loop."""
+    if not _local_batching():
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(offload_executor(), predict, images)
+    return await get_batcher().apredict(images)
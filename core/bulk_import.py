@@ -0,0 +1,285 @@
+# core/bulk_import.py
+"""
+Import massal data screening (folder atau ZIP) berisi pasangan
+`<id>_left.jpg` / `<id>_right.jpg`, penamaan yang sama dengan media/patients/.
+
+Alur per chunk:
+  1. process pool: baca dan decode pasangan gambar ke 224x224 (batas piksel sama dengan upload),
+     lalu hitung hash dan simpan ke storage berbasis hash; pasangan yang rusak dilewati
+  2. proses utama: satu `predict` besar untuk semua pasangan yang belum ada di prediction cache
+  3. Patient + EyePrediction ditulis dengan bulk_create, progres ImportBatch diperbarui
+
+Import bisa dilanjutkan setelah terputus: ID yang sudah punya Patient di batch
+yang sama dilewati.
+"""
+import csv
+import hashlib
+import io
+import logging
+import multiprocessing
+import os
+import re
+import time
+import zipfile
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from django.conf import settings
+from django.core.files.base import ContentFile
+from PIL import Image
+
+from . import model_registry, prediction_cache, preprocessing, screening, uploads
+from .models import ImportBatch, Patient
+from .storage import patient_image_storage
+
+logger = logging.getLogger(__name__)
+
+# 1003_left.jpg, juga 1003_left_0oFG3ID.jpg (suffix dari upload ulang Django)
+PAIR_RE = re.compile(r'^(?P<id>.+?)_(?P<side>left|right)(?:_[A-Za-z0-9]{7})?\.(?:jpe?g|png)$', re.IGNORECASE)
+METADATA_NAME = 'metadata.csv'
+UPLOAD_PREFIX = 'patients/'
+
+
+class DirSource:
+    def __init__(self, path):
+        self.path = path
+
+    def names(self):
+        for root, _, files in os.walk(self.path):
+            for f in files:
+                yield os.path.relpath(os.path.join(root, f), self.path).replace('\\', '/')
+
+    def read(self, name):
+        with open(os.path.join(self.path, name), 'rb') as f:
+            return f.read()
+
+
+class ZipSource:
+    def __init__(self, path):
+        self.path = path
+        self._zip = zipfile.ZipFile(path)
+
+    def names(self):
+        return (i.filename for i in self._zip.infolist() if not i.is_dir())
+
+    def read(self, name):
+        return self._zip.read(name)
+
+
+def open_source(path):
+    if os.path.isdir(path):
+        return DirSource(path)
+    if zipfile.is_zipfile(path):
+        return ZipSource(path)
+    raise ValueError(f"{path} bukan folder atau file ZIP")
+
+
+def find_pairs(names):
+    """Kelompokkan nama file per ID; kembalikan (OrderedDict id -> (kiri, kanan), daftar file tanpa pasangan)."""
+    sides = {}
+    for name in sorted(names):
+        m = PAIR_RE.match(os.path.basename(name))
+        if not m:
+            continue
+        # nama kanonik (tanpa suffix) terurut lebih dulu, duplikat berikutnya diabaikan
+        sides.setdefault(m.group('id'), {}).setdefault(m.group('side').lower(), name)
+    pairs = OrderedDict()
+    unpaired = []
+    for pid, found in sides.items():
+        if 'left' in found and 'right' in found:
+            pairs[pid] = (found['left'], found['right'])
+        else:
+            unpaired.extend(found.values())
+    return pairs, unpaired
+
+
+def read_metadata(source):
+    """metadata.csv opsional dengan kolom id,name,age,gender."""
+    try:
+        raw = source.read(METADATA_NAME)
+    except (KeyError, FileNotFoundError):
+        return {}
+    rows = csv.DictReader(io.StringIO(raw.decode('utf-8-sig')))
+    return {row['id'].strip(): row for row in rows if row.get('id')}
+
+
+# ---- dijalankan di process pool ----
+
+_worker_sources = {}
+
+
+def _decode(blob):
+    """Decode ke 224x224x3; gambar di atas EYERIS_UPLOAD_MAX_PIXELS ditolak sebelum decode, sama seperti upload."""
+    with Image.open(io.BytesIO(blob)) as im:
+        width, height = im.size
+    if width * height > uploads.max_pixels():
+        raise ValueError(f"resolusi gambar terlalu besar ({width}x{height} piksel)")
+    return preprocessing.decode_into(io.BytesIO(blob), preprocessing.alloc_batch(1)[0])
+
+
+def _process_pair(source_path, left, right):
+    """
+    Decode lalu simpan sepasang gambar ke storage; kembalikan ((nama storage, sha256, array), ...)
+    untuk kiri dan kanan, atau None kalau salah satunya rusak/tidak bisa di-decode (pasangan dilewati,
+    tidak ada file yang tersimpan).
+    """
+    source = _worker_sources.get(source_path)
+    if source is None:
+        source = _worker_sources[source_path] = open_source(source_path)
+    try:
+        blobs = [source.read(name) for name in (left, right)]
+        arrays = [_decode(blob) for blob in blobs]
+    except Exception as e:
+        logger.warning("Pasangan %s / %s dilewati: %s", left, right, e)
+        return None
+    processed = []
+    for name, blob, arr in zip((left, right), blobs, arrays):
+        digest = hashlib.sha256(blob).hexdigest()
+        content = ContentFile(blob, name=os.path.basename(name))
+        content.content_hash = digest
+        stored = patient_image_storage.save(UPLOAD_PREFIX + os.path.basename(name), content)
+        processed.append((stored, digest, arr))
+    return tuple(processed)
+
+
+def _init_worker():
+    # spawn: proses baru perlu Django sendiri (tanpa koneksi DB atau TensorFlow warisan induk)
+    import django
+
+    django.setup()
+
+
+# ---- proses utama ----
+
+def _predict_chunk(items):
+    """
+    items: list (pid, kiri, kanan) hasil _process_pair. Kembalikan
+    (dict pid -> probabilitas (2, n), dict pid -> ms predict per pasangan, versi model).
+    """
+    cache = prediction_cache.get_cache() if prediction_cache.enabled() else None
+    version = model_registry.model_version()
+    results = {}
+    todo = []
+    for pid, left, right in items:
+        cached = cache.get(left[1], right[1], version) if cache else None
+        if cached is not None:
+            results[pid] = cached
+        else:
+            todo.append((pid, left, right))
+    latency_ms = None
+    if todo:
+        stacked = preprocessing.alloc_batch(len(todo) * 2)
+        for i, (_, left, right) in enumerate(todo):
+            stacked[2 * i] = left[2]
+            stacked[2 * i + 1] = right[2]
+        started = time.perf_counter()
+        probs = np.asarray(model_registry.get_model().predict(stacked))
+        # latency per pasangan = waktu predict chunk dibagi jumlah pasangan
+        latency_ms = round((time.perf_counter() - started) * 1000 / len(todo), 2)
+        for i, (pid, left, right) in enumerate(todo):
+            results[pid] = probs[2 * i:2 * i + 2]
+            if cache:
+                cache.set(left[1], right[1], results[pid], version)
+    return results, {pid: latency_ms for pid, _, _ in todo}, version
+
+
+def _patient_fields(pid, meta):
+    row = meta.get(pid, {})
+    gender = (row.get('gender') or 'O').strip().upper()[:1]
+    try:
+        age = max(int(row.get('age') or 0), 0)
+    except ValueError:
+        age = 0
+    return {
+        'name': (row.get('name') or pid).strip()[:255],
+        'age': age,
+        'gender': gender if gender in dict(Patient.GENDER_CHOICES) else 'O',
+    }
+
+
+def _save_chunk(batch, items, meta):
+    """Predict pasangan yang lolos decode lalu tulis Patient + EyePrediction-nya."""
+    probs, latency, version = _predict_chunk(items)
+    Patient.objects.bulk_create([
+        Patient(
+            image1=left[0],
+            image2=right[0],
+            image1_hash=left[1],
+            image2_hash=right[1],
+            prediction=screening.format_prediction(probs[pid]),
+            import_batch=batch,
+            external_id=pid,
+            owner=batch.uploaded_by,
+            **_patient_fields(pid, meta),
+        )
+        for pid, left, right in items
+    ], ignore_conflicts=True)
+    # ignore_conflicts tidak mengisi pk; ambil ulang pasien chunk ini untuk EyePrediction
+    saved = Patient.objects.filter(
+        import_batch=batch, external_id__in=[pid for pid, _, _ in items]
+    ).only('id', 'external_id', 'created_at', 'age', 'gender')
+    screening.save_predictions([
+        row for patient in saved
+        for row in screening.prediction_rows(
+            patient, probs[patient.external_id], version, latency.get(patient.external_id)
+        )
+    ])
+
+
+def run_import(batch, chunk_size=64, workers=None, progress=None):
+    """
+    Jalankan (atau lanjutkan) satu ImportBatch. `progress(batch, elapsed_s, images)`
+    dipanggil setiap chunk selesai.
+    """
+    source = open_source(batch.source_path)
+    pairs, unpaired = find_pairs(source.names())
+    meta = read_metadata(source)
+    done_ids = set(Patient.objects.filter(import_batch=batch).values_list('external_id', flat=True))
+    pending = [(pid, lr) for pid, lr in pairs.items() if pid not in done_ids]
+
+    batch.status = ImportBatch.STATUS_RUNNING
+    batch.total_pairs = len(pairs)
+    batch.imported = len(done_ids)
+    batch.skipped = len(unpaired)
+    batch.error = None
+    batch.save()
+
+    workers = workers or getattr(settings, 'EYERIS_IMPORT_WORKERS', None) or os.cpu_count()
+    started = time.perf_counter()
+    images = 0
+    try:
+        # spawn, bukan fork: fork setelah TensorFlow ter-load (mis. batch kedua di --pending) bisa hang
+        ctx = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=workers, mp_context=ctx, initializer=_init_worker) as pool:
+            for offset in range(0, len(pending), chunk_size):
+                chunk = pending[offset:offset + chunk_size]
+                processed = list(pool.map(
+                    _process_pair, [batch.source_path] * len(chunk),
+                    [lr[0] for _, lr in chunk], [lr[1] for _, lr in chunk], chunksize=2,
+                ))
+
+                # pasangan dengan gambar rusak dilewati (tidak menggagalkan batch; --resume mencobanya lagi)
+                items = [(pid, pair[0], pair[1]) for (pid, _), pair in zip(chunk, processed) if pair is not None]
+                skipped = len(chunk) - len(items)
+                if items:
+                    _save_chunk(batch, items, meta)
+
+                images += 2 * len(chunk)
+                elapsed = time.perf_counter() - started
+                batch.imported += len(items)
+                batch.skipped += 2 * skipped
+                batch.images_per_second = round(images / elapsed, 2) if elapsed else None
+                batch.save(update_fields=['imported', 'skipped', 'images_per_second', 'updated_at'])
+                if progress:
+                    progress(batch, elapsed, images)
+    except Exception as e:
+        logger.exception("Import #%s gagal", batch.pk)
+        batch.status = ImportBatch.STATUS_FAILED
+        batch.error = str(e)
+        batch.save(update_fields=['status', 'error', 'updated_at'])
+        raise
+
+    batch.status = ImportBatch.STATUS_DONE
+    batch.save(update_fields=['status', 'updated_at'])
+    return batch
@@ -1,10 +1,22 @@
 from django import forms
 from django.contrib.auth.models import User
 from django.contrib.auth.forms import UserCreationForm
+from django.conf import settings
 from django.core.exceptions import ValidationError
+from . import quality, uploads
 from .models import Patient
 
 class PatientForm(forms.ModelForm):
+    # bukan field Patient: disimpan di ScreeningJob.tta_threshold (lihat tta.job_options)
+    tta_threshold = forms.FloatField(
+        label='Ambang TTA',
+        required=False,
+        min_value=0.0,
+        max_value=1.0,
+        help_text='Opsional. Mata dengan confidence di bawah ambang ini diprediksi ulang dengan TTA (0 = tanpa TTA).',
+        widget=forms.NumberInput(attrs={'placeholder': 'Default', 'class': 'form-input', 'step': '0.05'}),
+    )
+
     class Meta:
         model = Patient
         fields = ['name', 'age', 'gender', 'image1', 'image2']
@@ -14,12 +26,37 @@ class PatientForm(forms.ModelForm):
             'gender': forms.Select(attrs={'class': 'form-input'}),
         }
 
+    def __init__(self, *args, upload_errors=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        # upload yang sudah ditolak FundusUploadHandler saat streaming (ukuran/resolusi)
+        self.upload_errors = upload_errors or {}
+
     def clean(self):
         cleaned = super().clean()
+        for field, message in self.upload_errors.items():
+            eye = 'Mata kiri' if field == 'image1' else 'Mata kanan'
+            self.add_error(field, f'{eye}: {message}')
+        if self.upload_errors:
+            return cleaned
         img1 = cleaned.get('image1')
         img2 = cleaned.get('image2')
         if not img1 or not img2:
             raise ValidationError('Dua gambar harus diupload.')
+        decoded = {}
+        for field, eye in (('image1', 'Mata kiri'), ('image2', 'Mata kanan')):
+            try:
+                # satu decode per gambar, dipakai gerbang kualitas dan inference
+                decoded[field] = uploads.decode(cleaned[field])
+                if getattr(settings, 'EYERIS_QUALITY_GATE', True):
+                    # tolak foto yang tidak layak sebelum inference + analisis AI
+                    quality.check(decoded[field])
+            except quality.QualityError as e:
+                self.add_error(field, f'{eye}: {e}')
+        if not self.errors:
+            # screening async dikerjakan screening_worker di proses lain: simpan juga ke EYERIS_DECODED_DIR
+            shared = getattr(settings, 'EYERIS_SCREENING_ASYNC', True)
+            for field, image in decoded.items():
+                uploads.handoff(cleaned[field], image, shared=shared)
         return cleaned
 
 
@@ -0,0 +1,304 @@
+# core/inference_daemon.py
+"""
+Daemon inference per node: satu proses memegang model (beserta runtime
+TensorFlow/ONNX) untuk semua worker web di node itu.
+
+    python manage.py inference_daemon                       # satu per node
+    EYERIS_INFERENCE_SOCKET=/run/eyeris/inference.sock      # di worker web
+
+Worker web tidak me-load model; batch hasil preprocessing dikirim lewat Unix
+socket. Tensor gambar tidak diserialisasi: worker menulisnya ke segmen shared
+memory miliknya (satu per thread, dipakai ulang) dan hanya nama segmen + shape
+yang dikirim. Di daemon, request dari semua worker masuk ke satu
+InferenceBatcher sehingga ikut di-batch bersama.
+
+Format pesan: panjang header (4 byte, big-endian) + header JSON, diikuti
+payload mentah sepanjang header["nbytes"] kalau ada (probabilitas hasil predict).
+"""
+import json
+import logging
+import os
+import socket
+import socketserver
+import struct
+import threading
+import time
+import weakref
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+from django.conf import settings
+
+from . import batching, model_registry
+
+logger = logging.getLogger(__name__)
+
+_LENGTH = struct.Struct('>I')
+
+# ukuran awal segmen: satu pasangan mata 224x224x3 uint8
+_MIN_SEGMENT = 2 * 224 * 224 * 3
+
+
+class InferenceUnavailable(ConnectionError):
+    """Daemon inference tidak bisa dihubungi atau koneksinya terputus."""
+
+
+def _recv_exact(sock, n):
+    buf = bytearray(n)
+    view = memoryview(buf)
+    got = 0
+    while got < n:
+        read = sock.recv_into(view[got:], n - got)
+        if not read:
+            raise InferenceUnavailable("Koneksi ke daemon inference terputus")
+        got += read
+    return buf
+
+
+def send_message(sock, header, payload=b''):
+    if payload:
+        header = {**header, 'nbytes': len(payload)}
+    data = json.dumps(header).encode()
+    sock.sendall(_LENGTH.pack(len(data)) + data)
+    if payload:
+        sock.sendall(payload)
+
+
+def recv_message(sock):
+    (length,) = _LENGTH.unpack(_recv_exact(sock, _LENGTH.size))
+    header = json.loads(_recv_exact(sock, length))
+    payload = _recv_exact(sock, header['nbytes']) if header.get('nbytes') else None
+    return header, payload
+
+
+# ---- daemon ----
+
+def _attach(name):
+    segment = shared_memory.SharedMemory(name=name)
+    # segmen milik worker web: jangan sampai resource tracker daemon meng-unlink-nya saat exit
+    resource_tracker.unregister(segment._name, 'shared_memory')
+    return segment
+
+
+class _Handler(socketserver.BaseRequestHandler):
+    """Satu koneksi = satu thread worker web; request-nya diproses berurutan."""
+
+    def setup(self):
+        self.segment = None
+
+    def handle(self):
+        while True:
+            try:
+                header, _ = recv_message(self.request)
+            except (InferenceUnavailable, ConnectionResetError):
+                return
+            payload = b''
+            try:
+                if header.get('op') == 'predict':
+                    reply, payload = self._predict(header)
+                elif header.get('op') == 'info':
+                    reply = self.server.info()
+                else:
+                    reply = {'error': f"op tidak dikenal: {header.get('op')!r}"}
+            except Exception as e:
+                logger.exception("Request daemon inference gagal")
+                reply = {'error': repr(e)}
+            send_message(self.request, reply, payload)
+
+    def _predict(self, header):
+        name = header['shm']
+        if self.segment is None or self.segment.name != name:
+            self._detach()
+            self.segment = _attach(name)
+        shape = tuple(header['shape'])
+        # salin keluar dari segmen: worker boleh langsung memakai ulang segmennya
+        # setelah balasan, dan view ke shared memory tidak tertahan di antrian batcher
+        images = np.ndarray(shape, dtype=np.dtype(header['dtype']), buffer=self.segment.buf).copy()
+        probs = np.ascontiguousarray(self.server.batcher.predict(images), dtype=np.float32)
+        reply = {'shape': probs.shape, 'dtype': 'float32', 'version': model_registry.model_version()}
+        return reply, probs.tobytes()
+
+    def _detach(self):
+        if self.segment is not None:
+            self.segment.close()
+            self.segment = None
+
+    def finish(self):
+        self._detach()
+
+
+class InferenceServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, path, batcher):
+        self.batcher = batcher
+        if os.path.exists(path):
+            _remove_stale_socket(path)
+        super().__init__(path, _Handler)
+        # hanya user/grup yang sama (worker web) yang boleh connect
+        os.chmod(path, 0o660)
+
+    def info(self):
+        loaded = model_registry.current()
+        return {
+            'pid': os.getpid(),
+            'model': loaded.info() if loaded is not None else None,
+            'batching': self.batcher.metrics(),
+        }
+
+    def server_close(self):
+        super().server_close()
+        try:
+            os.unlink(self.server_address)
+        except OSError:
+            pass
+
+
+def _remove_stale_socket(path):
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(path)
+    except OSError:
+        # sisa daemon yang mati tanpa sempat membersihkan socket
+        os.unlink(path)
+    else:
+        raise RuntimeError(f"Daemon inference lain sudah jalan di {path}")
+    finally:
+        probe.close()
+
+
+def serve(path, max_batch_size=None, max_wait_ms=None) -> InferenceServer:
+    """Load + warm-up model di proses ini lalu buka socket; panggil `serve_forever()` pada hasilnya."""
+    model_registry.use_local()
+    model_registry.get_loaded()
+    batcher = batching.InferenceBatcher(
+        max_batch_size=max_batch_size or getattr(settings, 'EYERIS_BATCH_MAX_SIZE', 32),
+        max_wait_ms=getattr(settings, 'EYERIS_BATCH_MAX_WAIT_MS', 5.0) if max_wait_ms is None else max_wait_ms,
+        model_getter=model_registry.get_model,
+    )
+    batcher.start()
+    return InferenceServer(path, batcher)
+
+
+# ---- client (worker web) ----
+
+def _release(holder):
+    segment = holder.pop() if holder else None
+    if segment is not None:
+        segment.close()
+        segment.unlink()
+
+
+class InferenceClient:
+    """
+    Koneksi satu thread worker ke daemon. Punya `predict(images)` seperti model
+    Keras, jadi bisa dipakai di tempat model lokal (lihat model_registry.get_model).
+    """
+
+    def __init__(self, path, timeout=None):
+        self.path = path
+        self.timeout = timeout
+        self.pid = os.getpid()
+        self._sock = None
+        # segmen dibungkus list supaya finalizer bisa meng-unlink segmen terakhir
+        self._segment = []
+        weakref.finalize(self, _release, self._segment)
+
+    def _connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        try:
+            sock.connect(self.path)
+        except OSError as e:
+            sock.close()
+            raise InferenceUnavailable(f"Daemon inference tidak bisa dihubungi di {self.path}: {e}") from e
+        self._sock = sock
+
+    def _disconnect(self):
+        if self._sock is not None:
+            self._sock.close()
+            self._sock = None
+
+    def _buffer(self, nbytes):
+        if not self._segment or self._segment[0].size < nbytes:
+            _release(self._segment)
+            # dibulatkan ke pangkat dua supaya tidak dibuat ulang untuk tiap ukuran batch
+            size = 1 << (max(nbytes, _MIN_SEGMENT) - 1).bit_length()
+            self._segment.append(shared_memory.SharedMemory(create=True, size=size))
+        return self._segment[0]
+
+    def request(self, header):
+        for attempt in (1, 2):
+            try:
+                if self._sock is None:
+                    self._connect()
+                send_message(self._sock, header)
+                reply, payload = recv_message(self._sock)
+                break
+            except TimeoutError:
+                # jangan diulang: daemon mungkin masih mengerjakan batch ini
+                self._disconnect()
+                raise
+            except OSError:
+                self._disconnect()
+                # koneksi lama putus (mis. daemon restart): coba sekali lagi dengan koneksi baru
+                if attempt == 2:
+                    raise
+        if 'error' in reply:
+            raise RuntimeError(f"Daemon inference: {reply['error']}")
+        return reply, payload
+
+    def predict(self, images, **kwargs):
+        images = np.ascontiguousarray(images)
+        segment = self._buffer(images.nbytes)
+        np.ndarray(images.shape, dtype=images.dtype, buffer=segment.buf)[...] = images
+        reply, payload = self.request({
+            'op': 'predict',
+            'shm': segment.name,
+            'shape': images.shape,
+            'dtype': images.dtype.str,
+        })
+        _remember_version(reply['version'])
+        return np.frombuffer(payload, dtype=reply['dtype']).reshape(reply['shape'])
+
+
+_local = threading.local()
+
+
+def get_client() -> InferenceClient:
+    """Client untuk thread ini (dibuat ulang setelah fork, mis. di worker Gunicorn)."""
+    client = getattr(_local, 'client', None)
+    if client is None or client.pid != os.getpid():
+        client = _local.client = InferenceClient(
+            settings.EYERIS_INFERENCE_SOCKET, getattr(settings, 'EYERIS_INFERENCE_TIMEOUT', None),
+        )
+    return client
+
+
+def info() -> dict:
+    return get_client().request({'op': 'info'})[0]
+
+
+# versi model daemon: (monotonic saat dicek, versi)
+_version = (0.0, None)
+
+
+def _remember_version(version):
+    global _version
+    _version = (time.monotonic(), version)
+
+
+def cached_version():
+    """Versi model daemon yang terakhir diketahui, tanpa menghubungi daemon (None kalau belum pernah)."""
+    return _version[1]
+
+
+def model_version() -> str:
+    """Versi model di daemon, dicek ulang paling sering tiap EYERIS_MODEL_RELOAD_INTERVAL detik."""
+    checked, version = _version
+    interval = float(getattr(settings, 'EYERIS_MODEL_RELOAD_INTERVAL', 5.0))
+    if version is None or (interval >= 0 and time.monotonic() - checked >= interval):
+        model = info()['model']
+        version = model['version'] if model else None
+        _remember_version(version)
+    return version
@@ -0,0 +1,375 @@
+# core/jobs.py
+"""
+Pipeline screening asinkron dengan antrian di database.
+
+View cukup menyimpan Patient lalu memanggil `enqueue_screening`. Worker
+(`python manage.py screening_worker`) mengambil job dan menjalankan stage:
+
+    inference : preprocessing gambar -> predict -> simpan Patient.prediction
+    analysis  : analisis LLM (Groq) -> simpan ScreeningJob.ai_analysis
+    saliency  : job terpisah dari `enqueue_saliency`, heatmap per mata (saliency.py)
+
+Setiap stage diklaim terpisah, jadi worker inference dan worker LLM bisa
+dijalankan/di-scale sendiri-sendiri (`--stage inference` / `--stage analysis`).
+"""
+import asyncio
+import contextvars
+import logging
+import os
+import socket
+import threading
+import time
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from . import batching, metrics, model_registry, prediction_cache, preprocessing, saliency, screening, tta
+from .models import ScreeningJob
+
+logger = logging.getLogger(__name__)
+
+ALL_STAGES = (ScreeningJob.STAGE_INFERENCE, ScreeningJob.STAGE_ANALYSIS, ScreeningJob.STAGE_SALIENCY)
+
+# detik antar pembersihan EYERIS_DECODED_DIR saat worker menganggur
+PRUNE_INTERVAL = 600
+
+
+def _max_attempts() -> int:
+    return int(getattr(settings, 'EYERIS_JOB_MAX_ATTEMPTS', 3))
+
+
+def _lease_seconds() -> int:
+    return int(getattr(settings, 'EYERIS_JOB_LEASE_SECONDS', 600))
+
+
+def default_worker_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}"
+
+
+def enqueue_screening(patient, user=None, tta_threshold=None) -> ScreeningJob:
+    """`tta_threshold`: ambang confidence TTA untuk request ini (None = EYERIS_TTA / EYERIS_TTA_THRESHOLD)."""
+    if user is not None and not user.is_authenticated:
+        user = None
+    return ScreeningJob.objects.create(patient=patient, requested_by=user, tta_threshold=tta_threshold)
+
+
+def _saliency_retry_seconds() -> float:
+    return float(getattr(settings, 'EYERIS_SALIENCY_RETRY_SECONDS', 600))
+
+
+def saliency_retry_after(job) -> int:
+    """Sisa detik sebelum job saliency yang gagal boleh diantrikan ulang (0 = boleh sekarang)."""
+    remaining = _saliency_retry_seconds() - (timezone.now() - job.updated_at).total_seconds()
+    return max(0, int(remaining + 0.999))
+
+
+def enqueue_saliency(patient, user=None) -> ScreeningJob:
+    """
+    Antrikan pembuatan heatmap pasien. Job saliency terakhir pasien dipakai ulang
+    kalau masih antri/jalan, atau kalau gagal kurang dari EYERIS_SALIENCY_RETRY_SECONDS
+    yang lalu (pemanggil melihat status FAILED dan error-nya, tanpa job baru per polling).
+    Constraint screeningjob_pending_saliency_unique menjaga request bersamaan
+    tidak membuat job ganda: yang kalah memakai job milik yang menang.
+    """
+    if user is not None and not user.is_authenticated:
+        user = None
+    latest = (
+        ScreeningJob.objects.filter(patient=patient, stage=ScreeningJob.STAGE_SALIENCY)
+        .order_by('-created_at', '-id')
+    )
+    for attempt in range(3):
+        job = latest.first()
+        if job is not None and not job.is_finished:
+            return job
+        if job is not None and job.status == ScreeningJob.STATUS_FAILED and saliency_retry_after(job):
+            return job
+        try:
+            with transaction.atomic():
+                return ScreeningJob.objects.create(
+                    patient=patient, requested_by=user, stage=ScreeningJob.STAGE_SALIENCY
+                )
+        except IntegrityError:
+            # request lain baru saja mengantrikan job yang sama; ambil job itu
+            # (job itu bisa saja sudah selesai lagi, jadi dicoba ulang sebentar)
+            if attempt == 2:
+                raise
+
+
+def claim_next(stages=ALL_STAGES, worker_id=None):
+    """
+    Ambil satu job yang siap dikerjakan. Job `running` yang lease-nya sudah
+    lewat (worker mati di tengah jalan) ikut diambil ulang.
+    """
+    now = timezone.now()
+    expired = now - timedelta(seconds=_lease_seconds())
+    with transaction.atomic():
+        job = (
+            ScreeningJob.objects.select_for_update(skip_locked=True)
+            .filter(stage__in=stages)
+            .filter(
+                Q(status=ScreeningJob.STATUS_QUEUED)
+                | Q(status=ScreeningJob.STATUS_RUNNING, locked_at__lt=expired)
+            )
+            .order_by('created_at')
+            .first()
+        )
+        if job is None:
+            return None
+        job.status = ScreeningJob.STATUS_RUNNING
+        job.locked_by = worker_id or default_worker_id()
+        job.locked_at = now
+        job.attempts += 1
+        job.save(update_fields=['status', 'locked_by', 'locked_at', 'attempts', 'updated_at'])
+    return job
+
+
+def claim_job(job, stage, worker_id=None) -> bool:
+    """Klaim job tertentu (mis. oleh run_inline atau request streaming) kalau masih antri di `stage`."""
+    now = timezone.now()
+    worker_id = worker_id or default_worker_id()
+    claimed = ScreeningJob.objects.filter(
+        pk=job.pk, stage=stage, status=ScreeningJob.STATUS_QUEUED
+    ).update(status=ScreeningJob.STATUS_RUNNING, locked_by=worker_id, locked_at=now, attempts=F('attempts') + 1)
+    if claimed:
+        job.refresh_from_db(fields=['status', 'locked_by', 'locked_at', 'attempts', 'updated_at'])
+    return bool(claimed)
+
+
+def _advance(job, stage=None, status=ScreeningJob.STATUS_QUEUED, **fields):
+    """Pindahkan job ke stage/status berikutnya dan lepas lock-nya."""
+    if stage is not None and stage != job.stage:
+        job.stage = stage
+        job.attempts = 0
+    job.status = status
+    job.locked_by = None
+    job.locked_at = None
+    for name, value in fields.items():
+        setattr(job, name, value)
+    # hanya kolom status/lock/timing (+ fields), bukan seluruh baris
+    job.save(update_fields=['stage', 'attempts', 'status', 'locked_by', 'locked_at', 'timings', 'updated_at', *fields])
+
+
+def _lookup_cached(job, patient):
+    """Kembalikan (cache, versi model, probabilitas atau None) untuk pasangan gambar pasien."""
+    if not prediction_cache.enabled():
+        return None, None, None
+    cache = prediction_cache.get_cache()
+    version = model_registry.model_version()
+    with metrics.stage("cache_lookup"):
+        return cache, version, cache.get(
+            patient.image1_hash, patient.image2_hash, version, tta.cache_variant(**tta.job_options(job))
+        )
+
+
+def _save_inference(job, patient, hasil_prediksi, timings, cache=None, version=None, cached=False):
+    if cache and not cached:
+        cache.set(
+            patient.image1_hash, patient.image2_hash, hasil_prediksi, version, tta.cache_variant(**tta.job_options(job))
+        )
+
+    inference_ms = None if cached else timings.get('inference_ms')
+    if cached:
+        job.timings['cache_hit'] = True
+    job.timings.update(timings)
+
+    with metrics.stage("db_write"):
+        with transaction.atomic():
+            patient.prediction = screening.format_prediction(hasil_prediksi)
+            patient.save(update_fields=['prediction'])
+            screening.save_predictions(screening.prediction_rows(
+                patient, hasil_prediksi, version or model_registry.model_version(), inference_ms
+            ))
+        _advance(job, stage=ScreeningJob.STAGE_ANALYSIS, error=None)
+
+
+def _durations(started, preprocessed, finished):
+    return {
+        'preprocess_ms': round((preprocessed - started) * 1000, 2),
+        'inference_ms': round((finished - preprocessed) * 1000, 2),
+    }
+
+
+def _run_inference(job):
+    patient = job.patient
+
+    started = time.perf_counter()
+    cache, version, hasil_prediksi = _lookup_cached(job, patient)
+    cached = hasil_prediksi is not None
+    preprocessed = finished = time.perf_counter()
+    if not cached:
+        stacked = screening.load_images(patient)
+        preprocessed = time.perf_counter()
+        # inference = antri di micro-batcher + predict (+ TTA kalau confidence rendah, lihat tta.py)
+        with metrics.stage("inference"):
+            hasil_prediksi, tta_info = tta.predict(stacked, **tta.job_options(job))
+        finished = time.perf_counter()
+        job.timings.update(tta_info)
+
+    _save_inference(job, patient, hasil_prediksi, _durations(started, preprocessed, finished), cache, version, cached)
+
+
+def _run_analysis(job):
+    # import di sini supaya worker inference tidak perlu membuat client LLM
+    from .ai_utils import analyze_eye_prediction
+
+    patient = job.patient
+    started = time.perf_counter()
+    ai_analysis = analyze_eye_prediction(
+        patient_name=patient.name,
+        patient_age=patient.age,
+        patient_gender=patient.gender,
+        prediction=patient.prediction,
+    )
+    complete_analysis(job, ai_analysis, time.perf_counter() - started)
+
+
+def complete_analysis(job, ai_analysis, seconds):
+    job.timings['analysis_ms'] = round(seconds * 1000, 2)
+    with metrics.stage("db_write"):
+        _advance(job, status=ScreeningJob.STATUS_DONE, ai_analysis=ai_analysis, error=None)
+
+
+def _run_saliency(job):
+    started = time.perf_counter()
+    version = model_registry.model_version()
+    created = saliency.generate(job.patient, version)
+    job.timings['saliency_ms'] = round((time.perf_counter() - started) * 1000, 2)
+    # dibaca saliency.known_versions: view mencari heatmap tanpa me-load model
+    job.timings['saliency_version'] = version
+    job.timings['saliency_method'] = saliency.method()
+    with metrics.stage("db_write"):
+        _advance(job, status=ScreeningJob.STATUS_DONE, error=None)
+    return created
+
+
+async def _arun_inference(job):
+    patient = await sync_to_async(lambda: job.patient)()
+
+    started = time.perf_counter()
+    cache, version, hasil_prediksi = await sync_to_async(_lookup_cached)(job, patient)
+    cached = hasil_prediksi is not None
+    preprocessed = finished = time.perf_counter()
+    if not cached:
+        # decode di executor terbatas; buffer baru (bukan buffer per-thread) karena
+        # array dipakai lagi setelah thread executor kembali ke pool
+        # run_in_executor tidak membawa contextvars: copy_context supaya stage tercatat di request ini
+        loop = asyncio.get_running_loop()
+        stacked = await loop.run_in_executor(
+            batching.offload_executor(), contextvars.copy_context().run,
+            screening.load_images, patient, preprocessing.alloc_batch(2),
+        )
+        preprocessed = time.perf_counter()
+        with metrics.stage("inference"):
+            hasil_prediksi, tta_info = await tta.apredict(stacked, **tta.job_options(job))
+        finished = time.perf_counter()
+        job.timings.update(tta_info)
+
+    await sync_to_async(_save_inference)(
+        job, patient, hasil_prediksi, _durations(started, preprocessed, finished), cache, version, cached
+    )
+
+
+async def _arun_analysis(job):
+    from .ai_utils import aanalyze_eye_prediction
+
+    patient = await sync_to_async(lambda: job.patient)()
+    started = time.perf_counter()
+    ai_analysis = await aanalyze_eye_prediction(
+        patient_name=patient.name,
+        patient_age=patient.age,
+        patient_gender=patient.gender,
+        prediction=patient.prediction,
+    )
+    await sync_to_async(complete_analysis)(job, ai_analysis, time.perf_counter() - started)
+
+
+STAGE_HANDLERS = {
+    ScreeningJob.STAGE_INFERENCE: _run_inference,
+    ScreeningJob.STAGE_ANALYSIS: _run_analysis,
+    ScreeningJob.STAGE_SALIENCY: _run_saliency,
+}
+
+ASYNC_STAGE_HANDLERS = {
+    ScreeningJob.STAGE_INFERENCE: _arun_inference,
+    ScreeningJob.STAGE_ANALYSIS: _arun_analysis,
+    ScreeningJob.STAGE_SALIENCY: sync_to_async(_run_saliency),
+}
+
+
+def release(job):
+    """Kembalikan job yang sedang diklaim ke antrian tanpa menghitungnya sebagai gagal."""
+    _advance(job, status=ScreeningJob.STATUS_QUEUED)
+
+
+def fail_stage(job, error):
+    """Tandai stage gagal: di-retry sampai EYERIS_JOB_MAX_ATTEMPTS, kecuali error input user."""
+    if isinstance(error, screening.ScreeningError):
+        # input user yang tidak valid: tidak ada gunanya di-retry
+        status = ScreeningJob.STATUS_FAILED
+    else:
+        logger.error("Job %s gagal di stage %s", job.pk, job.stage, exc_info=error)
+        status = ScreeningJob.STATUS_FAILED if job.attempts >= _max_attempts() else ScreeningJob.STATUS_QUEUED
+    _advance(job, status=status, error=str(error))
+
+
+def run_stage(job):
+    """Jalankan stage job saat ini; kegagalan ditangani fail_stage."""
+    try:
+        STAGE_HANDLERS[job.stage](job)
+    except Exception as e:
+        fail_stage(job, e)
+    return job
+
+
+def run_inline(job):
+    """
+    Jalankan semua stage langsung di proses ini (dipakai kalau EYERIS_SCREENING_ASYNC=0).
+    Tiap stage diklaim dulu seperti di worker; kalau `screening_worker` sudah
+    mengambilnya, sisa job diserahkan ke worker itu.
+    """
+    while not job.is_finished:
+        if not claim_job(job, job.stage):
+            break
+        run_stage(job)
+    return job
+
+
+async def arun_inline(job):
+    """
+    Versi async dari run_inline untuk view async: inference di executor terbatas
+    dan analisis lewat llm.ainvoke, jadi event loop tetap bebas selama menunggu Groq.
+    """
+    while not job.is_finished:
+        if not await sync_to_async(claim_job)(job, job.stage):
+            break
+        try:
+            await ASYNC_STAGE_HANDLERS[job.stage](job)
+        except Exception as e:
+            await sync_to_async(fail_stage)(job, e)
+    return job
+
+
+def work(stages=ALL_STAGES, worker_id=None, poll_interval=1.0, once=False, stop_event=None):
+    """Loop worker: klaim job, jalankan stage-nya, ulangi. Mengembalikan jumlah stage yang diproses."""
+    worker_id = worker_id or default_worker_id()
+    processed = 0
+    pruned_at = time.monotonic()
+    while stop_event is None or not stop_event.is_set():
+        job = claim_next(stages, worker_id)
+        if job is None:
+            if once:
+                break
+            if time.monotonic() - pruned_at >= PRUNE_INTERVAL:
+                # hasil decode upload yang tidak pernah diambil (job gagal / pasien dihapus)
+                preprocessing.prune_decoded()
+                pruned_at = time.monotonic()
+            time.sleep(poll_interval)
+            continue
+        run_stage(job)
+        processed += 1
+        logger.info("Job %s -> %s/%s", job.pk, job.stage, job.status)
+    return processed
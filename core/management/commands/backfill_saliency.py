@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+
+from core import saliency
+from core.models import Patient
+
+
+class Command(BaseCommand):
+    help = (
+        "Buat heatmap saliency yang belum ada untuk pasien lama (per hash gambar + versi model aktif) "
+        "dengan process pool. Heatmap yang sudah ada dilewati, jadi aman dijalankan ulang."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk-size", type=int, default=16, help="Jumlah gambar per batch (default 16).")
+        parser.add_argument("--workers", type=int, help="Jumlah proses (default: EYERIS_SALIENCY_WORKERS).")
+        parser.add_argument("--limit", type=int, help="Hanya N pasien terbaru.")
+
+    def handle(self, *args, **options):
+        patients = (
+            Patient.objects.exclude(prediction__isnull=True)
+            .only("id", "image1", "image2", "image1_hash", "image2_hash")
+            .order_by("-created_at")
+        )
+        if options["limit"]:
+            patients = patients[:options["limit"]]
+
+        pending, created = saliency.backfill(
+            patients.iterator(),
+            chunk_size=options["chunk_size"],
+            workers=options["workers"],
+            progress=lambda done, total: self.stdout.write(f"  {done}/{total} batch"),
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"{created}/{pending} heatmap baru ({saliency.method()}) di {saliency.saliency_dir()}"
+        ))
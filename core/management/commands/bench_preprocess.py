@@ -0,0 +1,105 @@
+import glob
+import json
+import multiprocessing
+import os
+import resource
+import time
+import tracemalloc
+
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from PIL import Image
+
+from core import preprocessing
+
+
+def _legacy_batch(paths):
+    """Jalur lama dashboard_view: PIL full decode + LANCZOS, list array + np.stack."""
+    imgs = []
+    for path in paths:
+        with Image.open(path) as im:
+            im = im.convert('RGB')
+            im = im.resize((224, 224), resample=Image.LANCZOS)
+            imgs.append(np.array(im))
+    return np.stack(imgs, axis=0)
+
+
+def _make_runners():
+    out = preprocessing.alloc_batch(2)
+    return {
+        "legacy": lambda pair: _legacy_batch(pair),
+        "draft_serial": lambda pair: preprocessing.load_batch(pair, out=out, parallel=False),
+        "draft_threads": lambda pair: preprocessing.load_batch(pair, out=out, parallel=True),
+    }
+
+
+def _measure(name, pairs, repeat, queue):
+    runner = _make_runners()[name]
+    runner(pairs[0])  # warm-up (thread pool, import lazy PIL plugin)
+
+    tracemalloc.start()
+    timings = []
+    for _ in range(repeat):
+        for pair in pairs:
+            started = time.perf_counter()
+            runner(pair)
+            timings.append((time.perf_counter() - started) * 1000 / len(pair))
+    _, py_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    timings.sort()
+    queue.put({
+        "path": name,
+        "images": len(timings) * 2,
+        "ms_per_image_mean": round(sum(timings) / len(timings), 3),
+        "ms_per_image_p50": round(timings[len(timings) // 2], 3),
+        "ms_per_image_p95": round(timings[int(len(timings) * 0.95) - 1], 3),
+        "traced_peak_kb": round(py_peak / 1024, 1),
+        # ru_maxrss dalam KB di Linux
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    })
+
+
+class Command(BaseCommand):
+    help = "Benchmark preprocessing gambar: jalur lama vs draft-mode + buffer batch (ms/gambar dan peak RSS)."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--images",
+            default=os.path.join(settings.MEDIA_ROOT, "patients"),
+            help="Folder berisi pasangan <id>_left.jpg/<id>_right.jpg (default: media/patients).",
+        )
+        parser.add_argument("--repeat", type=int, default=3)
+        parser.add_argument("--json", dest="json_path", help="Tulis hasil ke file JSON.")
+
+    def handle(self, *args, **options):
+        lefts = sorted(glob.glob(os.path.join(options["images"], "*_left*.jpg")))
+        pairs = []
+        for left in lefts:
+            right = left.replace("_left", "_right")
+            if os.path.exists(right):
+                pairs.append([left, right])
+        if not pairs:
+            raise CommandError(f"Tidak ada pasangan gambar di {options['images']}")
+
+        # tiap jalur diukur di proses terpisah supaya peak RSS tidak saling tercampur
+        ctx = multiprocessing.get_context("fork")
+        results = []
+        for name in ("legacy", "draft_serial", "draft_threads"):
+            queue = ctx.Queue()
+            proc = ctx.Process(target=_measure, args=(name, pairs, options["repeat"], queue))
+            proc.start()
+            results.append(queue.get())
+            proc.join()
+
+        for r in results:
+            self.stdout.write(
+                f"{r['path']:<14} {r['ms_per_image_mean']:>8.2f} ms/img (p50 {r['ms_per_image_p50']:.2f}, "
+                f"p95 {r['ms_per_image_p95']:.2f})  peak RSS {r['peak_rss_mb']:.1f} MB  "
+                f"traced peak {r['traced_peak_kb']:.0f} KB"
+            )
+
+        if options["json_path"]:
+            with open(options["json_path"], "w") as f:
+                json.dump({"pairs": len(pairs), "repeat": options["repeat"], "results": results}, f, indent=2)
@@ -0,0 +1,373 @@
+import glob
+import json
+import os
+import platform
+import resource
+import statistics
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.test import Client
+from django.test.utils import (
+    override_settings,
+    setup_databases,
+    setup_test_environment,
+    teardown_databases,
+    teardown_test_environment,
+)
+
+from core import ai_utils, model_registry, preprocessing, tta
+from core.screening import DISEASE_LABELS
+
+BATCH_SIZES = (2, 4, 8, 16, 32, 64)
+
+# metrik yang dibandingkan dengan --baseline (semua: makin kecil makin baik)
+REGRESSION_METRICS = (
+    ("model", "load_seconds"),
+    ("preprocess", "ms_per_image_p50"),
+    ("predict", "ms_per_batch_p50"),
+    ("tta", "ms_p50"),
+    ("e2e", "p95_ms"),
+)
+
+
+class _StubResponse:
+    def __init__(self, content):
+        self.content = content
+        self.usage_metadata = {"input_tokens": 0, "output_tokens": 0, "total_tokens": 0}
+
+
+class StubLLM:
+    """Pengganti ChatGroq tanpa jaringan: jawaban tetap setelah jeda `latency_ms`."""
+
+    def __init__(self, latency_ms=0.0, answer="Hasil analisis (stub benchmark)."):
+        self.latency = latency_ms / 1000.0
+        self.answer = answer
+
+    def invoke(self, messages, **kwargs):
+        time.sleep(self.latency)
+        return _StubResponse(self.answer)
+
+    async def ainvoke(self, messages, **kwargs):
+        import asyncio
+
+        await asyncio.sleep(self.latency)
+        return _StubResponse(self.answer)
+
+    def stream(self, messages, **kwargs):
+        time.sleep(self.latency)
+        for word in self.answer.split(" "):
+            yield _StubResponse(word + " ")
+
+    async def astream(self, messages, **kwargs):
+        import asyncio
+
+        await asyncio.sleep(self.latency)
+        for word in self.answer.split(" "):
+            yield _StubResponse(word + " ")
+
+
+def build_dummy_model(path):
+    """Model Keras kecil dengan layer GAM (seperti model asli) untuk menggantikan pickle produksi."""
+    import joblib
+    import keras
+
+    from core.model_custom import GAM
+
+    inputs = keras.Input(shape=(*preprocessing.IMAGE_SIZE, 3))
+    x = keras.layers.Rescaling(1.0 / 255)(inputs)
+    x = keras.layers.Conv2D(8, 3, strides=4, activation="relu")(x)
+    x = GAM(reduction_ratio=4)(x)
+    x = keras.layers.GlobalAveragePooling2D()(x)
+    outputs = keras.layers.Dense(len(DISEASE_LABELS), activation="softmax")(x)
+    joblib.dump(keras.Model(inputs, outputs), path)
+    return path
+
+
+def _percentiles(values):
+    values = sorted(values)
+    pick = lambda q: values[min(len(values) - 1, int(round(q * (len(values) - 1))))]  # noqa: E731
+    return {
+        "mean_ms": round(statistics.fmean(values), 3),
+        "p50_ms": round(pick(0.50), 3),
+        "p90_ms": round(pick(0.90), 3),
+        "p95_ms": round(pick(0.95), 3),
+        "p99_ms": round(pick(0.99), 3),
+    }
+
+
+def _peak_rss_mb():
+    # ru_maxrss dalam KB di Linux
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+
+def _find_pairs(folder):
+    pairs = []
+    for left in sorted(glob.glob(os.path.join(folder, "*_left*.jpg"))):
+        right = left.replace("_left", "_right")
+        if os.path.exists(right):
+            pairs.append((left, right))
+    return pairs
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark jalur screening tanpa jaringan/GPU: load model, preprocessing, predict per ukuran batch "
+        "dan latency request dashboard dengan klien bersamaan. Hasil bisa ditulis ke JSON."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--images",
+            default=os.path.join(settings.MEDIA_ROOT, "patients"),
+            help="Folder berisi pasangan <id>_left.jpg/<id>_right.jpg (default: media/patients).",
+        )
+        parser.add_argument(
+            "--model",
+            help="Pickle model yang dipakai; default model Keras dummy dengan layer GAM.",
+        )
+        parser.add_argument("--repeat", type=int, default=5, help="Pengulangan per ukuran batch predict.")
+        parser.add_argument(
+            "--clients", default="1,4,8", help="Jumlah klien bersamaan untuk uji end-to-end (dipisah koma)."
+        )
+        parser.add_argument("--requests", type=int, default=8, help="Request per klien.")
+        parser.add_argument("--llm-latency-ms", type=float, default=50.0, help="Jeda jawaban stub LLM.")
+        parser.add_argument("--json", dest="json_path", help="Tulis hasil ke file JSON.")
+        parser.add_argument("--baseline", help="File JSON hasil sebelumnya untuk cek regresi.")
+        parser.add_argument(
+            "--tolerance", type=float, default=0.2, help="Batas kenaikan relatif terhadap baseline (default 0.2)."
+        )
+
+    def handle(self, *args, **options):
+        pairs = _find_pairs(options["images"])
+        if not pairs:
+            raise CommandError(f"Tidak ada pasangan gambar di {options['images']}")
+        clients = [int(n) for n in options["clients"].split(",") if n.strip()]
+
+        workdir = tempfile.mkdtemp(prefix="eyeris-bench-")
+        model_path = options["model"] or build_dummy_model(os.path.join(workdir, "dummy_model.pkl"))
+        # menggantikan client ChatGroq (dibuat lazy oleh ai_utils.get_llm)
+        ai_utils.llm = StubLLM(options["llm_latency_ms"])
+
+        results = {
+            "generated_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "environment": {
+                "python": platform.python_version(),
+                "numpy": np.__version__,
+                "platform": platform.platform(),
+                "cpu_count": os.cpu_count(),
+            },
+            "fixtures": {"pairs": len(pairs), "folder": options["images"]},
+        }
+        with override_settings(EYERIS_MODEL_PATH=model_path, EYERIS_MODEL_RELOAD_INTERVAL=-1):
+            results["model"] = self._bench_model_load(model_path)
+            results["preprocess"] = self._bench_preprocess(pairs)
+            results["predict"] = self._bench_predict(options["repeat"])
+            results["tta"] = self._bench_tta(pairs, options["repeat"])
+            results["e2e"] = self._bench_e2e(pairs, clients, options["requests"], workdir)
+        results["peak_rss_mb"] = _peak_rss_mb()
+
+        self._report(results)
+        if options["json_path"]:
+            with open(options["json_path"], "w") as f:
+                json.dump(results, f, indent=2)
+        if options["baseline"]:
+            self._check_baseline(results, options["baseline"], options["tolerance"])
+
+    # ---- bagian benchmark ----
+
+    def _bench_model_load(self, model_path):
+        loaded = model_registry.reload(force=True)
+        return {
+            "path": model_path,
+            "version": loaded.version,
+            # termasuk unpickle + warm-up satu batch
+            "load_seconds": round(loaded.load_seconds, 3),
+            "peak_rss_mb": _peak_rss_mb(),
+        }
+
+    def _bench_preprocess(self, pairs):
+        out = preprocessing.alloc_batch(2)
+        preprocessing.load_batch(pairs[0], out=out)  # warm-up thread pool
+        timings = []
+        for pair in pairs:
+            started = time.perf_counter()
+            preprocessing.load_batch(pair, out=out)
+            timings.append((time.perf_counter() - started) * 1000 / len(pair))
+        stats = _percentiles(timings)
+        return {
+            "images": len(timings) * 2,
+            "ms_per_image_mean": stats["mean_ms"],
+            "ms_per_image_p50": stats["p50_ms"],
+            "ms_per_image_p95": stats["p95_ms"],
+            "peak_rss_mb": _peak_rss_mb(),
+        }
+
+    def _bench_predict(self, repeat):
+        model = model_registry.get_model()
+        rng = np.random.default_rng(0)
+        rows = []
+        for size in BATCH_SIZES:
+            batch = rng.integers(0, 256, size=(size, *preprocessing.IMAGE_SIZE, 3), dtype=np.uint8)
+            model.predict(batch)  # warm-up untuk bentuk batch ini
+            timings = []
+            for _ in range(repeat):
+                started = time.perf_counter()
+                model.predict(batch)
+                timings.append((time.perf_counter() - started) * 1000)
+            p50 = statistics.median(timings)
+            rows.append({
+                "batch_size": size,
+                "ms_per_batch_p50": round(p50, 3),
+                "ms_per_batch_max": round(max(timings), 3),
+                "ms_per_image": round(p50 / size, 3),
+            })
+        return rows
+
+    def _bench_tta(self, pairs, repeat):
+        """Predict biasa (2 gambar) vs TTA satu batch untuk kedua mata / satu mata (mode auto)."""
+        model = model_registry.get_model()
+        images = preprocessing.load_batch(pairs[0], out=preprocessing.alloc_batch(2))
+        batches = {
+            "plain": lambda: model.predict(images),
+            "both_eyes": lambda: model.predict(tta.augment(images)),
+            "one_eye": lambda: model.predict(tta.augment(images[:1], include_original=False)),
+        }
+        rows = []
+        for mode, run in batches.items():
+            run()  # warm-up untuk bentuk batch ini
+            timings = []
+            for _ in range(repeat):
+                started = time.perf_counter()
+                run()
+                timings.append((time.perf_counter() - started) * 1000)
+            rows.append({"mode": mode, "ms_p50": round(statistics.median(timings), 3)})
+        plain = rows[0]["ms_p50"]
+        for row in rows:
+            row["overhead"] = round(row["ms_p50"] / plain, 2) if plain else None
+        return rows
+
+    def _bench_e2e(self, pairs, clients, per_client, workdir):
+        """POST ke dashboard (screening inline) dengan N klien paralel, di database test terpisah."""
+        blobs = []
+        for left, right in pairs:
+            with open(left, "rb") as fl, open(right, "rb") as fr:
+                blobs.append((os.path.basename(left), fl.read(), os.path.basename(right), fr.read()))
+
+        db = connections["default"].settings_dict
+        if db["ENGINE"].endswith("sqlite3") and not db["TEST"].get("NAME"):
+            # sqlite in-memory tidak tahan tulis dari banyak thread; pakai file sementara
+            db["TEST"]["NAME"] = os.path.join(workdir, "bench.sqlite3")
+
+        setup_test_environment(debug=False)
+        old_config = setup_databases(verbosity=0, interactive=False)
+        try:
+            from django.contrib.auth import get_user_model
+
+            user = get_user_model().objects.create_user(username="bench@example.com", password=None)
+            overrides = dict(
+                MEDIA_ROOT=os.path.join(workdir, "media"),
+                EYERIS_SCREENING_ASYNC=False,
+                # ukur inference sungguhan, bukan cache
+                EYERIS_PREDICTION_CACHE=False,
+                CACHES={**settings.CACHES, "llm": {"BACKEND": "django.core.cache.backends.dummy.DummyCache"}},
+            )
+            with override_settings(**overrides):
+                return [self._run_clients(user, blobs, n, per_client) for n in clients]
+        finally:
+            teardown_databases(old_config, verbosity=0)
+            teardown_test_environment()
+
+    def _run_clients(self, user, blobs, n_clients, per_client):
+        counter = iter(range(n_clients * per_client))
+        counter_lock = threading.Lock()
+
+        def client_loop():
+            client = Client()
+            client.force_login(user)
+            latencies, errors = [], 0
+            for _ in range(per_client):
+                with counter_lock:
+                    i = next(counter)
+                left_name, left, right_name, right = blobs[i % len(blobs)]
+                started = time.perf_counter()
+                response = client.post("/dashboard/", {
+                    "name": f"Bench {i}",
+                    "age": 40 + i % 40,
+                    "gender": "MFO"[i % 3],
+                    "image1": SimpleUploadedFile(left_name, left, content_type="image/jpeg"),
+                    "image2": SimpleUploadedFile(right_name, right, content_type="image/jpeg"),
+                })
+                latencies.append((time.perf_counter() - started) * 1000)
+                if response.status_code != 302:
+                    errors += 1
+            connections.close_all()
+            return latencies, errors
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=n_clients) as pool:
+            outcomes = list(pool.map(lambda _: client_loop(), range(n_clients)))
+        elapsed = time.perf_counter() - started
+
+        latencies = [ms for lat, _ in outcomes for ms in lat]
+        return {
+            "clients": n_clients,
+            "requests": len(latencies),
+            "errors": sum(err for _, err in outcomes),
+            "throughput_rps": round(len(latencies) / elapsed, 2),
+            **_percentiles(latencies),
+            "peak_rss_mb": _peak_rss_mb(),
+        }
+
+    # ---- output ----
+
+    def _report(self, results):
+        model = results["model"]
+        pre = results["preprocess"]
+        self.stdout.write(f"model        {model['version']}  load {model['load_seconds']:.3f}s")
+        self.stdout.write(
+            f"preprocess   {pre['ms_per_image_p50']:.2f} ms/img (p95 {pre['ms_per_image_p95']:.2f})"
+        )
+        for row in results["predict"]:
+            self.stdout.write(
+                f"predict b={row['batch_size']:<3} {row['ms_per_batch_p50']:>9.2f} ms/batch  "
+                f"{row['ms_per_image']:.2f} ms/img"
+            )
+        for row in results["tta"]:
+            self.stdout.write(f"tta {row['mode']:<9} {row['ms_p50']:>9.2f} ms  x{row['overhead']}")
+        for row in results["e2e"]:
+            self.stdout.write(
+                f"e2e c={row['clients']:<3} p50 {row['p50_ms']:.1f} ms  p95 {row['p95_ms']:.1f} ms  "
+                f"p99 {row['p99_ms']:.1f} ms  {row['throughput_rps']:.1f} req/s  errors {row['errors']}"
+            )
+        self.stdout.write(f"peak RSS     {results['peak_rss_mb']:.1f} MB")
+
+    def _check_baseline(self, results, path, tolerance):
+        with open(path) as f:
+            baseline = json.load(f)
+
+        def values(data, section, metric):
+            rows = data.get(section)
+            if isinstance(rows, dict):
+                return {None: rows.get(metric)}
+            # predict per batch_size, tta per mode, e2e per jumlah klien
+            key = {"predict": "batch_size", "tta": "mode"}.get(section, "clients")
+            return {row[key]: row.get(metric) for row in rows or []}
+
+        regressions = []
+        for section, metric in REGRESSION_METRICS:
+            old = values(baseline, section, metric)
+            for key, new in values(results, section, metric).items():
+                if old.get(key) and new is not None and new > old[key] * (1 + tolerance):
+                    label = f"{section}.{metric}" + (f"[{key}]" if key is not None else "")
+                    regressions.append(f"{label}: {old[key]} -> {new}")
+        if regressions:
+            raise CommandError("Regresi performa dibanding baseline:\n  " + "\n  ".join(regressions))
+        self.stdout.write(self.style.SUCCESS(f"Tidak ada regresi > {tolerance:.0%} dibanding {path}"))
@@ -0,0 +1,86 @@
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+HEAVY_MODULES = ("tensorflow", "keras", "langchain_groq", "langchain_core")
+
+# dijalankan di proses Python baru supaya import benar-benar dingin
+PROBE = """
+import importlib, json, resource, sys, time
+started = time.perf_counter()
+import django
+django.setup()
+from django.urls import get_resolver
+get_resolver().url_patterns  # import semua view, seperti worker web saat request pertama
+errors = {}
+if %(eager)r:
+    # perilaku lama: views.py mengimpor model_custom + langchain_groq, ai_utils membuat ChatGroq
+    for name in ("core.model_custom", "langchain_groq"):
+        try:
+            importlib.import_module(name)
+        except Exception as e:
+            errors[name] = repr(e)
+    if not errors:
+        from core import ai_utils
+        ai_utils.get_llm()
+print(json.dumps({
+    "import_seconds": time.perf_counter() - started,
+    # ru_maxrss dalam KB di Linux
+    "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    "heavy_modules": sorted(m for m in %(heavy)r if m in sys.modules),
+    "errors": errors,
+}))
+"""
+
+
+class Command(BaseCommand):
+    help = (
+        "Ukur waktu import dan RSS startup worker web (django.setup + semua view) di proses baru: "
+        "mode lazy (sekarang) vs eager (TensorFlow/Keras + LangChain di-import saat startup, perilaku lama)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--repeat", type=int, default=3)
+        parser.add_argument("--json", dest="json_path", help="Tulis hasil ke file JSON.")
+
+    def _probe(self, eager):
+        env = dict(os.environ, DJANGO_SETTINGS_MODULE=os.environ.get("DJANGO_SETTINGS_MODULE", "iris.settings"))
+        # jangan sampai probe ikut warm-up model lewat CoreConfig.ready()
+        env["EYERIS_MODEL_WARMUP"] = "0"
+        proc = subprocess.run(
+            [sys.executable, "-c", PROBE % {"eager": eager, "heavy": HEAVY_MODULES}],
+            cwd=str(settings.BASE_DIR), env=env, capture_output=True, text=True,
+        )
+        if proc.returncode != 0:
+            raise CommandError(f"Probe startup gagal:\n{proc.stderr}")
+        return json.loads(proc.stdout.strip().splitlines()[-1])
+
+    def handle(self, *args, **options):
+        results = []
+        for mode, eager in (("lazy", False), ("eager", True)):
+            runs = [self._probe(eager) for _ in range(options["repeat"])]
+            results.append({
+                "mode": mode,
+                "import_seconds_median": round(statistics.median(r["import_seconds"] for r in runs), 3),
+                "peak_rss_mb_max": round(max(r["peak_rss_mb"] for r in runs), 1),
+                "heavy_modules": runs[-1]["heavy_modules"],
+                "errors": runs[-1]["errors"],
+            })
+
+        for r in results:
+            line = (
+                f"{r['mode']:<6} {r['import_seconds_median']:>7.3f} s  peak RSS {r['peak_rss_mb_max']:>7.1f} MB  "
+                f"modul berat: {', '.join(r['heavy_modules']) or '-'}"
+            )
+            if r["errors"]:
+                line += f"  (gagal import: {', '.join(r['errors'])})"
+            self.stdout.write(line)
+
+        if options["json_path"]:
+            with open(options["json_path"], "w") as f:
+                json.dump({"repeat": options["repeat"], "results": results}, f, indent=2)
@@ -0,0 +1,76 @@
+import os
+
+from django.core.files import File
+from django.core.management.base import BaseCommand
+
+from core.models import Patient
+from core.storage import content_hash, patient_image_storage
+
+IMAGE_FIELDS = (("image1", "image1_hash"), ("image2", "image2_hash"))
+
+
+class Command(BaseCommand):
+    help = (
+        "Pindahkan gambar pasien lama ke nama berbasis hash isi dan format gambar, isi image*_hash, "
+        "lalu hapus file duplikat yang sudah tidak dipakai."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dry-run", action="store_true", help="Hanya laporkan, tidak mengubah apa pun.")
+
+    def handle(self, *args, **options):
+        dry_run = options["dry_run"]
+        storage = patient_image_storage
+        old_names = set()
+        updated = 0
+
+        for patient in Patient.objects.only("id", *(f for pair in IMAGE_FIELDS for f in pair)).iterator():
+            changed = set()
+            for field, hash_field in IMAGE_FIELDS:
+                img = getattr(patient, field)
+                if not img or not storage.exists(img.name):
+                    continue
+                with storage.open(img.name, "rb") as fh:
+                    content = File(fh, img.name)
+                    digest = content_hash(content)
+                    content.content_hash = digest
+                    # nama lama bisa berbeda hanya di ekstensi (.jpeg/.JPG): disatukan juga
+                    if storage.content_name(img.name, content) != img.name:
+                        old_names.add(img.name)
+                        if not dry_run:
+                            img.name = storage.save(img.name, content)
+                        changed.add(field)
+                if getattr(patient, hash_field) != digest:
+                    setattr(patient, hash_field, digest)
+                    changed.add(hash_field)
+            if changed:
+                updated += 1
+                if not dry_run:
+                    patient.save(update_fields=sorted(changed))
+
+        # file lama hanya dihapus kalau sudah tidak dirujuk pasien mana pun
+        still_used = set()
+        for field, _ in IMAGE_FIELDS:
+            if dry_run:
+                # saat dry-run baris belum dipindah, anggap semua nama lama akan lepas
+                break
+            still_used.update(Patient.objects.filter(**{f"{field}__in": old_names}).values_list(field, flat=True))
+        removable = sorted(old_names - still_used)
+        freed = sum(storage.size(name) for name in removable if storage.exists(name))
+        if not dry_run:
+            for name in removable:
+                storage.delete(name)
+
+        # file di folder patients/ yang tidak dirujuk sama sekali (mis. sisa upload ulang)
+        referenced = set()
+        for field, _ in IMAGE_FIELDS:
+            referenced.update(Patient.objects.exclude(**{field: ""}).values_list(field, flat=True))
+        _, files = storage.listdir("patients") if storage.exists("patients") else ([], [])
+        orphans = [os.path.join("patients", f) for f in files if os.path.join("patients", f) not in referenced]
+
+        prefix = "[dry-run] " if dry_run else ""
+        self.stdout.write(
+            f"{prefix}{updated} pasien diperbarui, {len(removable)} file lama dihapus "
+            f"({freed / 1024 / 1024:.1f} MB). {len(orphans)} file tidak dirujuk pasien mana pun "
+            f"di patients/ (tidak dihapus otomatis)."
+        )
@@ -0,0 +1,96 @@
+import glob
+import json
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from core import model_export, model_registry, preprocessing, runtimes
+
+
+def _sample_pairs(folder):
+    pairs = []
+    for left in sorted(glob.glob(os.path.join(folder, "*_left*.jpg"))):
+        right = left.replace("_left", "_right")
+        if os.path.exists(right):
+            pairs.append((left, right))
+    return pairs
+
+
+class Command(BaseCommand):
+    help = (
+        "Export model pickle ke format inference-only (onnx/tflite, opsional kuantisasi float16/int8), "
+        "lalu bandingkan hasil, latency dan memori dengan model asli pada gambar contoh."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--format", choices=model_export.FORMATS, default="onnx")
+        parser.add_argument("--quantize", choices=model_export.QUANTIZATIONS, default="none")
+        parser.add_argument("--source", help="Pickle model (default: EYERIS_MODEL_PATH / core/model/model_1.pkl).")
+        parser.add_argument(
+            "--output", help="File hasil; default di samping pickle sehingga dipakai otomatis oleh registry."
+        )
+        parser.add_argument(
+            "--images",
+            default=os.path.join(settings.MEDIA_ROOT, "patients"),
+            help="Gambar contoh untuk kalibrasi int8 dan cek paritas (default: media/patients).",
+        )
+        parser.add_argument("--check-only", action="store_true", help="Lewati export, hanya bandingkan --output.")
+        parser.add_argument(
+            "--min-agreement", type=float, default=0.98,
+            help="Gagal kalau kesamaan label dengan model asli di bawah nilai ini (default 0.98).",
+        )
+        parser.add_argument("--json", dest="json_path", help="Tulis hasil perbandingan ke file JSON.")
+
+    def handle(self, *args, **options):
+        source = options["source"] or getattr(settings, "EYERIS_MODEL_PATH", None) or model_registry.DEFAULT_MODEL_PATH
+        pairs = _sample_pairs(options["images"])
+        if not pairs:
+            raise CommandError(f"Tidak ada pasangan gambar di {options['images']}")
+
+        if options["check_only"]:
+            output = options["output"]
+            if not output or not os.path.exists(output):
+                raise CommandError("--check-only butuh --output yang sudah ada")
+        else:
+            ext = runtimes.EXTENSIONS[options["format"]]
+            output = options["output"] or os.path.splitext(source)[0] + ext
+            # tulis ke file kandidat dulu: registry baru memakainya setelah lolos cek paritas
+            candidate = os.path.splitext(output)[0] + ".candidate" + ext
+            calibration = model_export.calibration_images(pairs) if options["quantize"] == "int8" else None
+            try:
+                model_export.export(
+                    source, options["format"], candidate, quantize=options["quantize"], calibration=calibration
+                )
+            except ImportError as e:
+                # paket export opsional (requirements-optional.txt) belum terpasang
+                raise CommandError(str(e)) from e
+            self.stdout.write(f"Export {options['format']}/{options['quantize']}: {candidate}")
+
+        images = preprocessing.load_batch([p for pair in pairs for p in pair])
+        result = model_export.compare(source, output if options["check_only"] else candidate, images)
+        result["quantize"] = options["quantize"]
+
+        for side in ("original", "exported"):
+            r = result[side]
+            latency = "  ".join(f"b={size}: {ms:.1f} ms" for size, ms in r["ms_per_batch"].items())
+            self.stdout.write(
+                f"{side:<9} {r['backend']:<7} {r['size_mb']:>7.2f} MB  load {r['load_seconds']:.2f}s  "
+                f"peak RSS {r['peak_rss_mb']:.0f} MB  {latency}"
+            )
+        self.stdout.write(
+            f"paritas: label sama {result['label_agreement']:.1%} dari {result['images']} gambar, "
+            f"selisih probabilitas maks {result['max_abs_diff']:.4f} (rata-rata {result['mean_abs_diff']:.5f})"
+        )
+
+        if options["json_path"]:
+            with open(options["json_path"], "w") as f:
+                json.dump(result, f, indent=2)
+        if result["label_agreement"] < options["min_agreement"]:
+            raise CommandError(
+                f"Kesamaan label {result['label_agreement']:.1%} di bawah {options['min_agreement']:.0%}; "
+                f"{output if options['check_only'] else candidate} tidak dipakai"
+            )
+        if not options["check_only"]:
+            os.replace(candidate, output)
+            self.stdout.write(self.style.SUCCESS(f"Model export siap dipakai: {output}"))
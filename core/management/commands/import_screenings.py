@@ -0,0 +1,60 @@
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core import bulk_import
+from core.models import ImportBatch
+
+
+class Command(BaseCommand):
+    help = (
+        "Import massal folder/ZIP berisi pasangan <id>_left.jpg/<id>_right.jpg: preprocessing paralel, "
+        "inference per batch besar, Patient ditulis dengan bulk_create. Bisa dilanjutkan setelah terputus."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", nargs="?", help="Folder atau file ZIP.")
+        parser.add_argument("--resume", type=int, metavar="BATCH_ID", help="Lanjutkan ImportBatch tertentu.")
+        parser.add_argument("--pending", action="store_true", help="Proses semua batch hasil upload yang masih antri.")
+        parser.add_argument("--chunk-size", type=int, default=64, help="Jumlah pasangan per predict (default 64).")
+        parser.add_argument("--workers", type=int, help="Jumlah proses preprocessing (default: jumlah CPU).")
+
+    def handle(self, *args, **options):
+        if options["pending"]:
+            batches = list(ImportBatch.objects.filter(status=ImportBatch.STATUS_QUEUED).order_by("created_at"))
+        elif options["resume"]:
+            batch = ImportBatch.objects.filter(pk=options["resume"]).first()
+            if batch is None:
+                raise CommandError(f"ImportBatch #{options['resume']} tidak ditemukan")
+            batches = [batch]
+        elif options["path"]:
+            path = os.path.abspath(options["path"])
+            # source yang sama dan belum selesai otomatis dilanjutkan
+            batch = (
+                ImportBatch.objects.filter(source_path=path)
+                .exclude(status=ImportBatch.STATUS_DONE)
+                .order_by("-created_at")
+                .first()
+            ) or ImportBatch.objects.create(source_path=path)
+            batches = [batch]
+        else:
+            raise CommandError("Berikan PATH, --resume BATCH_ID, atau --pending")
+
+        for batch in batches:
+            self.stdout.write(f"Import #{batch.pk}: {batch.source_path}")
+            bulk_import.run_import(
+                batch,
+                chunk_size=options["chunk_size"],
+                workers=options["workers"],
+                progress=self._progress,
+            )
+            self.stdout.write(self.style.SUCCESS(
+                f"Import #{batch.pk} selesai: {batch.imported}/{batch.total_pairs} pasangan, "
+                f"{batch.skipped} file dilewati (tanpa pasangan/rusak), {batch.images_per_second or 0:.1f} gambar/s"
+            ))
+
+    def _progress(self, batch, elapsed, images):
+        self.stdout.write(
+            f"  {batch.imported}/{batch.total_pairs} pasangan, {images} gambar dalam {elapsed:.1f}s "
+            f"({batch.images_per_second:.1f} gambar/s)"
+        )
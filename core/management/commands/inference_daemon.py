@@ -0,0 +1,46 @@
+import signal
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from core import inference_daemon
+
+
+def _stop(signum, frame):
+    raise KeyboardInterrupt
+
+
+class Command(BaseCommand):
+    help = (
+        "Jalankan daemon inference per node: model di-load sekali, worker web mengirim batch "
+        "lewat Unix socket + shared memory (aktifkan di worker dengan EYERIS_INFERENCE_SOCKET)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--socket", help="Path Unix socket (default: EYERIS_INFERENCE_SOCKET).")
+        parser.add_argument("--max-batch-size", type=int, help="Default: EYERIS_BATCH_MAX_SIZE.")
+        parser.add_argument("--max-wait-ms", type=float, help="Default: EYERIS_BATCH_MAX_WAIT_MS.")
+
+    def handle(self, *args, **options):
+        path = options["socket"] or getattr(settings, "EYERIS_INFERENCE_SOCKET", None)
+        if not path:
+            raise CommandError("Tentukan --socket atau EYERIS_INFERENCE_SOCKET")
+        try:
+            server = inference_daemon.serve(path, options["max_batch_size"], options["max_wait_ms"])
+        except RuntimeError as e:
+            raise CommandError(str(e))
+
+        info = server.info()
+        self.stdout.write(
+            f"Daemon inference jalan di {path}: model {info['model']['version']} ({info['model']['backend']}), "
+            f"batch maks {server.batcher.max_batch_size}"
+        )
+        # systemd / supervisor menghentikan dengan SIGTERM
+        signal.signal(signal.SIGTERM, _stop)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+        self.stdout.write(self.style.SUCCESS("Daemon inference berhenti."))
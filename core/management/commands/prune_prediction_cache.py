@@ -0,0 +1,30 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core import model_registry, prediction_cache
+
+
+class Command(BaseCommand):
+    help = (
+        "Hapus entri prediction cache di database untuk versi model lama yang sudah lewat masa simpan. "
+        "Entri versi model aktif tidak dihapus."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--days",
+            type=float,
+            default=getattr(settings, 'EYERIS_PREDICTION_CACHE_RETENTION_DAYS', 7),
+            help="Umur minimum entri versi lama yang dihapus (default: EYERIS_PREDICTION_CACHE_RETENTION_DAYS).",
+        )
+        parser.add_argument(
+            "--keep-version",
+            help="Versi model yang dipertahankan (default: versi model aktif di node ini).",
+        )
+
+    def handle(self, *args, **options):
+        keep = options["keep_version"] or model_registry.model_version()
+        deleted = prediction_cache.get_cache().prune(options["days"], keep_version=keep)
+        self.stdout.write(self.style.SUCCESS(
+            f"{deleted} entri cache dihapus (versi selain {keep}, lebih tua dari {options['days']:g} hari)"
+        ))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from core import rollups
+
+
+class Command(BaseCommand):
+    help = "Hitung ulang tabel rollup statistik screening dari EyePrediction."
+
+    def handle(self, *args, **options):
+        buckets = rollups.rebuild()
+        self.stdout.write(self.style.SUCCESS(f"Rollup dibangun ulang: {buckets} bucket"))
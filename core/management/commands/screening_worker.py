@@ -0,0 +1,64 @@
+import threading
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from core import jobs, metrics
+
+
+class Command(BaseCommand):
+    help = "Jalankan worker antrian screening (preprocessing -> inference -> analisis AI)."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--stage",
+            choices=["all", *jobs.ALL_STAGES],
+            default="all",
+            help="Stage yang dikerjakan worker ini (default: semua).",
+        )
+        parser.add_argument(
+            "--threads",
+            type=int,
+            default=1,
+            help="Jumlah thread worker; job inference dari beberapa thread digabung lewat micro-batching.",
+        )
+        parser.add_argument("--poll-interval", type=float, default=1.0, help="Jeda (detik) saat antrian kosong.")
+        parser.add_argument("--once", action="store_true", help="Berhenti setelah antrian kosong.")
+        parser.add_argument(
+            "--metrics-port",
+            type=int,
+            default=getattr(settings, 'EYERIS_WORKER_METRICS_PORT', 0),
+            help="Port HTTP /metrics untuk metrik stage di worker ini (0 = nonaktif).",
+        )
+
+    def handle(self, *args, **options):
+        stages = jobs.ALL_STAGES if options["stage"] == "all" else (options["stage"],)
+        stop = threading.Event()
+        totals = []
+        if options["metrics_port"]:
+            # /metrics di web tidak melihat stage yang dijalankan proses ini
+            server = metrics.serve(options["metrics_port"], token=getattr(settings, 'EYERIS_METRICS_TOKEN', None))
+            self.stdout.write(f"Metrik worker di :{server.server_port}/metrics")
+
+        def loop():
+            try:
+                totals.append(
+                    jobs.work(stages, poll_interval=options["poll_interval"], once=options["once"], stop_event=stop)
+                )
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=loop, daemon=True) for _ in range(max(1, options["threads"]))]
+        self.stdout.write(f"Worker screening jalan: stage={','.join(stages)} threads={len(threads)}")
+        for t in threads:
+            t.start()
+        try:
+            for t in threads:
+                while t.is_alive():
+                    t.join(timeout=0.5)
+        except KeyboardInterrupt:
+            stop.set()
+            for t in threads:
+                t.join()
+        self.stdout.write(self.style.SUCCESS(f"Selesai, {sum(totals)} stage diproses."))
@@ -0,0 +1,235 @@
+# core/metrics.py
+"""
+Instrumentasi ringan per proses (per worker): timer per stage screening,
+histogram durasi, counter token LLM, dan output teks Prometheus untuk /metrics.
+
+    with metrics.stage("predict"):
+        model.predict(batch)
+
+Durasi stage masuk ke histogram `eyeris_stage_seconds{stage="..."}` dan ke
+rincian request yang sedang berjalan, yang dipakai StageTimingMiddleware
+untuk log request lambat. Angka tidak digabung antar worker; Prometheus
+menjumlahkannya saat query.
+
+/metrics di aplikasi web hanya berisi metrik proses web itu. Stage screening
+async (preprocess, inference, predict, llm, ...) berjalan di `screening_worker`,
+yang mengekspor metriknya sendiri lewat serve() (`--metrics-port`,
+EYERIS_WORKER_METRICS_PORT); scrape keduanya.
+"""
+import hmac
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(pairs) -> str:
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in pairs) + '}'
+
+
+class Histogram:
+    def __init__(self, name, documentation, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        # key label (tuple pasangan) -> [count per bucket..., sum, count]
+        self._series = {}
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+                    break
+            series[-2] += value
+            series[-1] += 1
+
+    def collect(self):
+        with self._lock:
+            snapshot = {key: list(series) for key, series in self._series.items()}
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        for key, series in sorted(snapshot.items()):
+            cumulative = 0
+            for bound, n in zip(self.buckets, series):
+                cumulative += n
+                lines.append(f"{self.name}_bucket{_labels(key + (('le', repr(bound)),))} {cumulative}")
+            lines.append(f"{self.name}_bucket{_labels(key + (('le', '+Inf'),))} {series[-1]}")
+            lines.append(f"{self.name}_sum{_labels(key)} {series[-2]:.6f}")
+            lines.append(f"{self.name}_count{_labels(key)} {series[-1]}")
+        return lines
+
+
+class Counter:
+    def __init__(self, name, documentation):
+        self.name = name
+        self.documentation = documentation
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def inc(self, amount=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def collect(self):
+        with self._lock:
+            snapshot = dict(self._values)
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        lines.extend(f"{self.name}{_labels(key)} {value}" for key, value in sorted(snapshot.items()))
+        return lines
+
+
+_registry = []
+
+
+def _register(metric):
+    _registry.append(metric)
+    return metric
+
+
+STAGE_SECONDS = _register(Histogram(
+    'eyeris_stage_seconds',
+    'Durasi stage screening (save, preprocess, model_load, predict, inference, tta, saliency, llm, db_write, ...).',
+))
+REQUEST_SECONDS = _register(Histogram('eyeris_request_seconds', 'Durasi request per view.'))
+DB_QUERIES = _register(Histogram(
+    'eyeris_db_queries',
+    'Jumlah query database per request per view (lihat EYERIS_QUERY_BUDGETS).',
+    buckets=(1, 2, 4, 6, 8, 12, 16, 24, 32, 64),
+))
+LLM_REQUESTS = _register(Counter('eyeris_llm_requests_total', 'Jumlah panggilan LLM.'))
+LLM_TOKENS = _register(Counter('eyeris_llm_tokens_total', 'Token LLM dari usage_metadata response.'))
+LLM_SECONDS = _register(Histogram('eyeris_llm_seconds', 'Durasi satu panggilan LLM per profil (summary, qa).'))
+LLM_CALL_TOKENS = _register(Histogram(
+    'eyeris_llm_call_tokens',
+    'Token per panggilan LLM per profil dan jenis (input, output, reasoning).',
+    buckets=(64, 128, 256, 512, 1024, 2048, 4096, 8192),
+))
+QUALITY_CHECK_SECONDS = _register(Histogram(
+    'eyeris_quality_check_seconds',
+    'Durasi tiap cek kualitas gambar upload (decode, coverage, exposure, sharpness).',
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25),
+))
+QUALITY_RESULTS = _register(Counter(
+    'eyeris_quality_results_total',
+    'Hasil cek kualitas per gambar: pass atau alasan penolakan (coverage, dark, bright, contrast, blur, unreadable).',
+))
+LLM_REJECTED = _register(Counter('eyeris_llm_rejected_total', 'Permintaan LLM yang ditolak (rate_limited, busy, timeout).'))
+
+# rincian stage (ms) untuk request yang sedang berjalan; None di luar request
+_breakdown = ContextVar('eyeris_stage_breakdown', default=None)
+
+
+@contextmanager
+def stage(name):
+    """Ukur satu stage: masuk histogram dan rincian request (kalau ada)."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        STAGE_SECONDS.observe(elapsed, stage=name)
+        breakdown = _breakdown.get()
+        if breakdown is not None:
+            breakdown[name] = breakdown.get(name, 0.0) + elapsed * 1000
+
+
+@contextmanager
+def timed(histogram, **labels):
+    """Ukur durasi blok ke `histogram` dengan label tertentu (tanpa masuk rincian request)."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        histogram.observe(time.perf_counter() - started, **labels)
+
+
+def start_request():
+    """Mulai rincian stage untuk request ini; kembalikan (token, dict rincian)."""
+    breakdown = {}
+    return _breakdown.set(breakdown), breakdown
+
+
+def end_request(token):
+    _breakdown.reset(token)
+
+
+def record_llm_usage(resp, mode=None, profile='-'):
+    """
+    Catat token dari `resp.usage_metadata` (LangChain AIMessage, atau tiap chunk
+    stream — biasanya hanya chunk terakhir yang membawa usage). `mode` diisi
+    sekali per panggilan supaya jumlah request ikut terhitung.
+    """
+    if mode:
+        LLM_REQUESTS.inc(mode=mode, profile=profile)
+    usage = getattr(resp, 'usage_metadata', None) or {}
+    tokens = {
+        'input': usage.get('input_tokens'),
+        'output': usage.get('output_tokens'),
+        # gpt-oss: bagian output yang dipakai untuk reasoning
+        'reasoning': (usage.get('output_token_details') or {}).get('reasoning'),
+    }
+    for kind, count in tokens.items():
+        if count:
+            LLM_TOKENS.inc(count, kind=kind, profile=profile)
+            LLM_CALL_TOKENS.observe(count, kind=kind, profile=profile)
+    return usage
+
+
+def render() -> str:
+    """Semua metrik dalam format teks Prometheus (exposition format 0.0.4)."""
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.collect())
+    return '\n'.join(lines) + '\n'
+
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    token = None
+
+    def do_GET(self):
+        if self.path.split('?', 1)[0] not in ('/metrics', '/'):
+            self.send_error(404)
+            return
+        if self.token and not hmac.compare_digest(self.headers.get('Authorization', ''), f"Bearer {self.token}"):
+            self.send_error(403)
+            return
+        body = render().encode()
+        self.send_response(200)
+        self.send_header('Content-Type', CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # scrape tiap beberapa detik tidak perlu masuk log
+        pass
+
+
+def serve(port, host='0.0.0.0', token=None):
+    """
+    Ekspor render() lewat HTTP (GET /metrics) di thread daemon, untuk proses tanpa
+    Django HTTP (screening_worker). Kembalikan server-nya (server.server_port, shutdown()).
+    """
+    handler = type('MetricsHandler', (_MetricsHandler,), {'token': token})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='metrics-exporter', daemon=True).start()
+    return server
@@ -0,0 +1,94 @@
+# core/middleware.py
+import logging
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+from . import metrics, query_budget
+
+logger = logging.getLogger(__name__)
+
+
+class StageTimingMiddleware:
+    """
+    Ukur durasi tiap request (histogram per view) dan log request yang lebih
+    lambat dari EYERIS_SLOW_REQUEST_MS beserta rincian stage-nya
+    (save, preprocess, inference, llm, db_write, ... lihat metrics.stage).
+    Jumlah query per view juga dicatat dan dibandingkan dengan budget-nya
+    (lihat query_budget.py).
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        token, breakdown = metrics.start_request()
+        query_token, queries = query_budget.start(record=query_budget.strict())
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            query_budget.end(query_token)
+            self._finish(request, time.perf_counter() - started, breakdown)
+            metrics.end_request(token)
+            exceeded = self._check_queries(request, queries)
+        # di luar finally supaya tidak menimpa exception dari view
+        if exceeded:
+            raise query_budget.QueryBudgetExceeded(exceeded)
+        return response
+
+    async def __acall__(self, request):
+        token, breakdown = metrics.start_request()
+        query_token, queries = query_budget.start(record=query_budget.strict())
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            query_budget.end(query_token)
+            self._finish(request, time.perf_counter() - started, breakdown)
+            metrics.end_request(token)
+            exceeded = self._check_queries(request, queries)
+        # di luar finally supaya tidak menimpa exception dari view
+        if exceeded:
+            raise query_budget.QueryBudgetExceeded(exceeded)
+        return response
+
+    @staticmethod
+    def _view_name(request):
+        match = getattr(request, 'resolver_match', None)
+        # nama url (bukan path) supaya label histogram tidak meledak per ID
+        return (match.url_name or match.view_name) if match else 'unresolved'
+
+    def _finish(self, request, elapsed, breakdown):
+        view = self._view_name(request)
+        metrics.REQUEST_SECONDS.observe(elapsed, view=view)
+
+        threshold = getattr(settings, 'EYERIS_SLOW_REQUEST_MS', 2000)
+        if threshold and elapsed * 1000 >= threshold:
+            stages = ' '.join(f"{name}={ms:.0f}ms" for name, ms in sorted(breakdown.items(), key=lambda kv: -kv[1]))
+            logger.warning(
+                "Request lambat %s %s (%s): %.0f ms [%s]",
+                request.method, request.path, view, elapsed * 1000, stages or 'tanpa stage',
+            )
+
+    def _check_queries(self, request, queries):
+        """Catat jumlah query; kembalikan pesan kalau budget terlampaui dalam mode strict."""
+        view = self._view_name(request)
+        metrics.DB_QUERIES.observe(queries.count, view=view)
+        limit = query_budget.budget_for(view)
+        if limit is None or queries.count <= limit:
+            return None
+        if query_budget.strict():
+            return query_budget.describe(view, queries, limit)
+        logger.warning("Query budget terlampaui %s %s (%s): %d query, budget %d",
+                       request.method, request.path, view, queries.count, limit)
+        return None
@@ -0,0 +1,65 @@
+# Generated by Django 5.2.18 on 2026-10-17 15:53
+
+import hashlib
+
+import core.models
+import core.storage
+from django.db import migrations, models
+
+IMAGE_FIELDS = (("image1", "image1_hash"), ("image2", "image2_hash"))
+
+
+def backfill_image_hashes(apps, schema_editor):
+    # isi image*_hash pasien yang sudah ada supaya dedupe dan prediction cache bisa menemukannya;
+    # file tidak dipindah ke nama berbasis hash (itu tugas `manage.py dedupe_patient_images`)
+    Patient = apps.get_model('core', 'Patient')
+    for field, hash_field in IMAGE_FIELDS:
+        storage = Patient._meta.get_field(field).storage
+        rows = (
+            Patient.objects.filter(**{f"{hash_field}__isnull": True})
+            .exclude(**{field: ""})
+            .exclude(**{f"{field}__isnull": True})
+            .values_list('pk', field)
+        )
+        digests = {}
+        for name in {name for _, name in rows}:
+            if not storage.exists(name):
+                continue
+            h = hashlib.sha256()
+            with storage.open(name, 'rb') as fh:
+                for chunk in iter(lambda: fh.read(1024 * 1024), b''):
+                    h.update(chunk)
+            digests[name] = h.hexdigest()
+        for name, digest in digests.items():
+            Patient.objects.filter(**{field: name, f"{hash_field}__isnull": True}).update(**{hash_field: digest})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0002_screeningjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='patient',
+            name='image1_hash',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=64, null=True),
+        ),
+        migrations.AddField(
+            model_name='patient',
+            name='image2_hash',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=64, null=True),
+        ),
+        migrations.AlterField(
+            model_name='patient',
+            name='image1',
+            field=core.models.ContentHashImageField(blank=True, hash_field='image1_hash', null=True, storage=core.storage.ContentAddressedStorage(), upload_to='patients/'),
+        ),
+        migrations.AlterField(
+            model_name='patient',
+            name='image2',
+            field=core.models.ContentHashImageField(blank=True, hash_field='image2_hash', null=True, storage=core.storage.ContentAddressedStorage(), upload_to='patients/'),
+        ),
+        migrations.RunPython(backfill_image_hashes, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-17 15:54
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_patient_image_hash'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PredictionCacheEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('left_hash', models.CharField(max_length=64)),
+                ('right_hash', models.CharField(max_length=64)),
+                ('model_version', models.CharField(max_length=128)),
+                ('probabilities', models.JSONField()),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('left_hash', 'right_hash', 'model_version'), name='predictioncache_key_unique')],
+            },
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.2.18 on 2026-10-17 16:00
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_owner(apps, schema_editor):
+    # pasien lama: owner diambil dari user yang membuat job screening-nya
+    Patient = apps.get_model('core', 'Patient')
+    ScreeningJob = apps.get_model('core', 'ScreeningJob')
+    jobs = (
+        ScreeningJob.objects.filter(requested_by__isnull=False, patient__owner__isnull=True)
+        .values_list('patient_id', 'requested_by_id')
+    )
+    for patient_id, user_id in jobs.iterator():
+        Patient.objects.filter(pk=patient_id, owner__isnull=True).update(owner_id=user_id)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_importbatch'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='patient',
+            name='owner',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='patients', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='patient',
+            index=models.Index(fields=['owner', '-created_at', '-id'], name='patient_owner_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='patient',
+            index=models.Index(fields=['-created_at', '-id'], name='patient_created_idx'),
+        ),
+        migrations.RunPython(backfill_owner, migrations.RunPython.noop),
+    ]
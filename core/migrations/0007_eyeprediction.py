@@ -0,0 +1,73 @@
+# Generated by Django 5.2.18 on 2026-10-17 16:03
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+# salinan DISEASE_LABELS saat migration ini dibuat (jangan import dari kode aplikasi)
+LABELS = {
+    "Normal": 0,
+    "Diabetes": 1,
+    "Glaucoma": 2,
+    "Cataract": 3,
+    "Age related Macular Degeneration": 4,
+    "Hypertension": 5,
+    "Pathological Myopia": 6,
+    "Other diseases/abnormalities": 7,
+}
+EYES = {"Mata Kiri": "L", "Mata Kanan": "R"}
+
+
+def parse_prediction(text):
+    """'Mata Kiri: Glaucoma\\nMata Kanan: Normal' -> {'L': 2, 'R': 0}; baris yang tidak dikenal dilewati."""
+    result = {}
+    for line in (text or '').splitlines():
+        eye, _, label = line.partition(':')
+        eye, label = EYES.get(eye.strip()), LABELS.get(label.strip())
+        if eye and label is not None:
+            result[eye] = label
+    return result
+
+
+def backfill_eye_predictions(apps, schema_editor):
+    # data lama hanya punya teks prediksi: label saja, tanpa probabilitas/versi model
+    Patient = apps.get_model('core', 'Patient')
+    EyePrediction = apps.get_model('core', 'EyePrediction')
+    rows = []
+    patients = Patient.objects.exclude(prediction__isnull=True).exclude(prediction='')
+    for patient_id, prediction, created_at in patients.values_list('id', 'prediction', 'created_at').iterator():
+        for eye, label in parse_prediction(prediction).items():
+            rows.append(EyePrediction(patient_id=patient_id, eye=eye, label=label, created_at=created_at))
+        if len(rows) >= 1000:
+            EyePrediction.objects.bulk_create(rows, ignore_conflicts=True)
+            rows = []
+    EyePrediction.objects.bulk_create(rows, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_patient_owner_history_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EyePrediction',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('eye', models.CharField(choices=[('L', 'Mata Kiri'), ('R', 'Mata Kanan')], max_length=1)),
+                ('label', models.PositiveSmallIntegerField(choices=[(0, 'Normal'), (1, 'Diabetes'), (2, 'Glaucoma'), (3, 'Cataract'), (4, 'Age related Macular Degeneration'), (5, 'Hypertension'), (6, 'Pathological Myopia'), (7, 'Other diseases/abnormalities')])),
+                ('confidence', models.FloatField(blank=True, null=True)),
+                ('probabilities', models.JSONField(blank=True, null=True)),
+                ('model_version', models.CharField(blank=True, max_length=128, null=True)),
+                ('inference_ms', models.FloatField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('patient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='eye_predictions', to='core.patient')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['label', 'created_at'], name='eyeprediction_label_idx'), models.Index(fields=['created_at', 'label'], name='eyeprediction_created_idx')],
+                'constraints': [models.UniqueConstraint(fields=('patient', 'eye'), name='eyeprediction_patient_eye_unique')],
+            },
+        ),
+        migrations.RunPython(backfill_eye_predictions, migrations.RunPython.noop),
+    ]
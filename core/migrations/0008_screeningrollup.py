@@ -0,0 +1,60 @@
+# Generated by Django 5.2.18 on 2026-10-17 16:05
+
+from collections import Counter
+
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def age_band(age):
+    # salinan screening.age_band saat migration ini dibuat
+    try:
+        age = int(age)
+    except (TypeError, ValueError):
+        return "tidak diketahui"
+    if age >= 80:
+        return "80+"
+    low = (max(age, 0) // 10) * 10
+    return f"{low}-{low + 9}"
+
+
+def backfill_rollups(apps, schema_editor):
+    EyePrediction = apps.get_model('core', 'EyePrediction')
+    ScreeningRollup = apps.get_model('core', 'ScreeningRollup')
+    counts = Counter()
+    rows = EyePrediction.objects.values_list('created_at', 'label', 'eye', 'patient__gender', 'patient__age')
+    for created_at, label, eye, gender, age in rows.iterator():
+        counts[(timezone.localdate(created_at), label, eye, gender, age_band(age))] += 1
+    ScreeningRollup.objects.bulk_create(
+        [
+            ScreeningRollup(day=day, label=label, eye=eye, gender=gender, age_band=band, count=n)
+            for (day, label, eye, gender, band), n in counts.items()
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_eyeprediction'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ScreeningRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('label', models.PositiveSmallIntegerField(choices=[(0, 'Normal'), (1, 'Diabetes'), (2, 'Glaucoma'), (3, 'Cataract'), (4, 'Age related Macular Degeneration'), (5, 'Hypertension'), (6, 'Pathological Myopia'), (7, 'Other diseases/abnormalities')])),
+                ('eye', models.CharField(choices=[('L', 'Mata Kiri'), ('R', 'Mata Kanan')], max_length=1)),
+                ('gender', models.CharField(choices=[('M', 'Male'), ('F', 'Female'), ('O', 'Other')], max_length=1)),
+                ('age_band', models.CharField(max_length=16)),
+                ('count', models.IntegerField(default=0)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('day', 'label', 'eye', 'gender', 'age_band'), name='screeningrollup_bucket_unique')],
+            },
+        ),
+        migrations.RunPython(backfill_rollups, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-17 17:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_ratelimit_cache_table'),
+    ]
+
+    operations = [
+        migrations.RemoveConstraint(
+            model_name='predictioncacheentry',
+            name='predictioncache_key_unique',
+        ),
+        migrations.AddField(
+            model_name='predictioncacheentry',
+            name='variant',
+            field=models.CharField(default='off', max_length=32),
+        ),
+        migrations.AddField(
+            model_name='screeningjob',
+            name='tta_threshold',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddConstraint(
+            model_name='predictioncacheentry',
+            constraint=models.UniqueConstraint(fields=('left_hash', 'right_hash', 'model_version', 'variant'), name='predictioncache_key_unique'),
+        ),
+    ]
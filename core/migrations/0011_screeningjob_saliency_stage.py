@@ -0,0 +1,22 @@
+# Generated by Django 5.2.18 on 2026-10-17 16:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_predictioncacheentry_variant_screeningjob_tta_threshold'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='screeningjob',
+            name='stage',
+            field=models.CharField(choices=[('inference', 'Preprocessing & Inference'), ('analysis', 'Analisis AI'), ('saliency', 'Heatmap Saliency')], default='inference', max_length=16),
+        ),
+        migrations.AddConstraint(
+            model_name='screeningjob',
+            constraint=models.UniqueConstraint(condition=models.Q(('stage', 'saliency'), ('status__in', ['queued', 'running'])), fields=('patient',), name='screeningjob_pending_saliency_unique'),
+        ),
+    ]
@@ -0,0 +1,204 @@
+# core/model_export.py
+"""
+Export model Keras (pickle) ke format inference-only dan cek paritasnya.
+
+    tflite : TFLiteConverter, kuantisasi float16 / int8 (kalibrasi dari gambar contoh)
+    onnx   : tf2onnx, kuantisasi float16 (onnxconverter-common) / int8 statis (onnxruntime);
+             paketnya opsional, ada di requirements-optional.txt
+
+Layer GAM di model_custom hanya identity, jadi hilang saat graph di-trace;
+hasil export tidak butuh model_custom maupun TensorFlow saat dipakai.
+"""
+import importlib
+import multiprocessing
+import os
+import resource
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+from . import model_registry, preprocessing, runtimes
+
+FORMATS = tuple(runtimes.EXTENSIONS)
+QUANTIZATIONS = ('none', 'float16', 'int8')
+
+
+def calibration_images(pairs, limit=64):
+    """Array float32 (n, 224, 224, 3) dari pasangan gambar contoh, untuk kalibrasi int8."""
+    paths = [p for pair in pairs for p in pair][:limit]
+    return preprocessing.load_batch(paths, dtype=np.float32)
+
+
+def _atomic_write(path, data):
+    tmp = f"{path}.part"
+    with open(tmp, 'wb') as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+def export_tflite(model, output, quantize='none', calibration=None):
+    import tensorflow as tf
+
+    workdir = tempfile.mkdtemp(prefix='eyeris-export-')
+    try:
+        # lewat SavedModel: jalan untuk tf.keras maupun Keras 3
+        if hasattr(model, 'export'):
+            model.export(workdir)
+        else:
+            tf.saved_model.save(model, workdir)
+        converter = tf.lite.TFLiteConverter.from_saved_model(workdir)
+        if quantize in ('float16', 'int8'):
+            converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        if quantize == 'float16':
+            converter.target_spec.supported_types = [tf.float16]
+        elif quantize == 'int8':
+            # bobot + aktivasi int8, input/output tetap float32 (runtimes.TFLiteModel menerima keduanya)
+            converter.representative_dataset = lambda: ([img[None]] for img in calibration)
+        _atomic_write(output, converter.convert())
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return output
+
+
+OPTIONAL_REQUIREMENTS = 'requirements-optional.txt'
+
+
+def _require(module, package):
+    """Import modul export opsional; ImportError-nya menjelaskan paket yang perlu dipasang."""
+    try:
+        return importlib.import_module(module)
+    except ImportError as e:
+        raise ImportError(
+            f"{module} tidak terpasang: pip install {package} (atau pip install -r {OPTIONAL_REQUIREMENTS})"
+        ) from e
+
+
+def export_onnx(model, output, quantize='none', calibration=None):
+    import tensorflow as tf
+
+    # cek semua paket opsional dulu, sebelum konversi yang lama
+    onnx = _require('onnx', 'onnx')
+    tf2onnx = _require('tf2onnx', 'tf2onnx')
+    float16 = _require('onnxconverter_common.float16', 'onnxconverter-common') if quantize == 'float16' else None
+    quantization = _require('onnxruntime.quantization', 'onnxruntime') if quantize == 'int8' else None
+
+    spec = (tf.TensorSpec((None, *preprocessing.IMAGE_SIZE, 3), tf.float32, name='images'),)
+    proto, _ = tf2onnx.convert.from_keras(model, input_signature=spec, opset=17)
+
+    if quantize == 'float16':
+        proto = float16.convert_float_to_float16(proto, keep_io_types=True)
+    elif quantize == 'int8':
+        class _Reader(quantization.CalibrationDataReader):
+            def __init__(self):
+                self._images = iter(calibration)
+
+            def get_next(self):
+                img = next(self._images, None)
+                return None if img is None else {'images': img[None]}
+
+        fp32 = f"{output}.fp32"
+        onnx.save(proto, fp32)
+        try:
+            quantization.quantize_static(
+                fp32, f"{output}.part", _Reader(),
+                quant_format=quantization.QuantFormat.QDQ,
+                activation_type=quantization.QuantType.QInt8, weight_type=quantization.QuantType.QInt8,
+            )
+            os.replace(f"{output}.part", output)
+        finally:
+            os.remove(fp32)
+        return output
+
+    _atomic_write(output, proto.SerializeToString())
+    return output
+
+
+EXPORTERS = {
+    'onnx': export_onnx,
+    'tflite': export_tflite,
+}
+
+
+def export(source, fmt, output=None, quantize='none', calibration=None):
+    """Export pickle `source` ke `fmt`; default output di samping pickle (dipakai otomatis oleh registry)."""
+    if quantize == 'int8' and calibration is None:
+        raise ValueError("Kuantisasi int8 butuh gambar kalibrasi")
+    output = output or os.path.splitext(source)[0] + runtimes.EXTENSIONS[fmt]
+    model = model_registry._read_model(source)
+    return EXPORTERS[fmt](model, output, quantize=quantize, calibration=calibration)
+
+
+# ---- paritas + latency/memori ----
+
+def _measure(path, images, batch_sizes, repeat, queue):
+    try:
+        queue.put(_measure_model(path, images, batch_sizes, repeat))
+    except Exception as e:
+        queue.put({'path': path, 'error': repr(e)})
+
+
+def _measure_model(path, images, batch_sizes, repeat):
+    """Di proses terpisah: load model, predict semua gambar, ukur latency per ukuran batch dan RSS."""
+    started = time.perf_counter()
+    # proses spawn tanpa django.setup(): runtime export di-load langsung, pickle lewat registry
+    model = runtimes.load(path) if runtimes.backend_for(path) else model_registry._read_model(path)
+    model_registry.warm_up(model)
+    load_seconds = time.perf_counter() - started
+
+    probs = np.concatenate([
+        np.asarray(model.predict(images[i:i + 2]), dtype=np.float32) for i in range(0, len(images), 2)
+    ])
+    latency = {}
+    for size in batch_sizes:
+        batch = np.resize(images, (size, *images.shape[1:]))
+        model.predict(batch)
+        timings = []
+        for _ in range(repeat):
+            t = time.perf_counter()
+            model.predict(batch)
+            timings.append((time.perf_counter() - t) * 1000)
+        latency[size] = round(float(np.median(timings)), 3)
+
+    return {
+        'path': path,
+        'backend': runtimes.backend_for(path) or 'keras',
+        'size_mb': round(os.path.getsize(path) / 1e6, 2),
+        'load_seconds': round(load_seconds, 3),
+        'ms_per_batch': latency,
+        # ru_maxrss dalam KB di Linux
+        'peak_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        'probabilities': probs.tolist(),
+    }
+
+
+def compare(original, exported, images, batch_sizes=(2, 16), repeat=5):
+    """
+    Bandingkan model asli dan hasil export pada `images` (uint8, (n, 224, 224, 3)):
+    kesamaan label (argmax), selisih probabilitas, latency dan peak RSS. Tiap model
+    diukur di proses terpisah supaya RSS-nya tidak tercampur (spawn, karena fork
+    setelah TensorFlow ter-load bisa hang).
+    """
+    ctx = multiprocessing.get_context('spawn')
+    measured = []
+    for path in (original, exported):
+        queue = ctx.Queue()
+        proc = ctx.Process(target=_measure, args=(path, images, batch_sizes, repeat, queue))
+        proc.start()
+        result = queue.get()
+        proc.join()
+        if 'error' in result:
+            raise RuntimeError(f"Gagal mengukur {result['path']}: {result['error']}")
+        measured.append(result)
+
+    base, other = (np.asarray(m.pop('probabilities')) for m in measured)
+    diff = np.abs(base - other)
+    return {
+        'images': len(images),
+        'label_agreement': float(np.mean(base.argmax(axis=1) == other.argmax(axis=1))),
+        'max_abs_diff': round(float(diff.max()), 6),
+        'mean_abs_diff': round(float(diff.mean()), 6),
+        'original': measured[0],
+        'exported': measured[1],
+    }
@@ -0,0 +1,255 @@
+# core/model_registry.py
+"""
+Registry model klasifikasi fundus per-proses (per worker).
+
+Model di-load sekali lalu dipakai ulang oleh semua request. Kalau file pickle
+di disk berubah, model baru di-load + di-warm-up di samping model lama, lalu
+referensinya ditukar sekaligus (atomic), sehingga request tidak pernah
+memakai model yang baru setengah ter-load.
+
+Backend (EYERIS_MODEL_BACKEND): kalau ada hasil `manage.py export_model`
+di samping pickle (`model_1.onnx` / `model_1.tflite`) dan runtime-nya
+terpasang, model itu yang dipakai; kalau tidak, kembali ke pickle Keras.
+
+Kalau EYERIS_INFERENCE_SOCKET di-set, model tidak di-load di worker ini sama
+sekali: get_model() mengembalikan client ke daemon inference per node
+(lihat core/inference_daemon.py).
+"""
+import hashlib
+import logging
+import os
+import pickle
+import threading
+import time
+
+import joblib
+import numpy as np
+from django.conf import settings
+
+from . import metrics, runtimes
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MODEL_PATH = os.path.join(os.path.dirname(__file__), 'model', 'model_1.pkl')
+
+# bentuk input yang dipakai dashboard: batch 2 mata, 224x224 RGB uint8
+WARMUP_SHAPE = (2, 224, 224, 3)
+
+
+class LoadedModel:
+    """Snapshot model yang sudah siap dipakai (tidak diubah setelah dibuat)."""
+
+    def __init__(self, model, path, sha256, signature, load_seconds):
+        self.model = model
+        self.backend = runtimes.backend_for(path) or 'keras'
+        self.path = path
+        self.sha256 = sha256
+        self.signature = signature
+        self.load_seconds = load_seconds
+        self.loaded_at = time.time()
+
+    @property
+    def version(self):
+        return _version_name(self.path, self.sha256)
+
+    def info(self):
+        return {
+            "path": self.path,
+            "backend": self.backend,
+            "version": self.version,
+            "sha256": self.sha256,
+            "load_seconds": round(self.load_seconds, 3),
+            "loaded_at": self.loaded_at,
+        }
+
+
+_current = None
+_load_lock = threading.Lock()
+_last_check = 0.0
+# True di proses daemon inference: selalu load model sendiri walau socket di-set
+_local_only = False
+
+
+def use_local():
+    global _local_only
+    _local_only = True
+
+
+def is_remote() -> bool:
+    """Apakah inference dilayani daemon lewat EYERIS_INFERENCE_SOCKET."""
+    return bool(getattr(settings, 'EYERIS_INFERENCE_SOCKET', None)) and not _local_only
+
+
+def model_path() -> str:
+    """File model yang dipakai: hasil export untuk backend terpilih kalau ada, selain itu pickle Keras."""
+    path = getattr(settings, 'EYERIS_MODEL_PATH', None) or DEFAULT_MODEL_PATH
+    backend = getattr(settings, 'EYERIS_MODEL_BACKEND', 'auto')
+    if backend == 'keras' or runtimes.backend_for(path):
+        return path
+    for name in (('onnx', 'tflite') if backend == 'auto' else (backend,)):
+        exported = os.path.splitext(path)[0] + runtimes.EXTENSIONS[name]
+        if os.path.exists(exported) and runtimes.available(name):
+            return exported
+    return path
+
+
+def _signature(path):
+    st = os.stat(path)
+    return (st.st_mtime_ns, st.st_size)
+
+
+def _sha256(path) -> str:
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _version_name(path, sha256) -> str:
+    name = os.path.splitext(os.path.basename(path))[0]
+    return f"{name}-{sha256[:12]}"
+
+
+def file_version(path=None) -> str:
+    """Versi model dari file di disk (nama + sha256), tanpa me-load model."""
+    path = path or model_path()
+    return _version_name(path, _sha256(path))
+
+
+def _read_model(path):
+    if runtimes.backend_for(path):
+        return runtimes.load(path, getattr(settings, 'EYERIS_RUNTIME_THREADS', None))
+
+    # pastikan custom layer (GAM) sudah ter-register sebelum unpickle
+    from . import model_custom  # noqa: F401
+
+    try:
+        return joblib.load(path)
+    except Exception:
+        # fallback to pickle
+        with open(path, 'rb') as f:
+            return pickle.load(f)
+
+
+def warm_up(model):
+    """Jalankan batch dummy supaya graph TensorFlow sudah dibangun sebelum request pertama."""
+    dummy = np.zeros(WARMUP_SHAPE, dtype=np.uint8)
+    model.predict(dummy)
+
+
+def _build(path, warm=True) -> LoadedModel:
+    started = time.perf_counter()
+    signature = _signature(path)
+    sha256 = _sha256(path)
+    with metrics.stage("model_load"):
+        model = _read_model(path)
+    if warm:
+        with metrics.stage("warmup"):
+            warm_up(model)
+    loaded = LoadedModel(model, path, sha256, signature, time.perf_counter() - started)
+    logger.info("Model %s loaded in %.2fs", loaded.version, loaded.load_seconds)
+    return loaded
+
+
+def _reload_interval() -> float:
+    return float(getattr(settings, 'EYERIS_MODEL_RELOAD_INTERVAL', 5.0))
+
+
+def _maybe_reload():
+    """Cek (paling sering tiap EYERIS_MODEL_RELOAD_INTERVAL detik) apakah file model berubah."""
+    global _last_check
+    interval = _reload_interval()
+    now = time.monotonic()
+    if interval < 0 or now - _last_check < interval:
+        return
+    _last_check = now
+
+    current = _current
+    try:
+        # file berubah, atau backend lain jadi tersedia (mis. hasil export baru)
+        changed = model_path() != current.path or _signature(current.path) != current.signature
+    except OSError:
+        # file sedang diganti / hilang sementara: tetap pakai model lama
+        return
+    if changed:
+        reload()
+
+
+def get_loaded() -> LoadedModel:
+    """Kembalikan snapshot model aktif, load kalau belum ada."""
+    global _current
+    if _current is None:
+        with _load_lock:
+            if _current is None:
+                _current = _build(model_path())
+        return _current
+    _maybe_reload()
+    return _current
+
+
+def current():
+    """Snapshot model aktif tanpa memicu load (None kalau belum pernah di-load)."""
+    return _current
+
+
+def get_model():
+    if is_remote():
+        from . import inference_daemon
+
+        return inference_daemon.get_client()
+    return get_loaded().model
+
+
+def model_version() -> str:
+    if is_remote():
+        from . import inference_daemon
+
+        return inference_daemon.model_version()
+    return get_loaded().version
+
+
+def cached_version():
+    """
+    Versi model yang sudah diketahui proses ini, tanpa me-load model atau menghubungi
+    daemon (None kalau belum pernah); lihat juga file_version().
+    """
+    if is_remote():
+        from . import inference_daemon
+
+        return inference_daemon.cached_version()
+    return _current.version if _current is not None else None
+
+
+def reload(force=False) -> LoadedModel:
+    """
+    Load ulang model dari disk. Model lama tetap dipakai request lain sampai
+    model baru selesai di-load dan di-warm-up; kalau gagal, model lama dipertahankan.
+    """
+    global _current
+    with _load_lock:
+        current = _current
+        path = model_path()
+        if current is not None and not force:
+            try:
+                if path == current.path and _signature(path) == current.signature:
+                    return current
+            except OSError:
+                return current
+        try:
+            _current = _build(path)
+        except Exception:
+            if current is None:
+                raise
+            logger.exception("Reload model gagal, tetap memakai %s", current.version)
+        return _current
+
+
+def preload():
+    """Dipanggil dari CoreConfig.ready() supaya worker sudah hangat sebelum menerima request."""
+    if is_remote():
+        return
+    try:
+        get_loaded()
+    except Exception:
+        logger.exception("Warm-up model gagal; model akan di-load saat request pertama")
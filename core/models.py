@@ -1,6 +1,33 @@
+from django.conf import settings
 from django.db import models
 from django.utils import timezone
 
+from .screening import DISEASE_LABELS
+from .storage import content_hash, patient_image_storage
+
+
+class ContentHashImageField(models.ImageField):
+	"""ImageField yang juga mencatat sha256 isi file ke field lain (`hash_field`)."""
+
+	def __init__(self, *args, hash_field=None, **kwargs):
+		self.hash_field = hash_field
+		super().__init__(*args, **kwargs)
+
+	def deconstruct(self):
+		name, path, args, kwargs = super().deconstruct()
+		if self.hash_field:
+			kwargs["hash_field"] = self.hash_field
+		return name, path, args, kwargs
+
+	def pre_save(self, model_instance, add):
+		file = getattr(model_instance, self.attname)
+		if self.hash_field and file and not file._committed:
+			# hash dihitung sekali di sini lalu dipakai ulang oleh storage untuk nama file
+			digest = getattr(file.file, "content_hash", None) or content_hash(file.file)
+			file.file.content_hash = digest
+			setattr(model_instance, self.hash_field, digest)
+		return super().pre_save(model_instance, add)
+
 
 class Patient(models.Model):
 	GENDER_CHOICES = [
@@ -12,12 +39,222 @@ class Patient(models.Model):
 	name = models.CharField(max_length=255)
 	age = models.PositiveIntegerField()
 	gender = models.CharField(max_length=1, choices=GENDER_CHOICES)
-	image1 = models.ImageField(upload_to="patients/", null=True, blank=True)
-	image2 = models.ImageField(upload_to="patients/", null=True, blank=True)
+	image1 = ContentHashImageField(
+		upload_to="patients/", storage=patient_image_storage, hash_field="image1_hash", null=True, blank=True
+	)
+	image2 = ContentHashImageField(
+		upload_to="patients/", storage=patient_image_storage, hash_field="image2_hash", null=True, blank=True
+	)
+	# sha256 isi gambar; harus dideklarasikan setelah image1/image2 supaya terisi saat pre_save
+	image1_hash = models.CharField(max_length=64, null=True, blank=True, editable=False, db_index=True)
+	image2_hash = models.CharField(max_length=64, null=True, blank=True, editable=False, db_index=True)
 	prediction = models.CharField(max_length=255, null=True, blank=True)
 	created_at = models.DateTimeField(default=timezone.now)
+	# diisi kalau pasien berasal dari import massal (lihat bulk_import.py)
+	import_batch = models.ForeignKey(
+		"ImportBatch", on_delete=models.SET_NULL, null=True, blank=True, related_name="patients"
+	)
+	external_id = models.CharField(max_length=64, null=True, blank=True)
+	# user yang melakukan screening (riwayat per user)
+	owner = models.ForeignKey(
+		settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True, related_name="patients"
+	)
+
+	class Meta:
+		constraints = [
+			models.UniqueConstraint(fields=["import_batch", "external_id"], name="patient_import_external_id_unique"),
+		]
+		indexes = [
+			# keyset pagination riwayat: (created_at, id) menurun, per user dan global
+			models.Index(fields=["owner", "-created_at", "-id"], name="patient_owner_created_idx"),
+			models.Index(fields=["-created_at", "-id"], name="patient_created_idx"),
+		]
 
 	def __str__(self):
 		return f"{self.name} ({self.created_at.date()})"
 
+
+class ImportBatch(models.Model):
+	"""Satu import massal folder/ZIP berisi pasangan <id>_left.jpg / <id>_right.jpg."""
+	STATUS_QUEUED = "queued"
+	STATUS_RUNNING = "running"
+	STATUS_DONE = "done"
+	STATUS_FAILED = "failed"
+	STATUS_CHOICES = [
+		(STATUS_QUEUED, "Queued"),
+		(STATUS_RUNNING, "Running"),
+		(STATUS_DONE, "Done"),
+		(STATUS_FAILED, "Failed"),
+	]
+
+	source_path = models.CharField(max_length=500)
+	uploaded_by = models.ForeignKey(
+		settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True, related_name="import_batches"
+	)
+	status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=STATUS_QUEUED)
+	total_pairs = models.PositiveIntegerField(default=0)
+	imported = models.PositiveIntegerField(default=0)
+	# jumlah file: tanpa pasangan, atau pasangannya berisi gambar rusak/terlalu besar
+	skipped = models.PositiveIntegerField(default=0)
+	images_per_second = models.FloatField(null=True, blank=True)
+	error = models.TextField(null=True, blank=True)
+	created_at = models.DateTimeField(default=timezone.now)
+	updated_at = models.DateTimeField(auto_now=True)
+
+	def __str__(self):
+		return f"Import #{self.pk} {self.status} ({self.imported}/{self.total_pairs})"
+
+
+class ScreeningJob(models.Model):
+	"""Antrian job screening berbasis database (tanpa broker eksternal)."""
+	STAGE_INFERENCE = "inference"
+	STAGE_ANALYSIS = "analysis"
+	# job terpisah (bukan lanjutan analysis): heatmap saliency on-demand, lihat saliency.py
+	STAGE_SALIENCY = "saliency"
+	STAGE_CHOICES = [
+		(STAGE_INFERENCE, "Preprocessing & Inference"),
+		(STAGE_ANALYSIS, "Analisis AI"),
+		(STAGE_SALIENCY, "Heatmap Saliency"),
+	]
+
+	STATUS_QUEUED = "queued"
+	STATUS_RUNNING = "running"
+	STATUS_DONE = "done"
+	STATUS_FAILED = "failed"
+	STATUS_CHOICES = [
+		(STATUS_QUEUED, "Queued"),
+		(STATUS_RUNNING, "Running"),
+		(STATUS_DONE, "Done"),
+		(STATUS_FAILED, "Failed"),
+	]
+
+	patient = models.ForeignKey(Patient, on_delete=models.CASCADE, related_name="jobs")
+	requested_by = models.ForeignKey(
+		settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True, related_name="screening_jobs"
+	)
+	stage = models.CharField(max_length=16, choices=STAGE_CHOICES, default=STAGE_INFERENCE)
+	status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=STATUS_QUEUED)
+	attempts = models.PositiveSmallIntegerField(default=0)
+	ai_analysis = models.TextField(null=True, blank=True)
+	error = models.TextField(null=True, blank=True)
+	# durasi (ms) tiap stage, mis. {"preprocess_ms": 12.3, "inference_ms": 80.1, "analysis_ms": 2100}
+	timings = models.JSONField(default=dict, blank=True)
+	# ambang confidence TTA yang dipilih di request ini; null = EYERIS_TTA / EYERIS_TTA_THRESHOLD (lihat tta.py)
+	tta_threshold = models.FloatField(null=True, blank=True)
+	locked_by = models.CharField(max_length=64, null=True, blank=True)
+	locked_at = models.DateTimeField(null=True, blank=True)
+	created_at = models.DateTimeField(default=timezone.now)
+	updated_at = models.DateTimeField(auto_now=True)
+
+	class Meta:
+		constraints = [
+			# paling banyak satu job saliency yang antri/jalan per pasien (lihat jobs.enqueue_saliency)
+			models.UniqueConstraint(
+				fields=["patient"],
+				condition=models.Q(stage="saliency", status__in=["queued", "running"]),
+				name="screeningjob_pending_saliency_unique",
+			),
+		]
+		indexes = [
+			models.Index(fields=["status", "stage", "created_at"], name="screeningjob_queue_idx"),
+		]
+
+	@property
+	def is_finished(self):
+		return self.status in (self.STATUS_DONE, self.STATUS_FAILED)
+
+	def __str__(self):
+		return f"Job #{self.pk} {self.stage}/{self.status} ({self.patient_id})"
+
+
+class EyePrediction(models.Model):
+	"""
+	Hasil prediksi terstruktur per mata, untuk query statistik tanpa mem-parse
+	teks Patient.prediction (yang tetap dipakai untuk tampilan).
+	"""
+	EYE_LEFT = "L"
+	EYE_RIGHT = "R"
+	EYE_CHOICES = [
+		(EYE_LEFT, "Mata Kiri"),
+		(EYE_RIGHT, "Mata Kanan"),
+	]
+	LABEL_CHOICES = sorted(DISEASE_LABELS.items())
+
+	patient = models.ForeignKey(Patient, on_delete=models.CASCADE, related_name="eye_predictions")
+	eye = models.CharField(max_length=1, choices=EYE_CHOICES)
+	label = models.PositiveSmallIntegerField(choices=LABEL_CHOICES)
+	# probabilitas kelas hasil argmax; null untuk data lama hasil backfill dari teks
+	confidence = models.FloatField(null=True, blank=True)
+	probabilities = models.JSONField(null=True, blank=True)
+	model_version = models.CharField(max_length=128, null=True, blank=True)
+	# waktu predict per pasangan mata (ms); null kalau dari cache atau backfill
+	inference_ms = models.FloatField(null=True, blank=True)
+	# sama dengan Patient.created_at supaya agregasi per periode tidak perlu join
+	created_at = models.DateTimeField(default=timezone.now)
+
+	class Meta:
+		constraints = [
+			models.UniqueConstraint(fields=["patient", "eye"], name="eyeprediction_patient_eye_unique"),
+		]
+		indexes = [
+			# "berapa kasus glaucoma per bulan": filter label lalu range created_at
+			models.Index(fields=["label", "created_at"], name="eyeprediction_label_idx"),
+			# total per periode (pembagi untuk rate), cukup dari index
+			models.Index(fields=["created_at", "label"], name="eyeprediction_created_idx"),
+		]
+
+	def __str__(self):
+		return f"{self.patient_id}/{self.eye}: {self.get_label_display()}"
+
+	def top_k(self, k=3):
+		"""k kelas teratas beserta confidence; kosong untuk data backfill tanpa probabilitas."""
+		from .screening import top_k
+
+		return top_k(self.probabilities, k) if self.probabilities else []
+
+
+class ScreeningRollup(models.Model):
+	"""
+	Jumlah prediksi per hari per (label, mata, gender, kelompok umur).
+	Diperbarui setiap EyePrediction disimpan (lihat rollups.py), dibaca oleh API statistik.
+	"""
+	day = models.DateField()
+	label = models.PositiveSmallIntegerField(choices=EyePrediction.LABEL_CHOICES)
+	eye = models.CharField(max_length=1, choices=EyePrediction.EYE_CHOICES)
+	gender = models.CharField(max_length=1, choices=Patient.GENDER_CHOICES)
+	age_band = models.CharField(max_length=16)
+	count = models.IntegerField(default=0)
+
+	class Meta:
+		constraints = [
+			models.UniqueConstraint(
+				fields=["day", "label", "eye", "gender", "age_band"], name="screeningrollup_bucket_unique"
+			),
+		]
+
+	def __str__(self):
+		return f"{self.day} {self.get_label_display()}/{self.eye}/{self.gender}/{self.age_band}: {self.count}"
+
+
+class PredictionCacheEntry(models.Model):
+	"""Tingkat persisten dari prediction_cache: probabilitas per (gambar kiri, gambar kanan, versi model)."""
+	left_hash = models.CharField(max_length=64)
+	right_hash = models.CharField(max_length=64)
+	model_version = models.CharField(max_length=128)
+	# mode TTA saat predict (tta.cache_variant): off, always, auto-<ambang>
+	variant = models.CharField(max_length=32, default="off")
+	# list [[p_kelas0, ...], [p_kelas0, ...]] untuk mata kiri dan kanan
+	probabilities = models.JSONField()
+	created_at = models.DateTimeField(default=timezone.now)
+
+	class Meta:
+		constraints = [
+			models.UniqueConstraint(
+				fields=["left_hash", "right_hash", "model_version", "variant"], name="predictioncache_key_unique"
+			),
+		]
+
+	def __str__(self):
+		return f"{self.left_hash[:8]}/{self.right_hash[:8]} @ {self.model_version} ({self.variant})"
+
 # Create your models here.
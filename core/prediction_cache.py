@@ -0,0 +1,149 @@
+# core/prediction_cache.py
+"""
+Cache probabilitas hasil predict, dengan key (hash mata kiri, hash mata kanan,
+versi model, varian TTA — lihat tta.cache_variant).
+
+Dua tingkat:
+  1. LRU di memori per proses (dibatasi EYERIS_PREDICTION_CACHE_SIZE entri)
+  2. tabel PredictionCacheEntry di database, dipakai bersama semua worker
+
+Versi model ada di key, jadi hasil model lama tidak pernah dipakai untuk model
+baru. Saat versi berubah hanya LRU proses ini yang dikosongkan; entri database
+versi lama dibiarkan (worker lain mungkin masih memakai versi itu selama hot
+reload / rolling deploy) dan dihapus berdasarkan umur oleh
+`manage.py prune_prediction_cache`.
+"""
+import threading
+from collections import OrderedDict
+from datetime import timedelta
+
+import numpy as np
+from django.conf import settings
+from django.db import IntegrityError
+from django.utils import timezone
+
+from . import model_registry
+from .models import PredictionCacheEntry
+
+
+class PredictionCache:
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._version = None
+        self.counters = {"memory_hits": 0, "db_hits": 0, "misses": 0, "stores": 0, "invalidations": 0}
+
+    def _count(self, name):
+        with self._lock:
+            self.counters[name] += 1
+
+    def _check_version(self, version):
+        """Kosongkan LRU proses ini kalau versi model berubah sejak terakhir dipakai."""
+        if version == self._version:
+            return
+        with self._lock:
+            if version == self._version:
+                return
+            previous, self._version = self._version, version
+            self._entries.clear()
+            if previous is not None:
+                self.counters["invalidations"] += 1
+
+    def _remember(self, key, probs):
+        with self._lock:
+            self._entries[key] = probs
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get(self, left_hash, right_hash, version=None, variant='off'):
+        """Kembalikan array probabilitas (2, num_classes) atau None."""
+        if not left_hash or not right_hash:
+            return None
+        version = version or model_registry.model_version()
+        self._check_version(version)
+        key = (left_hash, right_hash, version, variant)
+
+        with self._lock:
+            probs = self._entries.get(key)
+            if probs is not None:
+                self._entries.move_to_end(key)
+                self.counters["memory_hits"] += 1
+                return probs
+
+        entry = (
+            PredictionCacheEntry.objects.filter(
+                left_hash=left_hash, right_hash=right_hash, model_version=version, variant=variant
+            )
+            .only("probabilities")
+            .first()
+        )
+        if entry is None:
+            self._count("misses")
+            return None
+        probs = np.asarray(entry.probabilities, dtype=np.float32)
+        self._remember(key, probs)
+        self._count("db_hits")
+        return probs
+
+    def set(self, left_hash, right_hash, probs, version=None, variant='off'):
+        if not left_hash or not right_hash:
+            return
+        probs = np.asarray(probs, dtype=np.float32)
+        if probs.ndim != 2:
+            # hanya output probabilitas per kelas yang di-cache
+            return
+        version = version or model_registry.model_version()
+        self._check_version(version)
+        self._remember((left_hash, right_hash, version, variant), probs)
+        try:
+            PredictionCacheEntry.objects.get_or_create(
+                left_hash=left_hash,
+                right_hash=right_hash,
+                model_version=version,
+                variant=variant,
+                defaults={"probabilities": probs.tolist()},
+            )
+        except IntegrityError:
+            # worker lain menyimpan entri yang sama bersamaan
+            pass
+        self._count("stores")
+
+    def prune(self, max_age_days, keep_version=None):
+        """
+        Hapus entri database versi model selain `keep_version` yang lebih tua
+        dari `max_age_days` hari. Kembalikan jumlah entri yang dihapus.
+        """
+        cutoff = timezone.now() - timedelta(days=max_age_days)
+        qs = PredictionCacheEntry.objects.filter(created_at__lt=cutoff)
+        if keep_version:
+            qs = qs.exclude(model_version=keep_version)
+        deleted, _ = qs.delete()
+        return deleted
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self.counters)
+            stats["memory_entries"] = len(self._entries)
+            stats["model_version"] = self._version
+        lookups = stats["memory_hits"] + stats["db_hits"] + stats["misses"]
+        stats["hit_rate"] = (stats["memory_hits"] + stats["db_hits"]) / lookups if lookups else 0.0
+        return stats
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache() -> PredictionCache:
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = PredictionCache(getattr(settings, 'EYERIS_PREDICTION_CACHE_SIZE', 1024))
+    return _cache
+
+
+def enabled() -> bool:
+    return getattr(settings, 'EYERIS_PREDICTION_CACHE', True)
@@ -0,0 +1,199 @@
+# core/preprocessing.py
+"""
+Preprocessing gambar fundus untuk inference.
+
+- JPEG besar (2000+ px) di-decode dengan draft mode, jadi libjpeg langsung
+  men-decode di skala 1/2, 1/4 atau 1/8 alih-alih resolusi penuh.
+- Hasil resize ditulis langsung ke buffer batch yang sudah dialokasikan
+  (uint8 atau float32), tanpa list array per gambar + np.stack.
+- Kedua mata bisa di-decode paralel di thread pool (PIL melepas GIL saat decode).
+"""
+import logging
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from django.conf import settings
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+IMAGE_SIZE = (224, 224)
+
+try:
+    RESAMPLE = Image.Resampling.LANCZOS
+except AttributeError:
+    # Pillow older versions
+    RESAMPLE = Image.LANCZOS
+
+
+def alloc_batch(n, dtype=np.uint8):
+    return np.empty((n, IMAGE_SIZE[1], IMAGE_SIZE[0], 3), dtype=dtype)
+
+
+_local = threading.local()
+
+
+def reusable_batch(n, dtype=np.uint8):
+    """
+    Buffer batch per-thread yang dipakai ulang antar request. Isinya ditimpa
+    pada panggilan berikutnya di thread yang sama, jadi jangan disimpan.
+    """
+    key = (n, np.dtype(dtype).str)
+    buffers = getattr(_local, 'buffers', None)
+    if buffers is None:
+        buffers = _local.buffers = {}
+    buf = buffers.get(key)
+    if buf is None:
+        buf = buffers[key] = alloc_batch(n, dtype)
+    return buf
+
+
+def open_rgb(source, size=IMAGE_SIZE):
+    """Decode gambar (path atau file-like) ke PIL RGB; JPEG langsung di skala terkecil yang masih >= `size`."""
+    with Image.open(source) as im:
+        im.draft('RGB', size)
+        return im.convert('RGB')
+
+
+def resize_into(im, out):
+    """Resize gambar RGB yang sudah di-decode ke 224x224 dan tulis ke `out`."""
+    out[...] = np.asarray(im.resize(IMAGE_SIZE, resample=RESAMPLE, reducing_gap=3.0))
+    return out
+
+
+def decode_into(source, out):
+    """Decode satu gambar (path atau file-like) dan tulis hasil 224x224 RGB ke `out`."""
+    return resize_into(open_rgb(source), out)
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=getattr(settings, 'EYERIS_PREPROCESS_THREADS', 2),
+                    thread_name_prefix='preprocess',
+                )
+    return _executor
+
+
+def load_batch(sources, out=None, dtype=np.uint8, parallel=True):
+    """
+    Decode semua `sources` ke satu array (n, 224, 224, 3).
+    Kalau `out` diberikan, hasil ditulis ke situ (harus shape yang sama).
+    """
+    sources = list(sources)
+    if out is None:
+        out = alloc_batch(len(sources), dtype)
+    elif out.shape[0] != len(sources):
+        raise ValueError(f"Buffer untuk {out.shape[0]} gambar, dapat {len(sources)} sumber")
+
+    if parallel and len(sources) > 1:
+        futures = [_get_executor().submit(decode_into, src, out[i]) for i, src in enumerate(sources)]
+        for f in futures:
+            f.result()
+    else:
+        for i, src in enumerate(sources):
+            decode_into(src, out[i])
+    return out
+
+
+# ---- hasil decode upload (lihat uploads.py) ----
+
+# gambar 224px yang sudah di-decode dari upload, per hash isi, supaya inference tidak
+# men-decode ulang file dari disk: di memori untuk screening inline di proses yang sama,
+# dan (shared=True) sebagai .npy di EYERIS_DECODED_DIR untuk `screening_worker` di proses lain
+_decoded = OrderedDict()
+_decoded_lock = threading.Lock()
+
+
+def decoded_dir() -> str:
+    return str(
+        getattr(settings, 'EYERIS_DECODED_DIR', None) or os.path.join(settings.MEDIA_ROOT, 'patients', 'decoded')
+    )
+
+
+def _decoded_path(key) -> str:
+    return os.path.join(decoded_dir(), key[:2], f"{key}.npy")
+
+
+def _decoded_ttl() -> float:
+    return float(getattr(settings, 'EYERIS_DECODED_TTL', 3600))
+
+
+def remember(key, image, shared=False):
+    limit = getattr(settings, 'EYERIS_DECODED_CACHE_SIZE', 32)
+    if not key or not limit:
+        return
+    with _decoded_lock:
+        _decoded[key] = image
+        _decoded.move_to_end(key)
+        while len(_decoded) > limit:
+            _decoded.popitem(last=False)
+    if shared:
+        path = _decoded_path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # tulis ke file sementara lalu rename, supaya worker tidak membaca file setengah jadi
+            fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.part')
+            with os.fdopen(fd, 'wb') as out:
+                np.save(out, image, allow_pickle=False)
+            os.replace(tmp, path)
+        except OSError:
+            # hanya optimasi: worker men-decode dari file gambar seperti biasa
+            logger.warning("Gagal menyimpan hasil decode %s", path, exc_info=True)
+
+
+def _load_shared(key):
+    path = _decoded_path(key)
+    try:
+        fresh = time.time() - os.path.getmtime(path) <= _decoded_ttl()
+        image = np.load(path, allow_pickle=False) if fresh else None
+        os.unlink(path)
+    except (OSError, ValueError):
+        return None
+    if image is None or image.shape != (IMAGE_SIZE[1], IMAGE_SIZE[0], 3) or image.dtype != np.uint8:
+        return None
+    return image
+
+
+def recall(key):
+    """Array (224, 224, 3) uint8 hasil remember(), atau None. Entri diambil sekali lalu dibuang."""
+    if not key:
+        return None
+    with _decoded_lock:
+        image = _decoded.pop(key, None)
+    if image is None:
+        return _load_shared(key)
+    try:
+        # salinan untuk proses lain tidak diperlukan lagi
+        os.unlink(_decoded_path(key))
+    except OSError:
+        pass
+    return image
+
+
+def prune_decoded(max_age=None):
+    """Hapus .npy hasil decode yang tidak pernah diambil worker (mis. job gagal); kembalikan jumlahnya."""
+    cutoff = time.time() - (_decoded_ttl() if max_age is None else max_age)
+    removed = 0
+    for root, _, files in os.walk(decoded_dir()):
+        for name in files:
+            path = os.path.join(root, name)
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    os.unlink(path)
+                    removed += 1
+            except OSError:
+                pass
+    return removed
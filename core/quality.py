@@ -0,0 +1,180 @@
+# core/quality.py
+"""
+Gerbang kualitas gambar fundus saat upload, sebelum decode penuh + inference + LLM.
+
+Semua cek dijalankan pada salinan kecil (QUALITY_SIZE px, decode JPEG lewat
+draft mode) dengan operasi numpy, jadi hanya beberapa milidetik per gambar:
+
+    coverage   : area fundus (piringan terang di latar hitam) cukup luas, bulat,
+                 dan sudut gambar gelap (foto biasa memenuhi seluruh frame)
+    brightness : bagian paling terang cukup terang, rata-rata luminans di dalam
+                 area fundus tidak terlalu gelap/terang
+    contrast   : simpangan baku luminans di dalam area fundus
+    sharpness  : varians Laplacian di dalam area fundus (rendah = blur)
+
+Ambang batas diatur lewat EYERIS_QUALITY_* di settings.
+"""
+import time
+
+import numpy as np
+from django.conf import settings
+from PIL import Image
+
+from . import metrics
+
+QUALITY_SIZE = 256
+
+# luminans di bawah ini dianggap latar hitam di luar piringan fundus
+_BACKGROUND_LEVEL = 20
+
+MESSAGES = {
+    'unreadable': "File tidak bisa dibaca sebagai gambar. Upload ulang foto fundus dalam format JPG/PNG.",
+    'coverage': (
+        "Gambar tidak terlihat seperti foto fundus (area retina bulat tidak terdeteksi). "
+        "Pastikan yang diupload adalah foto fundus dari kamera fundus, bukan foto biasa atau hasil crop."
+    ),
+    'dark': "Gambar terlalu gelap. Ulangi pengambilan dengan pencahayaan/flash kamera fundus yang cukup.",
+    'bright': "Gambar terlalu terang (overexposed). Ulangi pengambilan dengan intensitas flash lebih rendah.",
+    'contrast': "Kontras gambar terlalu rendah sehingga pembuluh darah tidak terlihat. Ulangi pengambilan gambar.",
+    'blur': "Gambar terlalu blur. Pastikan fokus kamera tepat dan pasien tidak bergerak, lalu ulangi pengambilan.",
+}
+
+
+class QualityError(ValueError):
+    def __init__(self, reason, details=None):
+        self.reason = reason
+        self.details = details or {}
+        super().__init__(MESSAGES[reason])
+
+
+def _luminance(source):
+    """
+    Baca gambar sebagai luminans float32 dengan sisi terpanjang <= QUALITY_SIZE.
+    `source` boleh PIL Image yang sudah di-decode (uploads.decode), supaya file tidak di-decode dua kali.
+    """
+    if isinstance(source, Image.Image):
+        im = source.convert('L')
+        im.thumbnail((QUALITY_SIZE, QUALITY_SIZE), Image.Resampling.BILINEAR, reducing_gap=2.0)
+        return np.asarray(im, dtype=np.float32)
+    if hasattr(source, 'seek'):
+        source.seek(0)
+    try:
+        with Image.open(source) as im:
+            im.draft('L', (QUALITY_SIZE, QUALITY_SIZE))
+            im = im.convert('L')
+            im.thumbnail((QUALITY_SIZE, QUALITY_SIZE), Image.Resampling.BILINEAR, reducing_gap=2.0)
+            return np.asarray(im, dtype=np.float32)
+    except (OSError, ValueError, Image.DecompressionBombError) as e:
+        raise QualityError('unreadable', {'error': str(e)}) from e
+    finally:
+        if hasattr(source, 'seek'):
+            source.seek(0)
+
+
+def _fundus_mask(lum):
+    """Mask piringan fundus + (coverage, roundness) terhadap lingkaran dengan luas dan pusat yang sama."""
+    mask = lum > _BACKGROUND_LEVEL
+    area = int(mask.sum())
+    if not area:
+        return mask, 0.0, 0.0
+    ys, xs = np.nonzero(mask)
+    cy, cx = ys.mean(), xs.mean()
+    # radius dari jarak rata-rata ke pusat (untuk piringan penuh = 2/3 r), tahan terhadap piringan terpotong tepi
+    radius = 1.5 * np.hypot(ys - cy, xs - cx).mean()
+    yy, xx = np.ogrid[:lum.shape[0], :lum.shape[1]]
+    disc = (yy - cy) ** 2 + (xx - cx) ** 2 <= radius ** 2
+    roundness = float(np.logical_and(mask, disc).sum() / np.logical_or(mask, disc).sum())
+    return mask, area / mask.size, roundness
+
+
+def _erode(mask, steps=3):
+    """Kecilkan mask beberapa piksel supaya tepi piringan tidak terhitung sebagai detail tajam."""
+    inner = mask.copy()
+    for _ in range(steps):
+        inner[1:-1, 1:-1] &= inner[:-2, 1:-1] & inner[2:, 1:-1] & inner[1:-1, :-2] & inner[1:-1, 2:]
+        inner[[0, -1], :] = False
+        inner[:, [0, -1]] = False
+    return inner
+
+
+def _laplacian_var(lum, mask):
+    lap = lum[:-2, 1:-1] + lum[2:, 1:-1] + lum[1:-1, :-2] + lum[1:-1, 2:] - 4 * lum[1:-1, 1:-1]
+    values = lap[mask[1:-1, 1:-1]]
+    return float(values.var()) if values.size else 0.0
+
+
+class _Timer:
+    """Catat durasi tiap cek ke metrik eyeris_quality_check_seconds{check=...}."""
+
+    def __init__(self):
+        self.last = time.perf_counter()
+
+    def lap(self, check):
+        now = time.perf_counter()
+        metrics.QUALITY_CHECK_SECONDS.observe(now - self.last, check=check)
+        self.last = now
+
+
+def measure(source) -> dict:
+    """Hitung semua nilai kualitas tanpa menolak (dipakai check() dan untuk kalibrasi ambang batas)."""
+    timer = _Timer()
+    lum = _luminance(source)
+    timer.lap('decode')
+    mask, coverage, roundness = _fundus_mask(lum)
+    timer.lap('coverage')
+    inside = lum[mask]
+    peak = float(np.percentile(lum, 99))
+    brightness = float(inside.mean()) if inside.size else 0.0
+    contrast = float(inside.std()) if inside.size else 0.0
+    timer.lap('exposure')
+    sharpness = _laplacian_var(lum, _erode(mask))
+    timer.lap('sharpness')
+    return {
+        'coverage': round(coverage, 3),
+        'roundness': round(roundness, 3),
+        'peak': round(peak, 1),
+        'brightness': round(brightness, 1),
+        'contrast': round(contrast, 1),
+        'sharpness': round(sharpness, 1),
+    }
+
+
+def _threshold(name, default):
+    return getattr(settings, f'EYERIS_QUALITY_{name}', default)
+
+
+def _reason(values):
+    # foto yang sangat gelap juga tidak punya piringan terang: laporkan sebagai gelap, bukan bukan-fundus
+    if values['peak'] < _threshold('MIN_PEAK', 60):
+        return 'dark'
+    if not _threshold('MIN_COVERAGE', 0.25) <= values['coverage'] <= _threshold('MAX_COVERAGE', 0.92):
+        return 'coverage'
+    if values['roundness'] < _threshold('MIN_ROUNDNESS', 0.9):
+        return 'coverage'
+    if values['brightness'] < _threshold('MIN_BRIGHTNESS', 35):
+        return 'dark'
+    if values['brightness'] > _threshold('MAX_BRIGHTNESS', 220):
+        return 'bright'
+    if values['contrast'] < _threshold('MIN_CONTRAST', 8):
+        return 'contrast'
+    if values['sharpness'] < _threshold('MIN_SHARPNESS', 4):
+        return 'blur'
+    return None
+
+
+def check(source) -> dict:
+    """
+    Cek satu gambar (path, file upload, atau PIL Image hasil decode). Kembalikan nilai-nilai kualitasnya,
+    atau raise QualityError berisi alasan + pesan yang bisa ditindaklanjuti user.
+    """
+    with metrics.stage("quality"):
+        try:
+            values = measure(source)
+        except QualityError as e:
+            metrics.QUALITY_RESULTS.inc(result=e.reason)
+            raise
+        reason = _reason(values)
+    metrics.QUALITY_RESULTS.inc(result=reason or 'pass')
+    if reason:
+        raise QualityError(reason, values)
+    return values
@@ -0,0 +1,123 @@
+# core/query_budget.py
+"""
+Hitung query database per request dan batasi jumlahnya untuk view yang sering dipanggil.
+
+Setiap koneksi baru dipasangi execute_wrapper (lihat CoreConfig.ready) yang
+menambah penghitung di ContextVar, jadi query dari thread sync_to_async ikut
+terhitung ke request async yang memanggilnya.
+
+- Middleware (StageTimingMiddleware) mencatat jumlah query per view ke
+  `eyeris_db_queries{view}` dan membandingkannya dengan EYERIS_QUERY_BUDGETS;
+  kalau lewat: warning, atau QueryBudgetExceeded kalau EYERIS_QUERY_BUDGET_STRICT
+  dinyalakan (opt-in, mis. saat development), jadi regresi N+1 langsung gagal.
+- Untuk test:
+
+      with query_budget(6):
+          client.get(reverse('history'))
+
+  atau `assert_view_budget(client.get, 'history', reverse('history'))`
+  yang memakai angka dari EYERIS_QUERY_BUDGETS.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+
+# batas default per nama url, dari hitungan terukur (lihat core/tests.py);
+# bisa ditimpa lewat settings.EYERIS_QUERY_BUDGETS
+DEFAULT_BUDGETS = {
+    # POST inline (EYERIS_SCREENING_ASYNC=0) paling berat: session + user, insert pasien
+    # + job, claim + cache lookup/insert, upsert EyePrediction + rollup (dengan savepoint),
+    # update job per stage; terukur 27-28
+    'dashboard': 28,
+    'history': 4,
+    'patient_thumbnail': 4,
+    # heatmap belum ada: cari versi (prediksi, job terakhir) lalu antrikan job di atomic();
+    # terukur 7 (PostgreSQL) / 8 (SQLite menjalankan BEGIN lewat cursor)
+    'patient_saliency': 8,
+    'job_status': 5,
+    'screening_stats': 10,
+    'inference_stats': 4,
+    # session + user (kalau login) + bucket rate limit di DatabaseCache (baca, hitung
+    # untuk culling, tulis); terukur 8 (login) / 6 (anonim)
+    'ai_answer': 8,
+    # seperti ai_answer (selalu login); terukur 9
+    'trigger_ai': 9,
+}
+
+
+class QueryBudgetExceeded(AssertionError):
+    """Jumlah query melebihi budget; pesan berisi daftar SQL-nya."""
+
+
+class QueryLog:
+    def __init__(self, record=False):
+        self.count = 0
+        self.record = record
+        self.queries = []
+
+
+# log yang sedang aktif (bisa bertumpuk: query_budget di test membungkus log middleware)
+_active = ContextVar('eyeris_query_logs', default=())
+
+
+def count_queries(execute, sql, params, many, context):
+    """execute_wrapper: hitung query ke semua log yang sedang aktif."""
+    for log in _active.get():
+        log.count += 1
+        if log.record:
+            log.queries.append(sql)
+    return execute(sql, params, many, context)
+
+
+def install(sender=None, connection=None, **kwargs):
+    """Handler sinyal connection_created: pasang penghitung di koneksi baru."""
+    if count_queries not in connection.execute_wrappers:
+        connection.execute_wrappers.append(count_queries)
+
+
+def start(record=False):
+    log = QueryLog(record)
+    return _active.set(_active.get() + (log,)), log
+
+
+def end(token):
+    _active.reset(token)
+
+
+def budget_for(view):
+    budgets = {**DEFAULT_BUDGETS, **(getattr(settings, 'EYERIS_QUERY_BUDGETS', None) or {})}
+    return budgets.get(view)
+
+
+def strict() -> bool:
+    # hanya True eksplisit; DEBUG di settings berupa string mentah dari env
+    return getattr(settings, 'EYERIS_QUERY_BUDGET_STRICT', False) is True
+
+
+def describe(label, log, limit):
+    lines = '\n'.join(f"  {i}. {sql}" for i, sql in enumerate(log.queries, 1))
+    return f"{label}: {log.count} query, budget {limit}" + (f"\n{lines}" if lines else '')
+
+
+@contextmanager
+def query_budget(limit, label='blok'):
+    """Gagal (QueryBudgetExceeded) kalau blok menjalankan lebih dari `limit` query."""
+    # koneksi yang sudah terbuka sebelum sinyal terpasang (mis. database test)
+    from django.db import connections
+
+    for conn in connections.all(initialized_only=True):
+        install(connection=conn)
+    token, log = start(record=True)
+    try:
+        yield log
+    finally:
+        end(token)
+    if log.count > limit:
+        raise QueryBudgetExceeded(describe(label, log, limit))
+
+
+def assert_view_budget(request, view, *args, **kwargs):
+    """Panggil `request(*args, **kwargs)` (mis. client.get) dalam budget view `view`; kembalikan response."""
+    with query_budget(budget_for(view), label=view):
+        return request(*args, **kwargs)
@@ -0,0 +1,188 @@
+# core/ratelimit.py
+"""
+Pembatas untuk endpoint yang memanggil LLM.
+
+- Token bucket per user (atau per IP untuk yang belum login), disimpan di
+  CACHES['ratelimit'] (DatabaseCache) supaya berlaku sama di semua worker.
+  Bucket berisi maksimal `burst` token dan terisi `rate_per_minute` token per menit;
+  tiap request memakai satu token.
+- Slots: batas jumlah panggilan yang berjalan bersamaan di satu proses, dipakai
+  baik dari thread (WSGI / screening_worker) maupun coroutine (ASGI).
+
+    @ratelimit.llm_rate_limit
+    def view(request): ...
+"""
+import asyncio
+import logging
+import math
+import threading
+import time
+from collections import deque
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DatabaseError
+from django.http import JsonResponse
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+
+def client_key(request) -> str:
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_authenticated:
+        return f"user:{user.pk}"
+    return f"ip:{request.META.get('REMOTE_ADDR', '')}"
+
+
+def hit(key, rate_per_minute, burst) -> float:
+    """
+    Ambil satu token dari bucket `key`. Kembalikan 0 kalau diizinkan, atau berapa
+    detik lagi token berikutnya tersedia. Baca-tulis cache tidak atomic, jadi
+    request yang benar-benar bersamaan bisa lolos satu-dua lebih banyak;
+    yang dicegah adalah burst panjang, bukan hitungan yang persis.
+    """
+    if rate_per_minute <= 0:
+        return 0.0
+    rate = rate_per_minute / 60.0
+    cache = caches['ratelimit']
+    cache_key = f"bucket:{key}"
+    now = time.time()
+    try:
+        tokens, updated = cache.get(cache_key) or (burst, now)
+        tokens = min(burst, tokens + (now - updated) * rate)
+        allowed = tokens >= 1
+        if allowed:
+            tokens -= 1
+        # simpan sampai bucket penuh lagi; setelah itu entry boleh hilang
+        cache.set(cache_key, (tokens, now), timeout=math.ceil((burst - tokens) / rate) + 1)
+    except DatabaseError:
+        # tabel cache belum dibuat / DB bermasalah: jangan ikut menjatuhkan endpoint
+        logger.warning("Rate limit dilewati: cache 'ratelimit' tidak bisa diakses", exc_info=True)
+        return 0.0
+    return 0.0 if allowed else (1 - tokens) / rate
+
+
+def _check(request):
+    return hit(
+        f"llm:{client_key(request)}",
+        getattr(settings, 'EYERIS_LLM_RATE_PER_MINUTE', 6),
+        getattr(settings, 'EYERIS_LLM_BURST', 3),
+    )
+
+
+def _limited(retry_after):
+    seconds = max(1, math.ceil(retry_after))
+    metrics.LLM_REJECTED.inc(reason='rate_limited')
+    response = JsonResponse(
+        {"error": f"Terlalu banyak permintaan AI, coba lagi dalam {seconds} detik.", "retry_after": seconds},
+        status=429,
+    )
+    response["Retry-After"] = str(seconds)
+    return response
+
+
+def llm_rate_limit(view):
+    """Decorator view (sync maupun async): 429 + Retry-After kalau bucket user/IP kosong."""
+    if iscoroutinefunction(view):
+        @wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            # request.user di-load lazy dari DB, jadi client_key juga dijalankan di thread
+            retry_after = await sync_to_async(_check)(request)
+            if retry_after:
+                return _limited(retry_after)
+            return await view(request, *args, **kwargs)
+    else:
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            retry_after = _check(request)
+            if retry_after:
+                return _limited(retry_after)
+            return view(request, *args, **kwargs)
+    return wrapper
+
+
+class Slots:
+    """
+    Semaphore yang bisa ditunggu dari thread maupun dari event loop, dengan satu
+    batas bersama. Coroutine menunggu lewat asyncio.Future (tanpa polling dan
+    tanpa memakai thread); slot yang dilepas diserahkan langsung ke penunggu
+    berikutnya, async lebih dulu.
+    """
+
+    def __init__(self, size):
+        self.size = max(1, int(size))
+        self._free = self.size
+        self._lock = threading.Lock()
+        self._threads = threading.Condition(self._lock)
+        self._thread_waiters = 0
+        # (loop, future) coroutine yang menunggu slot
+        self._async_waiters = deque()
+
+    def acquire(self, timeout=None) -> bool:
+        with self._lock:
+            if self._free > 0:
+                self._free -= 1
+                return True
+            self._thread_waiters += 1
+            try:
+                # release() menyerahkan slot dengan menaikkan _free lalu notify
+                acquired = self._threads.wait_for(lambda: self._free > 0, timeout=timeout)
+                if acquired:
+                    self._free -= 1
+                return acquired
+            finally:
+                self._thread_waiters -= 1
+
+    async def aacquire(self, timeout=None) -> bool:
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if self._free > 0:
+                self._free -= 1
+                return True
+            future = loop.create_future()
+            waiter = (loop, future)
+            self._async_waiters.append(waiter)
+        try:
+            await asyncio.wait_for(asyncio.shield(future), timeout)
+            return True
+        except (TimeoutError, asyncio.CancelledError):
+            with self._lock:
+                # slot bisa saja sudah diserahkan tepat saat batas waktu habis
+                handed_over = future.done() and not future.cancelled()
+                if not handed_over:
+                    future.cancel()
+                    try:
+                        self._async_waiters.remove(waiter)
+                    except ValueError:
+                        pass
+            if handed_over:
+                self.release()
+            if asyncio.current_task().cancelling():
+                raise
+            return False
+
+    def release(self):
+        with self._lock:
+            while self._async_waiters:
+                loop, future = self._async_waiters.popleft()
+                if future.cancelled():
+                    continue
+                # slot langsung milik coroutine ini; _free tidak naik
+                loop.call_soon_threadsafe(self._hand_over, future)
+                return
+            if self._free >= self.size:
+                raise ValueError("Slots dilepas lebih banyak dari yang diambil")
+            self._free += 1
+            if self._thread_waiters:
+                self._threads.notify()
+
+    def _hand_over(self, future):
+        if not future.done():
+            future.set_result(True)
+        else:
+            # penunggu sudah menyerah (timeout/cancel) sebelum slot sampai: lepas lagi
+            self.release()
@@ -0,0 +1,113 @@
+# core/rollups.py
+"""
+Rollup statistik screening.
+
+Setiap kali EyePrediction disimpan, jumlah di ScreeningRollup untuk bucket
+(hari, label, mata, gender, kelompok umur) ikut dinaikkan; prediksi ulang
+menurunkan bucket lama lebih dulu. API statistik cukup menjumlahkan baris
+rollup dalam rentang tanggal, jadi biayanya tidak tergantung jumlah Patient.
+
+`rebuild()` (manage.py rebuild_rollups) menghitung ulang semuanya dari
+EyePrediction kalau rollup perlu dibetulkan.
+"""
+from collections import Counter
+from datetime import timedelta
+
+from django.db import IntegrityError, transaction
+from django.db.models import F, Sum
+from django.utils import timezone
+
+from .models import EyePrediction, Patient, ScreeningRollup
+from .screening import DISEASE_LABELS, age_band
+
+
+def bucket(created_at, label, eye, gender, age):
+    return (timezone.localdate(created_at), label, eye, gender, age_band(age))
+
+
+def _key_fields(key):
+    day, label, eye, gender, band = key
+    return {'day': day, 'label': label, 'eye': eye, 'gender': gender, 'age_band': band}
+
+
+def apply(deltas):
+    """Tambahkan Counter {bucket: delta} ke tabel rollup (atomic per bucket)."""
+    for key, delta in deltas.items():
+        if not delta:
+            continue
+        fields = _key_fields(key)
+        if ScreeningRollup.objects.filter(**fields).update(count=F('count') + delta):
+            continue
+        try:
+            with transaction.atomic():
+                ScreeningRollup.objects.create(count=delta, **fields)
+        except IntegrityError:
+            # bucket baru saja dibuat oleh request lain
+            ScreeningRollup.objects.filter(**fields).update(count=F('count') + delta)
+
+
+def record(rows, previous=()):
+    """
+    rows: EyePrediction yang baru disimpan (dengan patient terisi);
+    previous: (patient, eye, label, created_at) yang ditimpa oleh rows.
+    """
+    deltas = Counter()
+    for patient, eye, label, created_at in previous:
+        deltas[bucket(created_at, label, eye, patient.gender, patient.age)] -= 1
+    for row in rows:
+        deltas[bucket(row.created_at, row.label, row.eye, row.patient.gender, row.patient.age)] += 1
+    apply(deltas)
+
+
+@transaction.atomic
+def rebuild():
+    """Hitung ulang seluruh rollup dari EyePrediction; kembalikan jumlah bucket."""
+    ScreeningRollup.objects.all().delete()
+    counts = Counter()
+    rows = EyePrediction.objects.values_list('created_at', 'label', 'eye', 'patient__gender', 'patient__age')
+    for created_at, label, eye, gender, age in rows.iterator(chunk_size=2000):
+        counts[bucket(created_at, label, eye, gender, age)] += 1
+    ScreeningRollup.objects.bulk_create(
+        [ScreeningRollup(count=n, **_key_fields(key)) for key, n in counts.items()],
+        batch_size=1000,
+    )
+    return len(counts)
+
+
+def summary(start=None, end=None):
+    """
+    Ringkasan prevalensi antara `start` dan `end` (date, inklusif; default 30 hari
+    terakhir): total per label, per gender, per kelompok umur dan per hari.
+    """
+    end = end or timezone.localdate()
+    start = start or end - timedelta(days=29)
+    qs = ScreeningRollup.objects.filter(day__gte=start, day__lte=end)
+
+    total = qs.aggregate(n=Sum('count'))['n'] or 0
+    by_label = dict(qs.values_list('label').annotate(n=Sum('count')).order_by())
+
+    def grouped(field):
+        out = {}
+        for key, label, n in qs.values_list(field, 'label').annotate(n=Sum('count')).order_by(field, 'label'):
+            out.setdefault(str(key), {})[DISEASE_LABELS.get(label, str(label))] = n
+        return out
+
+    return {
+        'start': start.isoformat(),
+        'end': end.isoformat(),
+        'total_eyes': total,
+        'by_label': [
+            {
+                'label': label,
+                'name': name,
+                'count': by_label.get(label, 0),
+                'rate': round(by_label.get(label, 0) / total, 4) if total else 0.0,
+            }
+            for label, name in sorted(DISEASE_LABELS.items())
+        ],
+        'by_gender': {
+            dict(Patient.GENDER_CHOICES).get(g, g): v for g, v in grouped('gender').items()
+        },
+        'by_age_band': grouped('age_band'),
+        'daily': grouped('day'),
+    }
@@ -0,0 +1,116 @@
+# core/runtimes.py
+"""
+Backend inference ringan untuk model hasil `manage.py export_model`.
+
+Masing-masing punya `predict(images)` seperti model Keras, jadi bisa langsung
+dipakai model_registry / micro-batcher:
+
+    onnx   : onnxruntime (CPUExecutionProvider)
+    tflite : tflite_runtime, atau tf.lite kalau hanya TensorFlow yang terpasang
+
+Runtime di-import saat model di-load, bukan saat modul ini di-import.
+"""
+import importlib.util
+import threading
+
+import numpy as np
+
+EXTENSIONS = {
+    'onnx': '.onnx',
+    'tflite': '.tflite',
+}
+
+
+def available(backend) -> bool:
+    """Apakah runtime untuk `backend` terpasang (tanpa meng-import-nya)."""
+    if backend == 'onnx':
+        return importlib.util.find_spec('onnxruntime') is not None
+    if backend == 'tflite':
+        return any(importlib.util.find_spec(m) is not None for m in ('tflite_runtime', 'tensorflow'))
+    return False
+
+
+def backend_for(path):
+    """Backend dari ekstensi file; None untuk pickle Keras."""
+    for backend, ext in EXTENSIONS.items():
+        if path.endswith(ext):
+            return backend
+    return None
+
+
+class OnnxModel:
+    backend = 'onnx'
+
+    def __init__(self, path, num_threads=None):
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+        self._session = ort.InferenceSession(path, sess_options=options, providers=['CPUExecutionProvider'])
+        self._input = self._session.get_inputs()[0]
+        # model float16 tanpa keep_io_types menerima input float16
+        self._dtype = np.float16 if self._input.type == 'tensor(float16)' else np.float32
+
+    def predict(self, images, **kwargs):
+        # session.run aman dipanggil dari banyak thread
+        feed = {self._input.name: np.asarray(images, dtype=self._dtype)}
+        return np.asarray(self._session.run(None, feed)[0], dtype=np.float32)
+
+
+class TFLiteModel:
+    backend = 'tflite'
+
+    def __init__(self, path, num_threads=None):
+        try:
+            from tflite_runtime.interpreter import Interpreter
+        except ImportError:
+            import tensorflow as tf
+
+            Interpreter = tf.lite.Interpreter
+        self._interpreter = Interpreter(model_path=path, num_threads=num_threads or None)
+        self._input = self._interpreter.get_input_details()[0]
+        self._output = self._interpreter.get_output_details()[0]
+        self._batch_size = None
+        # interpreter TFLite tidak thread-safe
+        self._lock = threading.Lock()
+
+    def _quantize(self, images):
+        dtype = self._input['dtype']
+        if np.issubdtype(dtype, np.integer):
+            scale, zero_point = self._input['quantization']
+            if scale:
+                images = np.round(images / scale + zero_point)
+            info = np.iinfo(dtype)
+            return np.clip(images, info.min, info.max).astype(dtype)
+        return images.astype(dtype)
+
+    def _dequantize(self, output):
+        if np.issubdtype(output.dtype, np.integer):
+            scale, zero_point = self._output['quantization']
+            if scale:
+                return (output.astype(np.float32) - zero_point) * scale
+        return output.astype(np.float32)
+
+    def predict(self, images, **kwargs):
+        images = np.asarray(images, dtype=np.float32)
+        with self._lock:
+            if self._batch_size != len(images):
+                shape = [len(images), *self._input['shape'][1:]]
+                self._interpreter.resize_tensor_input(self._input['index'], shape)
+                self._interpreter.allocate_tensors()
+                self._batch_size = len(images)
+            self._interpreter.set_tensor(self._input['index'], self._quantize(images))
+            self._interpreter.invoke()
+            output = self._interpreter.get_tensor(self._output['index'])
+        return self._dequantize(output)
+
+
+def load(path, num_threads=None):
+    backend = backend_for(path)
+    if backend == 'onnx':
+        return OnnxModel(path, num_threads)
+    if backend == 'tflite':
+        return TFLiteModel(path, num_threads)
+    raise ValueError(f"{path} bukan model hasil export (.onnx / .tflite)")
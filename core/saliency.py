@@ -0,0 +1,248 @@
+# core/saliency.py
+"""
+Heatmap saliency ("model melihat ke mana") per mata, di luar jalur request.
+
+Heatmap dibuat sekali per (hash gambar, versi model) lalu disimpan sebagai PNG
+overlay terkompresi di EYERIS_SALIENCY_DIR (default `media/patients/saliency/`,
+di samping image1/image2). Pembuatannya dikerjakan worker lewat stage job
+`saliency` (lihat jobs.py) atau `manage.py backfill_saliency`, tidak pernah di view.
+
+Metode:
+- gradient : |d p(kelas prediksi) / d input| untuk model Keras yang di-load di
+             proses ini, kedua mata dalam satu GradientTape.
+- occlusion: untuk runtime tanpa gradient (ONNX/TFLite/daemon inference),
+             turunnya probabilitas saat satu patch ditutup; semua varian
+             patch disusun jadi satu batch predict.
+"""
+import logging
+import multiprocessing
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from django.conf import settings
+from PIL import Image, ImageFilter
+
+from . import batching, metrics, model_registry, preprocessing, thumbnails
+from .models import ScreeningJob
+
+logger = logging.getLogger(__name__)
+
+# ukuran patch occlusion (224 / 32 = grid 7x7)
+OCCLUSION_PATCH = 32
+# blur heatmap gradient (px) supaya tidak berbintik
+SMOOTH_RADIUS = 4
+# warna palet PNG overlay
+PNG_COLORS = 128
+
+EYE_FIELDS = {'left': ('image1', 'image1_hash'), 'right': ('image2', 'image2_hash')}
+
+
+def saliency_dir() -> str:
+    return str(
+        getattr(settings, 'EYERIS_SALIENCY_DIR', None) or os.path.join(settings.MEDIA_ROOT, 'patients', 'saliency')
+    )
+
+
+def heatmap_path(key, version) -> str:
+    return os.path.join(saliency_dir(), version, key[:2], f"{key}.png")
+
+
+def eye_key(patient, eye) -> str:
+    field, hash_field = EYE_FIELDS[eye]
+    return thumbnails.thumbnail_key(getattr(patient, field), getattr(patient, hash_field))
+
+
+def known_versions(patient):
+    """
+    Versi model yang heatmap-nya dicari untuk pasien, tanpa me-load model, dari
+    yang paling murah: versi yang sudah diketahui proses ini
+    (model_registry.cached_version), versi model yang menghasilkan prediksi
+    pasien, lalu versi yang dipakai job saliency terakhir pasien itu.
+    Generator: query hanya dijalankan kalau versi sebelumnya tidak cocok.
+    """
+    seen = set()
+    candidates = (
+        lambda: model_registry.cached_version(),
+        lambda: patient.eye_predictions.order_by('-created_at').values_list('model_version', flat=True).first(),
+        lambda: (
+            ScreeningJob.objects.filter(
+                patient=patient, stage=ScreeningJob.STAGE_SALIENCY, status=ScreeningJob.STATUS_DONE,
+            ).order_by('-updated_at').values_list('timings', flat=True).first() or {}
+        ).get('saliency_version'),
+    )
+    for candidate in candidates:
+        version = candidate()
+        if version and version not in seen:
+            seen.add(version)
+            yield version
+
+
+def cached_path(patient, eye, versions=None):
+    """Path PNG heatmap untuk salah satu `versions` (default known_versions) kalau sudah ada, selain itu None."""
+    key = eye_key(patient, eye)
+    for version in known_versions(patient) if versions is None else versions:
+        path = heatmap_path(key, version)
+        if os.path.exists(path):
+            return path
+    return None
+
+
+def method() -> str:
+    """gradient kalau model Keras ada di proses ini, selain itu occlusion."""
+    if model_registry.is_remote() or model_registry.get_loaded().backend != 'keras':
+        return 'occlusion'
+    return 'gradient'
+
+
+def _normalize(maps):
+    # skala per gambar ke [0, 1]; persentil 99 supaya satu piksel ekstrem tidak meratakan sisanya
+    top = np.percentile(maps.reshape(len(maps), -1), 99, axis=1).reshape(-1, 1, 1)
+    return np.clip(maps / np.maximum(top, 1e-8), 0.0, 1.0).astype(np.float32)
+
+
+def _gradient_maps(images):
+    import tensorflow as tf
+
+    model = model_registry.get_loaded().model
+    inputs = tf.convert_to_tensor(np.asarray(images, dtype=np.float32))
+    with tf.GradientTape() as tape:
+        tape.watch(inputs)
+        probs = model(inputs, training=False)
+        target = tf.reduce_max(probs, axis=-1)
+    grads = _normalize(np.abs(tape.gradient(target, inputs).numpy()).max(axis=-1))
+    # blur PIL hanya untuk gambar 8-bit
+    smoothed = [
+        np.asarray(Image.fromarray((g * 255).astype(np.uint8)).filter(ImageFilter.GaussianBlur(SMOOTH_RADIUS)))
+        for g in grads
+    ]
+    return _normalize(np.stack(smoothed).astype(np.float32))
+
+
+def _occlusion_maps(images):
+    images = np.asarray(images)
+    n, h, w = images.shape[:3]
+    grid = [(y, x) for y in range(0, h, OCCLUSION_PATCH) for x in range(0, w, OCCLUSION_PATCH)]
+    variants = np.repeat(images[:, None], len(grid), axis=1)
+    fill = images.mean(axis=(1, 2)).astype(images.dtype)
+    for j, (y, x) in enumerate(grid):
+        variants[:, j, y:y + OCCLUSION_PATCH, x:x + OCCLUSION_PATCH] = fill[:, None, None]
+
+    # gambar asli + semua varian patch dalam satu predict
+    outputs = np.asarray(batching.predict(np.concatenate([images, variants.reshape(-1, h, w, 3)])))
+    base, occluded = outputs[:n], outputs[n:].reshape(n, len(grid), -1)
+    labels = base.argmax(axis=-1)
+    drop = base[np.arange(n), labels][:, None] - occluded[np.arange(n), :, labels]
+
+    rows, cols = -(-h // OCCLUSION_PATCH), -(-w // OCCLUSION_PATCH)
+    coarse = np.clip(drop, 0, None).reshape(n, rows, cols).astype(np.float32)
+    upsampled = [np.asarray(Image.fromarray(m).resize((w, h), Image.Resampling.BILINEAR)) for m in coarse]
+    return _normalize(np.stack(upsampled))
+
+
+def compute(images):
+    """Heatmap (n, 224, 224) di [0, 1] untuk kelas prediksi masing-masing gambar."""
+    with metrics.stage("saliency"):
+        return _gradient_maps(images) if method() == 'gradient' else _occlusion_maps(images)
+
+
+def overlay(image, heat):
+    """Gabungkan gambar (224, 224, 3) uint8 dengan heatmap: area penting diwarnai merah-kuning."""
+    heat = heat[..., None]
+    color = np.concatenate([np.ones_like(heat), heat, np.zeros_like(heat)], axis=-1) * 255
+    alpha = 0.6 * heat
+    blended = image.astype(np.float32) * (1 - alpha) + color * alpha
+    return Image.fromarray(blended.astype(np.uint8)).quantize(colors=PNG_COLORS)
+
+
+def _write_png(im, path):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # tulis ke file sementara lalu rename, sama seperti thumbnail
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.part')
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            im.save(out, 'PNG', optimize=True)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def render(items, version=None):
+    """
+    Buat heatmap untuk `items` [(key, path gambar), ...] dalam satu batch dan
+    simpan PNG-nya. Key yang sudah punya heatmap dilewati. Kembalikan jumlah PNG baru.
+    """
+    version = version or model_registry.model_version()
+    pending = [(key, path) for key, path in dict(items).items() if not os.path.exists(heatmap_path(key, version))]
+    if not pending:
+        return 0
+    images = preprocessing.load_batch([path for _, path in pending])
+    for (key, _), image, heat in zip(pending, images, compute(images)):
+        _write_png(overlay(image, heat), heatmap_path(key, version))
+    return len(pending)
+
+
+def patient_items(patient):
+    """[(key, path gambar), ...] untuk mata pasien yang gambarnya ada."""
+    return [
+        (eye_key(patient, eye), getattr(patient, field).path)
+        for eye, (field, _) in EYE_FIELDS.items()
+        if getattr(patient, field)
+    ]
+
+
+def generate(patient, version=None):
+    """Buat heatmap kedua mata pasien (dipanggil stage job `saliency`)."""
+    return render(patient_items(patient), version)
+
+
+# ---- backfill ----
+
+def _init_worker():
+    # spawn: proses baru perlu Django sendiri; fork setelah TensorFlow ter-load bisa hang
+    import django
+
+    django.setup()
+
+
+def _render_chunk(items, version):
+    try:
+        return render(items, version)
+    except Exception:
+        logger.exception("Heatmap gagal untuk %d gambar", len(items))
+        return 0
+
+
+def backfill(patients, chunk_size=16, workers=None, progress=None):
+    """
+    Buat heatmap yang belum ada untuk `patients` dengan process pool (tiap proses
+    me-load model sendiri). `progress(done, total)` dipanggil per chunk selesai.
+    Kembalikan (jumlah gambar yang perlu dibuat, jumlah PNG baru).
+    """
+    # proses induk hanya membagi pekerjaan: versi dibaca tanpa me-load model di sini
+    if model_registry.is_remote():
+        version = model_registry.cached_version() or model_registry.model_version()
+    else:
+        version = model_registry.cached_version() or model_registry.file_version()
+    items = {}
+    for patient in patients:
+        for key, path in patient_items(patient):
+            if key not in items and not os.path.exists(heatmap_path(key, version)):
+                items[key] = path
+    pending = list(items.items())
+    chunks = [pending[i:i + chunk_size] for i in range(0, len(pending), chunk_size)]
+    if not chunks:
+        return 0, 0
+
+    workers = workers or getattr(settings, 'EYERIS_SALIENCY_WORKERS', None) or min(os.cpu_count() or 1, 4)
+    created = done = 0
+    ctx = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=workers, mp_context=ctx, initializer=_init_worker) as pool:
+        for count in pool.map(_render_chunk, chunks, [version] * len(chunks)):
+            created += count
+            done += 1
+            if progress:
+                progress(done, len(chunks))
+    return len(pending), created
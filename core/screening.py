@@ -0,0 +1,156 @@
+# core/screening.py
+"""
+Langkah-langkah screening yang dipakai bersama oleh view dan worker job:
+baca gambar pasien -> array batch, lalu ubah output model jadi teks prediksi.
+"""
+import numpy as np
+
+from . import metrics, preprocessing
+
+# Mapping indeks prediksi ke nama penyakit
+DISEASE_LABELS = {
+    0: "Normal",
+    1: "Diabetes",
+    2: "Glaucoma",
+    3: "Cataract",
+    4: "Age related Macular Degeneration",
+    5: "Hypertension",
+    6: "Pathological Myopia",
+    7: "Other diseases/abnormalities"
+}
+
+
+def age_band(age) -> str:
+    """Kelompok umur per dekade (mis. 47 -> '40-49'), dipakai untuk prompt LLM, key cache dan rollup statistik."""
+    try:
+        age = int(age)
+    except (TypeError, ValueError):
+        return "tidak diketahui"
+    if age >= 80:
+        return "80+"
+    low = (max(age, 0) // 10) * 10
+    return f"{low}-{low + 9}"
+
+
+class ScreeningError(Exception):
+    """Error yang pesannya aman ditampilkan ke user."""
+
+
+def load_images(patient, out=None):
+    """
+    Buka image1 (kiri) dan image2 (kanan), konversi ke array (2, 224, 224, 3);
+    gambar yang sudah di-decode saat upload (preprocessing.recall) tidak di-decode lagi.
+    Tanpa `out`, hasil ditulis ke buffer per-thread yang dipakai ulang
+    (lihat preprocessing.reusable_batch) — salin kalau perlu disimpan.
+    """
+    fields = [getattr(patient, field) for field in ('image1', 'image2')]
+    if not all(fields):
+        raise ScreeningError('Gagal memproses gambar. Pastikan kedua gambar diupload.')
+    if out is None:
+        out = preprocessing.reusable_batch(len(fields))
+    try:
+        with metrics.stage("preprocess"):
+            # gambar yang baru diupload sudah di-decode saat validasi (uploads.handoff): tidak dibaca ulang dari disk
+            decoded = [preprocessing.recall(getattr(patient, f'{name}_hash')) for name in ('image1', 'image2')]
+            missing = [i for i, img in enumerate(decoded) if img is None]
+            if len(missing) == len(fields):
+                return preprocessing.load_batch([f.path for f in fields], out=out)
+            for i, img in enumerate(decoded):
+                if img is None:
+                    preprocessing.decode_into(fields[i].path, out[i])
+                else:
+                    out[i] = img
+            return out
+    except (OSError, ValueError) as e:
+        raise ScreeningError(f'Gagal memproses gambar: {e}')
+
+
+def format_prediction(hasil_prediksi) -> str:
+    """Ubah output model (probabilitas atau indeks) jadi teks 'Mata Kiri: ...\\nMata Kanan: ...'."""
+    try:
+        # Jika model mengembalikan probabilitas (mis. shape (n, num_classes)),
+        # ambil argmax sepanjang axis=1.
+        if hasattr(hasil_prediksi, 'ndim') and hasil_prediksi.ndim > 1 and hasil_prediksi.shape[-1] > 1:
+            y_pred = np.argmax(hasil_prediksi, axis=1)
+            # Konversi indeks ke nama penyakit dengan label mata kiri/kanan
+            disease_left = DISEASE_LABELS.get(int(y_pred[0]), f"Unknown ({y_pred[0]})")
+            disease_right = DISEASE_LABELS.get(int(y_pred[1]), f"Unknown ({y_pred[1]})") if len(y_pred) > 1 else "N/A"
+            return f"Mata Kiri: {disease_left}\nMata Kanan: {disease_right}"
+        # jika sudah berupa label 1D
+        if hasattr(hasil_prediksi, 'ndim') and hasil_prediksi.ndim == 1:
+            # Asumsikan ini adalah indeks, konversi ke nama penyakit
+            disease_names = [DISEASE_LABELS.get(int(val), f"Unknown ({val})") for val in hasil_prediksi.tolist()]
+            disease_left = disease_names[0] if len(disease_names) > 0 else "N/A"
+            disease_right = disease_names[1] if len(disease_names) > 1 else "N/A"
+            return f"Mata Kiri: {disease_left}\nMata Kanan: {disease_right}"
+        return str(hasil_prediksi)
+    except Exception:
+        # fallback stringify
+        return str(hasil_prediksi)
+
+
+def top_k(probabilities, k=3):
+    """[{label, name, confidence}, ...] untuk k kelas dengan probabilitas tertinggi."""
+    probs = np.asarray(probabilities, dtype=np.float32)
+    order = np.argsort(probs)[::-1][:k]
+    return [
+        {"label": int(i), "name": DISEASE_LABELS.get(int(i), f"Unknown ({i})"), "confidence": round(float(probs[i]), 4)}
+        for i in order
+    ]
+
+
+def prediction_rows(patient, hasil_prediksi, model_version=None, inference_ms=None):
+    """
+    Ubah output model jadi baris EyePrediction (kiri, kanan). Output berupa
+    probabilitas disimpan lengkap; output berupa indeks hanya menyimpan label.
+    """
+    from .models import EyePrediction
+
+    output = np.asarray(hasil_prediksi)
+    rows = []
+    for i, eye in enumerate((EyePrediction.EYE_LEFT, EyePrediction.EYE_RIGHT)[:len(output)]):
+        if output.ndim > 1 and output.shape[-1] > 1:
+            probs = output[i].astype(float)
+            label = int(np.argmax(probs))
+            confidence = float(probs[label])
+            probabilities = [round(p, 6) for p in probs.tolist()]
+        else:
+            label, confidence, probabilities = int(output[i]), None, None
+        rows.append(EyePrediction(
+            patient=patient,
+            eye=eye,
+            label=label,
+            confidence=confidence,
+            probabilities=probabilities,
+            model_version=model_version,
+            inference_ms=inference_ms,
+            created_at=patient.created_at,
+        ))
+    return rows
+
+
+def save_predictions(rows):
+    """
+    Simpan baris EyePrediction dan perbarui rollup statistik; prediksi ulang
+    (retry / model baru) menimpa baris lama.
+    """
+    from django.db import transaction
+
+    from . import rollups
+    from .models import EyePrediction
+
+    patients = {row.patient.pk: row.patient for row in rows}
+    with transaction.atomic():
+        previous = [
+            (patients[patient_id], eye, label, created_at)
+            for patient_id, eye, label, created_at in EyePrediction.objects.filter(
+                patient__in=list(patients)
+            ).values_list('patient_id', 'eye', 'label', 'created_at')
+        ]
+        EyePrediction.objects.bulk_create(
+            rows,
+            update_conflicts=True,
+            unique_fields=['patient', 'eye'],
+            update_fields=['label', 'confidence', 'probabilities', 'model_version', 'inference_ms'],
+        )
+        rollups.record(rows, previous)
@@ -0,0 +1,100 @@
+# core/storage.py
+"""
+Storage berbasis hash konten untuk gambar fundus.
+
+Nama file = sha256 isi file (mis. `patients/3fa9...c1.jpg`), jadi foto yang
+sama persis hanya disimpan sekali walaupun diupload berulang kali. Ekstensi
+diambil dari format gambar yang terdeteksi, bukan dari nama upload, supaya
+`foto.jpeg` dan `FOTO.JPG` dengan isi yang sama tetap menjadi satu file.
+"""
+import hashlib
+import os
+import uuid
+
+from django.core.files.base import File
+from PIL import Image
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+
+def content_hash(content) -> str:
+    """sha256 hex dari isi file (File/UploadedFile/file-like). Posisi baca dikembalikan ke awal."""
+    if not hasattr(content, 'chunks'):
+        content = File(content)
+    h = hashlib.sha256()
+    for chunk in content.chunks():
+        h.update(chunk)
+    content.seek(0)
+    return h.hexdigest()
+
+
+# format PIL -> ekstensi file; format lain memakai nama formatnya (huruf kecil)
+FORMAT_EXTENSIONS = {
+    'JPEG': '.jpg',
+    'MPO': '.jpg',
+    'TIFF': '.tif',
+}
+
+
+def image_extension(content, fallback=''):
+    """
+    Ekstensi dari format gambar (dibaca dari header saja, tanpa decode piksel).
+    `fallback` dipakai kalau isi bukan gambar yang dikenali PIL.
+    """
+    fmt = getattr(content, 'image_format', None)
+    if not fmt:
+        try:
+            with Image.open(content) as im:
+                fmt = im.format
+        except Exception:
+            fmt = None
+        finally:
+            content.seek(0)
+    if not fmt:
+        return fallback
+    return FORMAT_EXTENSIONS.get(fmt, f'.{fmt.lower()}')
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    FileSystemStorage yang menamai file dengan hash isinya.
+
+    Hash dan format gambar bisa sudah dihitung sebelumnya dan ditempel di atribut
+    `content_hash` / `image_format` milik file, supaya isi file tidak dibaca dua kali.
+    """
+
+    def hashed_name(self, name, digest, ext=None):
+        directory, basename = os.path.split(name)
+        if ext is None:
+            ext = os.path.splitext(basename)[1].lower()
+        return os.path.join(directory, f"{digest}{ext}").replace('\\', '/')
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        return super().save(self.content_name(name, content), content, max_length=max_length)
+
+    def content_name(self, name, content):
+        """Nama tujuan `content` di storage: direktori dari `name`, sha256 isi, ekstensi dari format gambar."""
+        digest = getattr(content, 'content_hash', None) or content_hash(content)
+        ext = image_extension(content, fallback=os.path.splitext(name)[1].lower())
+        return self.hashed_name(name, digest, ext)
+
+    def get_available_name(self, name, max_length=None):
+        # nama sudah unik per isi file; file yang sama boleh dipakai bersama
+        return name
+
+    def _save(self, name, content):
+        if self.exists(name):
+            return name
+        # tulis ke nama sementara lalu rename atomik, supaya upload bersamaan
+        # dengan isi yang sama tidak saling tabrak dan tidak ada file setengah jadi
+        tmp_name = super()._save(f"{name}.{uuid.uuid4().hex}.part", content)
+        os.replace(self.path(tmp_name), self.path(name))
+        return name
+
+
+patient_image_storage = ContentAddressedStorage()
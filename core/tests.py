@@ -1,3 +1,709 @@
-from django.test import TestCase
+import asyncio
+import hashlib
+import io
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+
+from . import (
+    ai_utils, batching, bulk_import, jobs, metrics, model_export, model_registry, prediction_cache, preprocessing,
+    quality, query_budget, ratelimit, rollups, saliency, screening, storage, tta,
+)
+from .management.commands.bench_screening import StubLLM
+from .models import Patient, PredictionCacheEntry, ScreeningJob, ScreeningRollup
+
+MEDIA_ROOT = tempfile.mkdtemp(prefix='eyeris-test-media-')
+
+
+def fundus_upload(name, color):
+    buffer = io.BytesIO()
+    Image.new('RGB', (256, 256), color).save(buffer, 'JPEG')
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/jpeg')
+
+
+class FakeModel:
+    """Model tiruan: baris hasil = rata-rata piksel tiap gambar, jadi bisa dicocokkan ke input."""
+
+    def __init__(self, gate=None):
+        self.calls = []
+        self.gate = gate
+
+    def predict(self, batch):
+        if self.gate is not None:
+            self.gate.wait()
+        self.calls.append(len(batch))
+        return batch.reshape(len(batch), -1).mean(axis=1, keepdims=True)
+
+
+class ModelRegistryTests(TransactionTestCase):
+    def setUp(self):
+        directory = tempfile.mkdtemp(prefix='eyeris-test-model-')
+        self.addCleanup(shutil.rmtree, directory, True)
+        self.path = os.path.join(directory, 'model_uji.pkl')
+        self.write(b'v1')
+        self.addCleanup(mock.patch.stopall)
+        mock.patch.object(model_registry, '_current', None).start()
+        mock.patch.object(model_registry, '_last_check', 0.0).start()
+        self.reads = mock.patch.object(model_registry, '_read_model', side_effect=lambda path: FakeModel()).start()
+        settings_override = override_settings(
+            EYERIS_MODEL_PATH=self.path, EYERIS_MODEL_BACKEND='keras',
+            EYERIS_MODEL_RELOAD_INTERVAL=0, EYERIS_INFERENCE_SOCKET=None,
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def write(self, content):
+        with open(self.path, 'wb') as f:
+            f.write(content)
+
+    def test_loaded_once_then_swapped_when_file_changes(self):
+        first = model_registry.get_loaded()
+        self.assertIs(model_registry.get_loaded(), first)
+        self.assertEqual(self.reads.call_count, 1)
+        self.assertTrue(first.version.startswith('model_uji-'))
+
+        self.write(b'v2 lebih panjang')
+        second = model_registry.get_loaded()
+        self.assertIsNot(second, first)
+        self.assertNotEqual(second.version, first.version)
+
+    def test_failed_reload_keeps_old_model(self):
+        first = model_registry.get_loaded()
+        self.reads.side_effect = RuntimeError('pickle rusak')
+        self.write(b'v2 rusak')
+        with self.assertLogs('core.model_registry', 'ERROR'):
+            self.assertIs(model_registry.get_loaded(), first)
+
+    def test_version_known_without_loading(self):
+        self.assertIsNone(model_registry.cached_version())
+        version = model_registry.file_version()
+        self.assertEqual(model_registry.get_loaded().version, version)
+        self.assertEqual(model_registry.cached_version(), version)
+
+
+class BatcherTests(TransactionTestCase):
+    def test_rows_split_back_to_callers(self):
+        model = FakeModel()
+        batcher = batching.InferenceBatcher(max_batch_size=5, max_wait_ms=200, model_getter=lambda: model)
+        sizes = (2, 2, 2)
+        futures = [batcher.submit(np.full((n, 4, 4, 3), i, dtype=np.uint8)) for i, n in enumerate(sizes)]
+        results = [f.result(timeout=5).ravel().tolist() for f in futures]
+        self.assertEqual(results, [[0.0, 0.0], [1.0, 1.0], [2.0, 2.0]])
+        # 2 + 2 muat dalam batas 5 baris; item ketiga dibawa ke batch berikutnya
+        self.assertEqual(model.calls, [4, 2])
+        stats = batcher.metrics()
+        self.assertEqual((stats['batches'], stats['rows'], stats['requests']), (2, 6, 3))
+
+    def test_predict_times_out(self):
+        gate = threading.Event()
+        self.addCleanup(gate.set)
+        batcher = batching.InferenceBatcher(max_wait_ms=0, model_getter=lambda: FakeModel(gate))
+        with self.assertRaises(TimeoutError):
+            batcher.predict(np.zeros((2, 4, 4, 3), dtype=np.uint8), timeout=0.05)
+
+    def test_model_error_reaches_caller(self):
+        def broken():
+            raise RuntimeError('model tidak ada')
+
+        batcher = batching.InferenceBatcher(max_wait_ms=0, model_getter=broken)
+        with self.assertRaisesMessage(RuntimeError, 'model tidak ada'):
+            batcher.predict(np.zeros((2, 4, 4, 3), dtype=np.uint8), timeout=5)
+
+    def test_submit_copies_caller_buffer(self):
+        gate = threading.Event()
+        batcher = batching.InferenceBatcher(max_wait_ms=0, model_getter=lambda: FakeModel(gate))
+        buffer = np.full((2, 4, 4, 3), 7, dtype=np.uint8)
+        future = batcher.submit(buffer)
+        # pemanggil yang sudah timeout memakai ulang buffer sebelum batch-nya diproses
+        buffer[:] = 9
+        gate.set()
+        self.assertEqual(future.result(timeout=5).ravel().tolist(), [7.0, 7.0])
+
+
+class ContentHashImageTests(TransactionTestCase):
+    def setUp(self):
+        self.media = tempfile.mkdtemp(prefix='eyeris-test-media-')
+        self.addCleanup(shutil.rmtree, self.media, True)
+        settings_override = override_settings(MEDIA_ROOT=self.media)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def stored_files(self):
+        return sorted(os.listdir(os.path.join(self.media, 'patients')))
+
+    def make_patient(self, name):
+        return Patient.objects.create(
+            name='Pasien', age=50, gender='M', image1=fundus_upload(name, (120, 40, 20)))
+
+    def test_same_photo_stored_once(self):
+        first, second = self.make_patient('kiri.jpg'), self.make_patient('ulang.jpg')
+        digest = hashlib.sha256(fundus_upload('x.jpg', (120, 40, 20)).read()).hexdigest()
+        self.assertEqual(first.image1_hash, digest)
+        self.assertEqual(first.image1.name, second.image1.name)
+        self.assertEqual(self.stored_files(), [f'{digest}.jpg'])
+
+    def test_dedupe_moves_legacy_names(self):
+        patient = self.make_patient('kiri.jpg')
+        # gambar lama sebelum storage berbasis hash: nama upload asli, hash kosong
+        os.rename(patient.image1.path, os.path.join(self.media, 'patients', 'lama.jpg'))
+        Patient.objects.filter(pk=patient.pk).update(image1='patients/lama.jpg', image1_hash=None)
+        call_command('dedupe_patient_images', stdout=io.StringIO())
+        patient.refresh_from_db()
+        self.assertEqual(patient.image1.name, f'patients/{patient.image1_hash}.jpg')
+        self.assertEqual(self.stored_files(), [f'{patient.image1_hash}.jpg'])
+
+
+class PredictionCacheTests(TransactionTestCase):
+    def test_new_model_version_keeps_old_entries(self):
+        cache = prediction_cache.PredictionCache(max_entries=8)
+        probs = np.eye(2, 8, dtype=np.float32)
+        cache.set('kiri', 'kanan', probs, version='v1')
+
+        np.testing.assert_array_equal(cache.get('kiri', 'kanan', version='v1'), probs)
+        self.assertIsNone(cache.get('kiri', 'kanan', version='v2'))
+        self.assertEqual(cache.stats()['invalidations'], 1)
+        self.assertEqual(cache.stats()['memory_entries'], 0)
+
+        # entri versi lama tetap di database untuk worker yang masih memakai v1
+        self.assertTrue(PredictionCacheEntry.objects.filter(model_version='v1').exists())
+        np.testing.assert_array_equal(cache.get('kiri', 'kanan', version='v1'), probs)
+        self.assertEqual(cache.stats()['db_hits'], 1)
+
+    def test_lru_is_bounded(self):
+        cache = prediction_cache.PredictionCache(max_entries=2)
+        for i in range(3):
+            cache.set(f'kiri{i}', 'kanan', np.zeros((2, 8)), version='v1')
+        self.assertEqual(cache.stats()['memory_entries'], 2)
+
+    def test_key_includes_tta_variant(self):
+        cache = prediction_cache.PredictionCache(max_entries=8)
+        probs = np.eye(2, 8, dtype=np.float32)
+        cache.set('kiri', 'kanan', probs, version='v1', variant='off')
+        self.assertIsNone(cache.get('kiri', 'kanan', version='v1', variant='auto-0.6'))
+        np.testing.assert_array_equal(cache.get('kiri', 'kanan', version='v1', variant='off'), probs)
+        self.assertFalse(PredictionCacheEntry.objects.filter(variant='auto-0.6').exists())
+
+
+class SingleFlightTests(TransactionTestCase):
+    def test_concurrent_calls_share_one_result(self):
+        flight = ai_utils.SingleFlight()
+        started, release = threading.Event(), threading.Event()
+        calls = []
+
+        def fn():
+            calls.append(1)
+            started.set()
+            release.wait(5)
+            return 'jawaban'
+
+        results = []
+        leader = threading.Thread(target=lambda: results.append(flight.do('k', fn)))
+        leader.start()
+        started.wait(5)
+        followers = [threading.Thread(target=lambda: results.append(flight.do('k', fn))) for _ in range(3)]
+        for t in followers:
+            t.start()
+        # beri waktu pengikut masuk ke do() sebelum panggilan pertama selesai
+        time.sleep(0.1)
+        release.set()
+        for t in [leader, *followers]:
+            t.join(5)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(sorted(results), [('jawaban', False)] + [('jawaban', True)] * 3)
+        # setelah selesai key dilepas: panggilan berikutnya menjalankan fungsi lagi
+        self.assertEqual(flight.do('k', lambda: 'baru'), ('baru', False))
+
+    def test_error_reaches_every_caller(self):
+        flight = ai_utils.SingleFlight()
+        started, release = threading.Event(), threading.Event()
+
+        def fn():
+            started.set()
+            release.wait(5)
+            raise RuntimeError('LLM gagal')
+
+        errors = []
+
+        def call():
+            try:
+                flight.do('k', fn)
+            except RuntimeError as e:
+                errors.append(str(e))
+
+        threads = [threading.Thread(target=call)]
+        threads[0].start()
+        started.wait(5)
+        threads.append(threading.Thread(target=call))
+        threads[1].start()
+        time.sleep(0.1)
+        release.set()
+        for t in threads:
+            t.join(5)
+        self.assertEqual(errors, ['LLM gagal', 'LLM gagal'])
+
+    def test_async_calls_coalesce(self):
+        flight = ai_utils.AsyncSingleFlight()
+        calls = []
+
+        async def fn():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return 'jawaban'
+
+        async def scenario():
+            return await asyncio.gather(*(flight.do('k', fn) for _ in range(3)))
+
+        results = asyncio.run(scenario())
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(sorted(shared for _, shared in results), [False, True, True])
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class BulkImportTests(TransactionTestCase):
+    def setUp(self):
+        self.source = tempfile.mkdtemp(prefix='eyeris-test-import-')
+        self.addCleanup(shutil.rmtree, self.source, ignore_errors=True)
+        for name, color in (('1_left.jpg', (120, 40, 20)), ('1_right.jpg', (110, 50, 30))):
+            Image.new('RGB', (256, 256), color).save(os.path.join(self.source, name), 'JPEG')
+        with open(os.path.join(self.source, '2_left.jpg'), 'wb') as f:
+            f.write(b'bukan gambar')
+        Image.new('RGB', (256, 256)).save(os.path.join(self.source, '2_right.jpg'), 'JPEG')
+
+    def stored_files(self):
+        return sorted(os.listdir(os.path.join(MEDIA_ROOT, 'patients'))) if os.path.isdir(
+            os.path.join(MEDIA_ROOT, 'patients')) else []
+
+    def test_corrupt_pair_is_skipped_without_saving(self):
+        before = self.stored_files()
+        self.assertIsNone(bulk_import._process_pair(self.source, '2_left.jpg', '2_right.jpg'))
+        self.assertEqual(self.stored_files(), before)
+        left, right = bulk_import._process_pair(self.source, '1_left.jpg', '1_right.jpg')
+        self.assertEqual(left[2].shape, (224, 224, 3))
+
+    @override_settings(EYERIS_UPLOAD_MAX_PIXELS=100 * 100)
+    def test_pixel_cap_matches_uploads(self):
+        self.assertIsNone(bulk_import._process_pair(self.source, '1_left.jpg', '1_right.jpg'))
+
+
+@override_settings(EYERIS_HISTORY_PAGE_SIZE=2)
+class HistoryCursorTests(TransactionTestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('dokter', password='rahasia-123')
+        self.client.force_login(self.user)
+
+    def make_patient(self, owner, created_at=None):
+        return Patient.objects.create(
+            owner=owner, name='Pasien', age=50, gender='M', created_at=created_at or timezone.now())
+
+    def test_pages_cover_every_patient_once(self):
+        now = timezone.now()
+        # tiga pasien dengan created_at sama: urutan di antara mereka ditentukan id
+        patients = [self.make_patient(self.user, now - timedelta(minutes=m)) for m in (1, 0, 0, 2, 0)]
+        self.make_patient(User.objects.create_user('lain'))
+        expected = [p.pk for p in sorted(patients, key=lambda p: (p.created_at, p.pk), reverse=True)]
+
+        seen, params = [], {}
+        for _ in range(len(patients)):
+            response = self.client.get(reverse('history'), params)
+            seen += [p.pk for p in response.context['patients']]
+            if not response.context['next_cursor']:
+                break
+            params = {'cursor': response.context['next_cursor']}
+        self.assertEqual(seen, expected)
+
+    def test_invalid_cursor_shows_first_page(self):
+        self.make_patient(self.user)
+        response = self.client.get(reverse('history'), {'cursor': 'bukan-cursor!'})
+        self.assertTrue(response.context['is_first_page'])
+        self.assertEqual(len(response.context['patients']), 1)
+
+
+class StorageTests(TransactionTestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp(prefix='eyeris-test-storage-')
+        self.addCleanup(shutil.rmtree, self.root, True)
+        self.storage = storage.ContentAddressedStorage(location=self.root)
+
+    def test_extension_follows_image_format(self):
+        blob = fundus_upload('a.jpg', (120, 40, 20)).read()
+        names = {self.storage.save(f'patients/{name}', io.BytesIO(blob)) for name in ('a.jpg', 'b.jpeg', 'c.JPG')}
+        self.assertEqual(len(names), 1)
+        self.assertTrue(names.pop().endswith('.jpg'))
+        self.assertEqual(len(os.listdir(os.path.join(self.root, 'patients'))), 1)
+
+        buffer = io.BytesIO()
+        Image.new('RGB', (8, 8)).save(buffer, 'PNG')
+        self.assertTrue(self.storage.save('patients/salah.jpg', buffer).endswith('.png'))
+
+
+class RollupTests(TransactionTestCase):
+    def counts(self):
+        return {
+            (row.label, row.eye): row.count
+            for row in ScreeningRollup.objects.all()
+            if row.count
+        }
+
+    def test_repredict_moves_counts_between_buckets(self):
+        patient = Patient.objects.create(name='Pasien', age=61, gender='F')
+        normal = np.tile(np.eye(1, 8, 0, dtype=np.float32), (2, 1))
+        screening.save_predictions(screening.prediction_rows(patient, normal, model_version='v1'))
+        self.assertEqual(self.counts(), {(0, 'L'): 1, (0, 'R'): 1})
+
+        # prediksi ulang mata kiri jadi Glaucoma: bucket lama turun, bucket baru naik
+        retry = np.stack([np.eye(1, 8, 2, dtype=np.float32)[0], normal[1]])
+        screening.save_predictions(screening.prediction_rows(patient, retry, model_version='v2'))
+        self.assertEqual(self.counts(), {(0, 'R'): 1, (2, 'L'): 1})
+
+        summary = rollups.summary()
+        self.assertEqual(summary['total_eyes'], 2)
+        self.assertEqual({row['label']: row['count'] for row in summary['by_label'] if row['count']}, {0: 1, 2: 1})
+        self.assertEqual(summary['by_age_band'], {'60-69': {'Normal': 1, 'Glaucoma': 1}})
+
+        before = self.counts()
+        rollups.rebuild()
+        self.assertEqual(self.counts(), before)
+
+
+class MetricsTests(TransactionTestCase):
+    def test_web_metrics_require_token_or_staff(self):
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 403)
+        with override_settings(EYERIS_METRICS_TOKEN='rahasia'):
+            response = self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer rahasia')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'# TYPE eyeris_stage_seconds histogram', response.content)
+
+    def test_worker_exporter_serves_stage_histograms(self):
+        # stage yang dijalankan screening_worker (bukan di request web)
+        with metrics.stage('worker_test_stage'):
+            pass
+        server = metrics.serve(0, host='127.0.0.1', token='rahasia')
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        url = f'http://127.0.0.1:{server.server_port}/metrics'
+        with self.assertRaises(urllib.error.HTTPError):
+            urllib.request.urlopen(url, timeout=5)
+        request = urllib.request.Request(url, headers={'Authorization': 'Bearer rahasia'})
+        with urllib.request.urlopen(request, timeout=5) as response:
+            body = response.read().decode()
+        self.assertIn('eyeris_stage_seconds_count{stage="worker_test_stage"} 1', body)
+
+
+class ModelExportTests(TransactionTestCase):
+    def test_missing_optional_package_explains_install(self):
+        with mock.patch.dict('sys.modules', {'onnxconverter_common': None, 'onnxconverter_common.float16': None}):
+            with self.assertRaisesMessage(ImportError, 'pip install onnxconverter-common'):
+                model_export._require('onnxconverter_common.float16', 'onnxconverter-common')
+
+
+class RateLimitTests(TransactionTestCase):
+    def setUp(self):
+        caches['ratelimit'].clear()
+
+    def test_token_bucket_refills(self):
+        # patch time.time global juga dipakai DatabaseCache untuk expiry, jadi mulai dari waktu nyata
+        now = [time.time()]
+        with mock.patch('core.ratelimit.time.time', side_effect=lambda: now[0]):
+            self.assertEqual(ratelimit.hit('uji', rate_per_minute=60, burst=2), 0)
+            self.assertEqual(ratelimit.hit('uji', rate_per_minute=60, burst=2), 0)
+            self.assertAlmostEqual(ratelimit.hit('uji', rate_per_minute=60, burst=2), 1.0)
+            # bucket lain tidak ikut habis
+            self.assertEqual(ratelimit.hit('lain', rate_per_minute=60, burst=2), 0)
+            now[0] += 1.0
+            self.assertEqual(ratelimit.hit('uji', rate_per_minute=60, burst=2), 0)
+        self.assertEqual(ratelimit.hit('uji', rate_per_minute=0, burst=0), 0)
+
+    def test_slots_thread_waiter_gets_released_slot(self):
+        slots = ratelimit.Slots(1)
+        self.assertTrue(slots.acquire())
+        self.assertFalse(slots.acquire(timeout=0.01))
+        acquired = []
+        waiter = threading.Thread(target=lambda: acquired.append(slots.acquire(timeout=5)))
+        waiter.start()
+        slots.release()
+        waiter.join(5)
+        self.assertEqual(acquired, [True])
+        slots.release()
+        with self.assertRaises(ValueError):
+            slots.release()
+
+    def test_slots_handed_to_coroutine(self):
+        slots = ratelimit.Slots(1)
+
+        async def scenario():
+            self.assertTrue(await slots.aacquire())
+            self.assertFalse(await slots.aacquire(timeout=0.01))
+            waiter = asyncio.ensure_future(slots.aacquire(timeout=5))
+            await asyncio.sleep(0)
+            slots.release()
+            self.assertTrue(await waiter)
+            # slot diserahkan langsung, tidak pernah kembali ke pool
+            self.assertFalse(slots.acquire(timeout=0))
+            slots.release()
+
+        asyncio.run(scenario())
+        self.assertTrue(slots.acquire(timeout=0))
+
+
+def fundus_disc(fill, size=256, radius=100):
+    """PNG piringan terang di latar hitam; `fill(yy, xx)` memberi luminans di dalam piringan."""
+    yy, xx = np.mgrid[:size, :size]
+    inside = (yy - size // 2) ** 2 + (xx - size // 2) ** 2 <= radius ** 2
+    lum = np.zeros((size, size), dtype=np.float32)
+    lum[inside] = fill(yy, xx)[inside]
+    buffer = io.BytesIO()
+    Image.fromarray(np.clip(lum, 0, 255).astype(np.uint8)).convert('RGB').save(buffer, 'PNG')
+    buffer.seek(0)
+    return buffer
+
+
+class QualityGateTests(TransactionTestCase):
+    def setUp(self):
+        self.rng = np.random.default_rng(0)
+
+    def noise(self, mean, std):
+        return lambda yy, xx: mean + self.rng.normal(0, std, yy.shape)
+
+    def assertRejected(self, image, reason):
+        with self.assertRaises(quality.QualityError) as ctx:
+            quality.check(image)
+        self.assertEqual(ctx.exception.reason, reason)
+        self.assertEqual(str(ctx.exception), quality.MESSAGES[reason])
+
+    def test_fundus_passes(self):
+        values = quality.check(fundus_disc(self.noise(120, 25)))
+        self.assertGreater(values['roundness'], 0.9)
+
+    def test_rejections(self):
+        # foto biasa: seluruh frame terang, tidak ada latar hitam
+        self.assertRejected(fundus_disc(self.noise(120, 25), radius=400), 'coverage')
+        self.assertRejected(fundus_disc(self.noise(15, 3)), 'dark')
+        self.assertRejected(fundus_disc(self.noise(240, 5)), 'bright')
+        self.assertRejected(fundus_disc(lambda yy, xx: np.full(yy.shape, 120.0)), 'contrast')
+        # gradasi halus: kontras cukup tapi tanpa detail tajam
+        self.assertRejected(fundus_disc(lambda yy, xx: 60 + 0.8 * xx), 'blur')
+        self.assertRejected(io.BytesIO(b'bukan gambar'), 'unreadable')
+
+    @override_settings(EYERIS_QUALITY_MIN_SHARPNESS=0)
+    def test_thresholds_from_settings(self):
+        quality.check(fundus_disc(lambda yy, xx: 60 + 0.8 * xx))
+
+
+class TTAOptionsTests(TransactionTestCase):
+    def test_missing_setting_means_off(self):
+        with override_settings():
+            from django.conf import settings as live_settings
+
+            del live_settings.EYERIS_TTA
+            self.assertEqual(tta.cache_variant(), 'off')
+            probs = np.full((2, 8), 0.125, dtype=np.float32)
+            with mock.patch('core.batching.predict', return_value=probs) as predict:
+                tta.predict(np.zeros((2, 224, 224, 3), dtype=np.uint8))
+            predict.assert_called_once()
+
+    def test_per_request_threshold(self):
+        job = ScreeningJob(tta_threshold=0.9)
+        self.assertEqual(tta.cache_variant(**tta.job_options(job)), 'auto-0.9')
+        self.assertEqual(tta.job_options(ScreeningJob()), {})
+        # confidence 0.5 < 0.9: kedua mata di-TTA dalam satu predict tambahan
+        probs = np.tile(np.array([[0.5, 0.5] + [0.0] * 6], dtype=np.float32), (2, 1))
+        with override_settings(EYERIS_TTA='off'), \
+                mock.patch('core.batching.predict', side_effect=lambda batch: np.resize(probs, (len(batch), 8))):
+            _, info = tta.predict(np.zeros((2, 224, 224, 3), dtype=np.uint8), **tta.job_options(job))
+        self.assertEqual(info['tta_eyes'], 2)
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class SaliencyJobTests(TransactionTestCase):
+    def test_enqueue_reuses_pending_job_after_race(self):
+        user = User.objects.create_user('dokter')
+        patient = Patient.objects.create(owner=user, name='Pasien', age=40, gender='F')
+        first = jobs.enqueue_saliency(patient, user)
+        # request lain lolos pengecekan awal bersamaan: constraint yang menolak insert kedua
+        with mock.patch('django.db.models.query.QuerySet.first', side_effect=[None, first]):
+            second = jobs.enqueue_saliency(patient, user)
+        self.assertEqual(second.pk, first.pk)
+        self.assertEqual(ScreeningJob.objects.filter(stage=ScreeningJob.STAGE_SALIENCY).count(), 1)
+
+    def test_failed_job_is_reported_instead_of_requeued(self):
+        user = User.objects.create_user('dokter')
+        self.client.force_login(user)
+        patient = Patient.objects.create(
+            owner=user, name='Pasien', age=40, gender='F', image1=fundus_upload('kiri.jpg', (120, 40, 20)))
+        failed = ScreeningJob.objects.create(
+            patient=patient, requested_by=user, stage=ScreeningJob.STAGE_SALIENCY,
+            status=ScreeningJob.STATUS_FAILED, error='model rusak',
+        )
+        url = reverse('patient_saliency', args=[patient.pk, 'left'])
+        with mock.patch('core.model_registry.cached_version', return_value='v1'):
+            for _ in range(3):
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, 503)
+                self.assertEqual(response.json()['error'], 'model rusak')
+            self.assertEqual(ScreeningJob.objects.filter(stage=ScreeningJob.STAGE_SALIENCY).count(), 1)
+
+            # setelah EYERIS_SALIENCY_RETRY_SECONDS job baru boleh diantrikan (sekali)
+            with override_settings(EYERIS_SALIENCY_RETRY_SECONDS=0):
+                self.assertEqual(self.client.get(url).status_code, 202)
+                self.assertEqual(self.client.get(url).status_code, 202)
+        self.assertEqual(ScreeningJob.objects.exclude(pk=failed.pk).count(), 1)
+
+    def test_backfill_reads_version_without_loading_model(self):
+        patient = Patient.objects.create(name='Pasien', age=40, gender='F')
+        with mock.patch('core.model_registry.get_loaded', side_effect=AssertionError('model di-load')), \
+                mock.patch('core.model_registry.file_version', return_value='v1') as file_version:
+            self.assertEqual(saliency.backfill([patient]), (0, 0))
+        file_version.assert_called_once()
+
+    def test_known_versions_uses_last_saliency_job(self):
+        patient = Patient.objects.create(name='Pasien', age=40, gender='F')
+        ScreeningJob.objects.create(
+            patient=patient, stage=ScreeningJob.STAGE_SALIENCY, status=ScreeningJob.STATUS_DONE,
+            timings={'saliency_version': 'v2'},
+        )
+        with mock.patch('core.model_registry.cached_version', return_value=None):
+            self.assertEqual(list(saliency.known_versions(patient)), ['v2'])
+
+
+@override_settings(
+    MEDIA_ROOT=MEDIA_ROOT,
+    EYERIS_QUALITY_GATE=False,
+)
+class QueryBudgetTests(TransactionTestCase):
+    """
+    Jumlah query view yang sering dipanggil tetap dalam query_budget.DEFAULT_BUDGETS.
+    TransactionTestCase: tanpa transaksi pembungkus, atomic() di view tidak menjadi
+    SAVEPOINT tambahan, jadi hitungannya sama dengan produksi.
+    """
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        # bucket rate limit (DatabaseCache) tidak ikut di-flush antar test
+        caches['ratelimit'].clear()
+        self.user = User.objects.create_user('dokter', password='rahasia-123')
+        self.client.force_login(self.user)
+        llm = mock.patch.object(ai_utils, 'llm', StubLLM())
+        llm.start()
+        self.addCleanup(llm.stop)
+
+    def make_patient(self, name='Pasien'):
+        patient = Patient.objects.create(
+            owner=self.user, name=name, age=50, gender='M',
+            image1=fundus_upload('kiri.jpg', (120, 40, 20)),
+            image2=fundus_upload('kanan.jpg', (110, 50, 30)),
+            prediction='Normal',
+        )
+        job = ScreeningJob.objects.create(
+            patient=patient, requested_by=self.user,
+            stage=ScreeningJob.STAGE_ANALYSIS, status=ScreeningJob.STATUS_DONE,
+            ai_analysis='Ringkasan **analisis**.',
+        )
+        return patient, job
+
+    def test_dashboard_get(self):
+        _, job = self.make_patient()
+        response = query_budget.assert_view_budget(
+            self.client.get, 'dashboard', reverse('dashboard'), {'job': job.pk})
+        self.assertEqual(response.status_code, 200)
+
+    @override_settings(EYERIS_SCREENING_ASYNC=False, EYERIS_TTA='off')
+    def test_dashboard_inline_post(self):
+        probs = np.tile(np.eye(1, 8, 0, dtype=np.float32), (2, 1))
+        with mock.patch('core.batching.apredict', mock.AsyncMock(return_value=probs)), \
+                mock.patch('core.model_registry.model_version', return_value='test'):
+            response = query_budget.assert_view_budget(self.client.post, 'dashboard', reverse('dashboard'), {
+                'name': 'Pasien Baru', 'age': 61, 'gender': 'F',
+                'image1': fundus_upload('kiri.jpg', (120, 40, 20)),
+                'image2': fundus_upload('kanan.jpg', (110, 50, 30)),
+            })
+        self.assertEqual(response.status_code, 302)
+        job = ScreeningJob.objects.get(patient__name='Pasien Baru')
+        self.assertTrue(job.is_finished)
+
+    def test_history(self):
+        for i in range(5):
+            self.make_patient(f'Pasien {i}')
+        response = query_budget.assert_view_budget(self.client.get, 'history', reverse('history'))
+        self.assertEqual(response.status_code, 200)
+
+    def test_job_status(self):
+        _, job = self.make_patient()
+        response = query_budget.assert_view_budget(
+            self.client.get, 'job_status', reverse('job_status', args=[job.pk]))
+        self.assertEqual(response.json()['id'], job.pk)
+
+    def ask(self, view):
+        body = json.dumps({'variable': 'Glaucoma', 'question': 'Apa itu glaukoma?'})
+        return query_budget.assert_view_budget(
+            self.client.post, view, reverse(view), body, content_type='application/json')
+
+    def test_ai_answer(self):
+        self.assertEqual(self.ask('ai_answer').status_code, 200)
+
+    def test_ai_answer_anonymous(self):
+        self.client.logout()
+        self.assertEqual(self.ask('ai_answer').status_code, 200)
+
+    def test_trigger_ai(self):
+        self.assertEqual(self.ask('trigger_ai').json()['status'], 'ok')
+
+    def test_patient_saliency_without_loading_model(self):
+        patient, _ = self.make_patient()
+        with mock.patch('core.model_registry.get_loaded', side_effect=AssertionError('model di-load')):
+            response = query_budget.assert_view_budget(
+                self.client.get, 'patient_saliency', reverse('patient_saliency', args=[patient.pk, 'left']))
+            self.assertEqual(response.status_code, 202)
+            again = self.client.get(reverse('patient_saliency', args=[patient.pk, 'left']))
+        self.assertEqual(again.json()['job'], response.json()['job'])
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, EYERIS_QUALITY_GATE=False)
+class UploadHandoffTests(TransactionTestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('dokter')
+        self.client.force_login(self.user)
+
+    def post_patient(self):
+        return self.client.post(reverse('dashboard'), {
+            'name': 'Pasien', 'age': 45, 'gender': 'M',
+            'image1': fundus_upload('kiri.jpg', (120, 40, 20)),
+            'image2': fundus_upload('kanan.jpg', (110, 50, 30)),
+        })
+
+    def test_async_upload_is_handed_to_worker_process(self):
+        with mock.patch('core.preprocessing.open_rgb', wraps=preprocessing.open_rgb) as open_rgb:
+            self.assertEqual(self.post_patient().status_code, 302)
+        # satu decode per gambar untuk gerbang kualitas + inference
+        self.assertEqual(open_rgb.call_count, 2)
+        patient = Patient.objects.get()
+        path = preprocessing._decoded_path(patient.image1_hash)
+        self.assertTrue(os.path.exists(path))
+
+        # worker = proses lain: memori web tidak terlihat, hanya .npy di EYERIS_DECODED_DIR
+        preprocessing._decoded.clear()
+        with mock.patch('core.preprocessing.load_batch', side_effect=AssertionError('dibaca dari disk')), \
+                mock.patch('core.preprocessing.decode_into', side_effect=AssertionError('dibaca dari disk')):
+            images = screening.load_images(patient)
+        self.assertEqual(images.shape, (2, 224, 224, 3))
+        self.assertFalse(os.path.exists(path))
@@ -0,0 +1,53 @@
+# core/thumbnails.py
+"""
+Thumbnail kecil untuk halaman riwayat.
+
+Thumbnail dibuat sekali lalu disimpan di EYERIS_THUMBNAIL_DIR. Nama file
+memakai hash isi gambar (kalau ada), jadi gambar yang sama dipakai bersama
+antar pasien dan tidak perlu dibuat ulang.
+"""
+import hashlib
+import os
+import tempfile
+
+from django.conf import settings
+from PIL import Image
+
+THUMBNAIL_SIZE = (160, 160)
+
+
+def thumbnail_dir() -> str:
+    return str(getattr(settings, 'EYERIS_THUMBNAIL_DIR', None) or os.path.join(settings.MEDIA_ROOT, 'thumbs'))
+
+
+def thumbnail_key(field_file, content_hash=None) -> str:
+    # gambar lama tanpa hash: pakai hash dari nama file di storage
+    return content_hash or hashlib.sha256(field_file.name.encode('utf-8')).hexdigest()
+
+
+def thumbnail_path(key, size=THUMBNAIL_SIZE) -> str:
+    return os.path.join(thumbnail_dir(), f"{size[0]}x{size[1]}", key[:2], f"{key}.jpg")
+
+
+def get_thumbnail(field_file, content_hash=None, size=THUMBNAIL_SIZE) -> str:
+    """Kembalikan path thumbnail di disk, buat dulu kalau belum ada."""
+    path = thumbnail_path(thumbnail_key(field_file, content_hash), size)
+    if os.path.exists(path):
+        return path
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with field_file.open('rb') as fh, Image.open(fh) as im:
+        # draft: JPEG besar langsung di-decode di skala kecil
+        im.draft('RGB', size)
+        im = im.convert('RGB')
+        im.thumbnail(size)
+        # tulis ke file sementara lalu rename, supaya request lain tidak membaca thumbnail setengah jadi
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.part')
+        try:
+            with os.fdopen(fd, 'wb') as out:
+                im.save(out, 'JPEG', quality=80, optimize=True)
+            os.replace(tmp, path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+    return path
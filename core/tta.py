@@ -0,0 +1,150 @@
+# core/tta.py
+"""
+Test-time augmentation (TTA) untuk inference screening.
+
+Varian flip/rotasi/crop dari kedua mata disusun jadi satu batch dan diprediksi
+dengan SATU panggilan predict (lewat micro-batcher / daemon), lalu
+probabilitasnya dirata-rata per mata.
+
+    EYERIS_TTA = off     predict biasa (2 gambar)
+                 auto    predict biasa dulu; hanya mata dengan confidence top-1
+                         di bawah EYERIS_TTA_THRESHOLD yang di-TTA
+                 always  selalu TTA untuk kedua mata
+
+Ambang bisa juga dipilih per request (field "Ambang TTA" di form screening,
+disimpan di ScreeningJob.tta_threshold): job dengan ambang sendiri memakai
+mode auto dengan ambang itu, apa pun EYERIS_TTA (0 = tanpa TTA).
+
+Overhead latency dibanding predict biasa bisa diukur dengan
+`manage.py bench_screening` (bagian tta).
+"""
+import numpy as np
+from django.conf import settings
+from PIL import Image
+
+from . import batching, metrics, preprocessing
+
+# varian selain gambar asli; urutan tetap supaya hasil bisa direproduksi
+VARIANTS = ('flip_h', 'flip_v', 'rot90', 'rot270', 'crop')
+
+# crop tengah 90% lalu di-resize kembali ke 224
+CROP_RATIO = 0.9
+
+
+def _center_crop(img):
+    h, w = img.shape[:2]
+    dy, dx = int(h * (1 - CROP_RATIO) / 2), int(w * (1 - CROP_RATIO) / 2)
+    cropped = Image.fromarray(img[dy:h - dy, dx:w - dx])
+    return np.asarray(cropped.resize(preprocessing.IMAGE_SIZE, Image.Resampling.BILINEAR))
+
+
+_TRANSFORMS = {
+    'flip_h': lambda img: img[:, ::-1],
+    'flip_v': lambda img: img[::-1, :],
+    'rot90': lambda img: np.rot90(img, 1),
+    'rot270': lambda img: np.rot90(img, 3),
+    'crop': _center_crop,
+}
+
+
+def augment(images, variants=VARIANTS, include_original=True):
+    """
+    Susun varian `images` (n, 224, 224, 3) jadi satu batch (k * n, ...),
+    berurutan per varian: [asli..., flip_h..., flip_v..., ...].
+    """
+    images = np.asarray(images)
+    parts = [images] if include_original else []
+    for name in variants:
+        transform = _TRANSFORMS[name]
+        parts.append(np.stack([transform(img) for img in images]))
+    return np.concatenate(parts, axis=0)
+
+
+def average(outputs, n):
+    """Rata-rata probabilitas batch hasil augment() kembali ke (n, num_classes)."""
+    outputs = np.asarray(outputs, dtype=np.float32)
+    return outputs.reshape(-1, n, outputs.shape[-1]).mean(axis=0)
+
+
+def _mode():
+    # default sama dengan settings: TTA hanya aktif kalau diminta
+    return getattr(settings, 'EYERIS_TTA', 'off')
+
+
+def _threshold():
+    return getattr(settings, 'EYERIS_TTA_THRESHOLD', 0.6)
+
+
+def job_options(job) -> dict:
+    """Argumen mode/threshold untuk predict() dan cache_variant() dari ambang per request di job."""
+    threshold = getattr(job, 'tta_threshold', None)
+    return {} if threshold is None else {'mode': 'auto', 'threshold': threshold}
+
+
+def cache_variant(mode=None, threshold=None) -> str:
+    """Bagian key prediction_cache: hasil TTA dan predict biasa tidak boleh tertukar."""
+    mode = mode or _mode()
+    if mode == 'auto':
+        threshold = _threshold() if threshold is None else threshold
+        return f"auto-{threshold:g}"
+    return 'always' if mode == 'always' else 'off'
+
+
+def _plan(probs, threshold):
+    """Indeks mata yang confidence top-1-nya di bawah `threshold` (mode auto)."""
+    if probs.ndim < 2 or probs.shape[-1] < 2:
+        # model mengembalikan label, bukan probabilitas: tidak ada yang bisa dirata-rata
+        return []
+    return [i for i, row in enumerate(probs) if row.max() < threshold]
+
+
+def _merge(probs, eyes, variant_outputs):
+    """Gabungkan hasil predict biasa dengan varian untuk mata `eyes`."""
+    merged = np.array(probs, dtype=np.float32)
+    augmented = average(np.concatenate([probs[eyes], variant_outputs]), len(eyes))
+    merged[eyes] = augmented
+    return merged
+
+
+def predict(images, mode=None, threshold=None):
+    """
+    Predict dengan TTA sesuai mode. Kembalikan (probabilitas (n, num_classes), info)
+    dengan info {"tta_variants": k, "tta_eyes": m} kalau TTA dijalankan, selain itu {}.
+    """
+    mode = mode or _mode()
+    threshold = _threshold() if threshold is None else threshold
+    if mode == 'always':
+        images = np.asarray(images)
+        with metrics.stage("tta"):
+            batch = augment(images)
+            probs = average(batching.predict(batch), len(images))
+        return probs, {"tta_variants": len(VARIANTS) + 1, "tta_eyes": len(images)}
+
+    probs = np.asarray(batching.predict(images))
+    eyes = _plan(probs, threshold) if mode == 'auto' else []
+    if not eyes:
+        return probs, {}
+    with metrics.stage("tta"):
+        variants = batching.predict(augment(np.asarray(images)[eyes], include_original=False))
+        probs = _merge(probs, eyes, variants)
+    return probs, {"tta_variants": len(VARIANTS) + 1, "tta_eyes": len(eyes)}
+
+
+async def apredict(images, mode=None, threshold=None):
+    """Versi async dari predict (batching.apredict); menyusun varian (beberapa ms) di event loop."""
+    mode = mode or _mode()
+    threshold = _threshold() if threshold is None else threshold
+    if mode == 'always':
+        images = np.asarray(images)
+        with metrics.stage("tta"):
+            probs = average(await batching.apredict(augment(images)), len(images))
+        return probs, {"tta_variants": len(VARIANTS) + 1, "tta_eyes": len(images)}
+
+    probs = np.asarray(await batching.apredict(images))
+    eyes = _plan(probs, threshold) if mode == 'auto' else []
+    if not eyes:
+        return probs, {}
+    with metrics.stage("tta"):
+        variants = await batching.apredict(augment(np.asarray(images)[eyes], include_original=False))
+        probs = _merge(probs, eyes, variants)
+    return probs, {"tta_variants": len(VARIANTS) + 1, "tta_eyes": len(eyes)}
@@ -0,0 +1,143 @@
+# core/uploads.py
+"""
+Upload handler untuk gambar fundus.
+
+Dipasang paling depan di FILE_UPLOAD_HANDLERS. Untuk field gambar
+(UPLOAD_IMAGE_FIELDS) file ditulis per chunk ke file sementara, tidak pernah
+ditampung utuh di memori, sambil:
+- memotong upload yang lebih besar dari EYERIS_UPLOAD_MAX_BYTES,
+- membaca header gambar dari chunk pertama dan menolak gambar yang jumlah
+  pikselnya di atas EYERIS_UPLOAD_MAX_PIXELS (decompression bomb) sebelum
+  sisa file diproses,
+- menghitung sha256 isi file, ditempel di `content_hash` (format gambar dari
+  header di `image_format`) supaya storage dan ContentHashImageField tidak
+  membaca file sekali lagi.
+
+Di WSGI handler berjalan saat body diterima dari jaringan, jadi upload yang
+ditolak tidak perlu diterima sampai habis. Di ASGI Django sudah mem-buffer
+body (SpooledTemporaryFile) sebelum parsing, jadi batas di atas hanya
+menghemat decode/hash/tulis; parsing-nya sendiri dipanggil dari thread
+(lihat dashboard_view), bukan dari event loop.
+
+Upload yang ditolak di-skip dan alasannya disimpan di `request.upload_errors`
+(lihat rejected()), untuk ditampilkan PatientForm sebagai error field.
+File lain (mis. ZIP import) diteruskan ke handler bawaan Django.
+"""
+import hashlib
+import io
+
+from django.conf import settings
+from django.core.files.uploadhandler import SkipFile, TemporaryFileUploadHandler
+from PIL import Image
+
+from . import preprocessing, quality
+
+UPLOAD_IMAGE_FIELDS = ('image1', 'image2')
+
+# header JPEG/PNG (termasuk EXIF) biasanya muat di sini; lewat dari ini tanpa ukuran = bukan gambar
+HEADER_LIMIT = 1024 * 1024
+
+
+def max_bytes() -> int:
+    return int(getattr(settings, 'EYERIS_UPLOAD_MAX_BYTES', 20 * 1024 * 1024))
+
+
+def max_pixels() -> int:
+    return int(getattr(settings, 'EYERIS_UPLOAD_MAX_PIXELS', 50_000_000))
+
+
+def rejected(request) -> dict:
+    """{nama field: pesan} untuk upload yang ditolak handler."""
+    return getattr(request, 'upload_errors', {})
+
+
+class FundusUploadHandler(TemporaryFileUploadHandler):
+    """Streaming ke file sementara dengan batas ukuran/piksel dan hash sha256 (lihat docstring modul)."""
+
+    def new_file(self, field_name, *args, **kwargs):
+        self.active = field_name in UPLOAD_IMAGE_FIELDS
+        if not self.active:
+            # bukan gambar fundus: biarkan handler berikutnya yang menangani
+            return
+        super().new_file(field_name, *args, **kwargs)
+        self.sha256 = hashlib.sha256()
+        self.received = 0
+        self.header = bytearray()
+        self.size = None
+        self.format = None
+        # ukuran dari header multipart bisa langsung ditolak, tanpa menerima isinya
+        if self.content_length and self.content_length > max_bytes():
+            self._reject(f'Ukuran file melebihi batas {max_bytes() // (1024 * 1024)} MB.')
+
+    def receive_data_chunk(self, raw_data, start):
+        if not self.active:
+            return raw_data
+        self.received += len(raw_data)
+        if self.received > max_bytes():
+            self._reject(f'Ukuran file melebihi batas {max_bytes() // (1024 * 1024)} MB.')
+        if self.size is None:
+            self._check_header(raw_data)
+        self.sha256.update(raw_data)
+        self.file.write(raw_data)
+        return None
+
+    def file_complete(self, file_size):
+        if not self.active:
+            return None
+        # header tidak terbaca sampai akhir (file kecil/rusak): validasi ImageField yang menolaknya
+        uploaded = super().file_complete(file_size)
+        uploaded.content_hash = self.sha256.hexdigest()
+        uploaded.image_size = self.size
+        uploaded.image_format = self.format
+        return uploaded
+
+    def _check_header(self, raw_data):
+        self.header += raw_data
+        try:
+            # Image.open hanya membaca header, tidak men-decode piksel
+            with Image.open(io.BytesIO(self.header)) as im:
+                self.size = im.size
+                self.format = im.format
+        except Image.DecompressionBombError:
+            self._reject('Resolusi gambar terlalu besar.')
+        except Exception:
+            if len(self.header) >= HEADER_LIMIT:
+                self._reject('File bukan gambar yang bisa dibaca.')
+            return
+        self.header = bytearray()
+        width, height = self.size
+        if width * height > max_pixels():
+            self._reject(f'Resolusi gambar terlalu besar ({width}x{height} piksel).')
+
+    def _reject(self, message):
+        if not hasattr(self.request, 'upload_errors'):
+            self.request.upload_errors = {}
+        self.request.upload_errors[self.field_name] = message
+        raise SkipFile(message)
+
+
+def decode(uploaded):
+    """
+    Decode upload sekali ke PIL RGB (JPEG lewat draft mode, sisi >= quality.QUALITY_SIZE).
+    Hasilnya dipakai gerbang kualitas (quality.check) dan handoff() ke inference.
+    """
+    uploaded.seek(0)
+    try:
+        return preprocessing.open_rgb(uploaded, (quality.QUALITY_SIZE, quality.QUALITY_SIZE))
+    except (OSError, ValueError, Image.DecompressionBombError) as e:
+        raise quality.QualityError('unreadable', {'error': str(e)}) from e
+    finally:
+        uploaded.seek(0)
+
+
+def handoff(uploaded, image, shared=True):
+    """
+    Simpan `image` (hasil decode()) sebagai array 224px per hash isi (preprocessing.remember),
+    supaya inference tidak membaca file dari disk lagi. `shared`: juga untuk worker di proses lain.
+    """
+    key = getattr(uploaded, 'content_hash', None)
+    if not key:
+        return None
+    array = preprocessing.resize_into(image, preprocessing.alloc_batch(1)[0])
+    preprocessing.remember(key, array, shared=shared)
+    return array
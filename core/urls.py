@@ -6,11 +6,23 @@ urlpatterns = [
     path("about/", views.about_view, name="about"),                     # About
     path("dashboard/", views.dashboard_view, name="dashboard"),         # Dashboard (Protected)
     path("screening/", views.screening_view, name="screening"),         # Screening
+    path("history/", views.history_view, name="history"),               # Riwayat screening (Protected)
+    path("history/<int:patient_id>/thumb/<str:eye>/", views.patient_thumbnail, name="patient_thumbnail"),
+    path("history/<int:patient_id>/saliency/<str:eye>/", views.patient_saliency, name="patient_saliency"),  # Heatmap
     path("login/", views.login_view, name="login"),                     # Login
     path("register/", views.register_view, name="register"),            # Register
     path("logout/", views.logout_view, name="logout"),                  # Logout
     path("contact/", views.contact_view, name="contact"),               # Contact
     path("faq/", views.faq_view, name="faq"),                           # FAQ
     path("api/ai-answer/", views.ai_answer, name="ai_answer"),
+    path("api/ai-answer/stream/", views.ai_answer_stream, name="ai_answer_stream"),  # SSE
     path("api/trigger-ai/", views.trigger_ai_for_item, name="trigger_ai"),  # Trigger AI from dashboard
+    path("api/trigger-ai/stream/", views.trigger_ai_stream, name="trigger_ai_stream"),  # SSE
+    path("api/jobs/<int:job_id>/", views.job_status, name="job_status"),  # Polling status job screening
+    path("api/jobs/<int:job_id>/analysis/stream/", views.job_analysis_stream, name="job_analysis_stream"),  # SSE
+    path("api/imports/", views.import_upload, name="import_upload"),  # Upload ZIP import massal (staff)
+    path("api/imports/<int:batch_id>/", views.import_status, name="import_status"),
+    path("api/stats/screening/", views.screening_stats, name="screening_stats"),  # Prevalensi dari rollup harian
+    path("api/stats/inference/", views.inference_stats, name="inference_stats"),  # Statistik model/cache (staff)
+    path("metrics", views.metrics_view, name="metrics"),  # Prometheus (per worker)
 ]
@@ -1,43 +1,45 @@
-from django.http import HttpResponse
+from django.http import FileResponse, Http404, HttpResponse
 from django.shortcuts import render, redirect
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.decorators import login_required
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib import messages
 from django.views.decorators.http import require_http_methods
 from .forms import LoginForm, RegisterForm, PatientForm
-from .models import Patient
-import numpy as np
-from PIL import Image
-import io
+from django.urls import reverse
+from django.core.handlers.asgi import ASGIRequest
+from asgiref.sync import sync_to_async
+from .models import ImportBatch, Patient, ScreeningJob
+import asyncio
+import base64
+import hmac
 import os
-import joblib
-# ensure custom keras layers used in the pickled model are registered
-from . import model_custom
+import time
+import uuid
+import zipfile
 import json
-from django.http import JsonResponse, HttpResponseBadRequest
+from django.http import JsonResponse, HttpResponseBadRequest, StreamingHttpResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.conf import settings
-from .ai_utils import ask_ai, analyze_eye_prediction
+from .ai_utils import (
+    LLMUnavailable,
+    aanalyze_eye_prediction_stream,
+    aask_ai,
+    aask_ai_stream,
+    analysis_cache_stats,
+    analyze_eye_prediction_stream,
+    ask_ai_stream,
+)
+from . import (
+    batching, inference_daemon, jobs, metrics, model_registry, prediction_cache, ratelimit, rollups, saliency,
+    thumbnails, uploads,
+)
 from django.views.decorators.http import require_POST
+from django.db.models import Q
+from django.utils.dateparse import parse_date, parse_datetime
 import markdown
 
 
-# import ChatGroq dari langchain-groq
-from langchain_groq import ChatGroq
-
-# Mapping indeks prediksi ke nama penyakit
-DISEASE_LABELS = {
-    0: "Normal",
-    1: "Diabetes",
-    2: "Glaucoma",
-    3: "Cataract",
-    4: "Age related Macular Degeneration",
-    5: "Hypertension",
-    6: "Pathological Myopia",
-    7: "Other diseases/abnormalities"
-}
-
-
 def home(request):
     return HttpResponse("Halo, ini halaman pertama Django!")
 
@@ -51,112 +53,376 @@ def about_view(request):
 
 
 @login_required(login_url='login')
-def dashboard_view(request):
+async def dashboard_view(request):
     """Dashboard - Hanya untuk user yang sudah login"""
+    user = await request.auser()
+    if request.method == 'POST':
+        # parsing multipart (uploads.FundusUploadHandler: batas ukuran/resolusi, hash, tulis file sementara)
+        # di thread, bukan di event loop. Di ASGI body sudah di-buffer sebelum handler jalan, jadi
+        # batasnya diterapkan saat parsing, bukan saat menerima dari jaringan seperti di WSGI
+        data, files = await sync_to_async(lambda: (request.POST, request.FILES))()
+        form = PatientForm(data, files, upload_errors=uploads.rejected(request))
+        with metrics.stage("validate"):
+            valid = await sync_to_async(form.is_valid)()
+        if valid:
+            # simpan pasien + gambar, proses screening dikerjakan worker (lihat jobs.py)
+            patient = form.save(commit=False)
+            patient.owner = user
+            with metrics.stage("save"):
+                await sync_to_async(patient.save)()
+            job = await sync_to_async(jobs.enqueue_screening)(
+                patient, user, tta_threshold=form.cleaned_data.get('tta_threshold')
+            )
+            if not getattr(settings, 'EYERIS_SCREENING_ASYNC', True):
+                await jobs.arun_inline(job)
+            return redirect(f"{reverse('dashboard')}?job={job.pk}")
+    else:
+        form = PatientForm()
+
+    job = None
+    job_id = request.GET.get('job')
+    if job_id and job_id.isdigit():
+        job = await (
+            ScreeningJob.objects.select_related('patient')
+            .filter(pk=job_id, requested_by=user)
+            .afirst()
+        )
+
     prediction = None
-    # Analisis hasil prediksi menggunakan AI
     ai_analysis = None
+    eyes = []
+    if job is not None:
+        prediction = job.patient.prediction
+        ai_analysis = _job_ai_html(job)
+        if prediction:
+            eyes = await sync_to_async(_eye_results)(job)
+        if job.status == ScreeningJob.STATUS_FAILED and not ai_analysis:
+            messages.error(request, job.error or 'Screening gagal diproses.')
+
+    # render di thread: context processor auth membaca request.user secara sinkron
+    return await sync_to_async(render)(request, "core/dashboard.html", {
+        "page": "dashboard",
+        "form": form,
+        "job": job,
+        "prediction": prediction,
+        "eyes": eyes,
+        "ai_analysis": ai_analysis,
+    })
+
+
+def _job_ai_html(job):
+    if not job.ai_analysis:
+        return None
+    # Convert markdown → HTML
+    return markdown.markdown(job.ai_analysis, extensions=["extra"])
+
+
+def _eye_results(job):
+    """Top-3 kelas + confidence per mata dari EyePrediction, urut kiri lalu kanan."""
+    rows = job.patient.eye_predictions.order_by('eye')
+    return [{"eye": row.get_eye_display(), "top_k": row.top_k()} for row in rows]
+
+
+@login_required(login_url='login')
+def job_status(request, job_id):
+    """Status job screening untuk polling dari dashboard."""
+    job = (
+        ScreeningJob.objects.select_related('patient')
+        .filter(pk=job_id, requested_by=request.user)
+        .first()
+    )
+    if job is None:
+        return JsonResponse({"error": "Job tidak ditemukan"}, status=404)
+    return JsonResponse({
+        "id": job.pk,
+        "stage": job.stage,
+        "status": job.status,
+        "finished": job.is_finished,
+        "prediction": job.patient.prediction,
+        "eyes": _eye_results(job) if job.patient.prediction else [],
+        "tta": bool(job.timings.get('tta_eyes')),
+        "ai_analysis": _job_ai_html(job),
+        "error": job.error if job.status == ScreeningJob.STATUS_FAILED else None,
+    })
+
+
+@login_required(login_url='login')
+def job_analysis_stream(request, job_id):
+    """
+    SSE: stream analisis AI untuk job yang sudah selesai inference. Request ini
+    mengklaim stage analisis dari antrian supaya worker tidak mengerjakannya dua kali;
+    kalau worker sudah lebih dulu mengambilnya, kirim event `busy` dan dashboard kembali polling.
+    """
+    job = (
+        ScreeningJob.objects.select_related('patient')
+        .filter(pk=job_id, requested_by=request.user)
+        .first()
+    )
+    if job is None:
+        return JsonResponse({"error": "Job tidak ditemukan"}, status=404)
+    if job.ai_analysis:
+        return _sse_response([_sse({"html": _job_ai_html(job)}, event="done")])
+    if not jobs.claim_job(job, ScreeningJob.STAGE_ANALYSIS, worker_id=f"stream:{request.user.pk}"):
+        return _sse_response([_sse({"status": job.status, "stage": job.stage}, event="busy")])
+
+    events = _ajob_analysis_events(job) if _is_asgi(request) else _job_analysis_events(job)
+    return _sse_response(events)
+
+
+def _job_analysis_events(job):
+    patient = job.patient
+    started = time.perf_counter()
+    parts = []
     try:
-        ai_raw = analyze_eye_prediction(
+        for text in analyze_eye_prediction_stream(
             patient_name=patient.name,
             patient_age=patient.age,
             patient_gender=patient.gender,
-            prediction=prediction
-        )
-        # Convert markdown → HTML
-        ai_analysis = markdown.markdown(ai_raw, extensions=["extra"])
+            prediction=patient.prediction,
+        ):
+            parts.append(text)
+            yield _sse({"token": text})
+    except GeneratorExit:
+        # browser menutup koneksi: kembalikan job ke antrian untuk worker
+        jobs.release(job)
+        raise
     except Exception as e:
-        ai_analysis = f"<p><strong>AI Analysis Error:</strong> {str(e)}</p>"
-        form = PatientForm()
+        jobs.fail_stage(job, e)
+        yield _sse({"error": str(e)}, event="error")
+        return
+    jobs.complete_analysis(job, "".join(parts), time.perf_counter() - started)
+    yield _sse({"html": _job_ai_html(job)}, event="done")
+
+
+async def _ajob_analysis_events(job):
+    """Versi async dari _job_analysis_events (llm.astream) untuk deployment ASGI."""
+    patient = job.patient
+    started = time.perf_counter()
+    parts = []
+    try:
+        async for text in aanalyze_eye_prediction_stream(
+            patient_name=patient.name,
+            patient_age=patient.age,
+            patient_gender=patient.gender,
+            prediction=patient.prediction,
+        ):
+            parts.append(text)
+            yield _sse({"token": text})
+    except (GeneratorExit, asyncio.CancelledError):
+        await sync_to_async(jobs.release)(job)
+        raise
+    except Exception as e:
+        await sync_to_async(jobs.fail_stage)(job, e)
+        yield _sse({"error": str(e)}, event="error")
+        return
+    await sync_to_async(jobs.complete_analysis)(job, "".join(parts), time.perf_counter() - started)
+    yield _sse({"html": _job_ai_html(job)}, event="done")
 
-    if request.method == 'POST':
-        form = PatientForm(request.POST, request.FILES)
-        if form.is_valid():
-            # simpan instance tanpa commit dulu untuk dapatkan file paths
-            patient = form.save(commit=False)
-            patient.save()
-
-            # proses gambar: buka kedua image, konversi ke numpy array
-            imgs = []
-            for field in ('image1', 'image2'):
-                img_field = getattr(patient, field)
-                if img_field:
-                    # buka file dari storage
-                    img_path = img_field.path
-                    with Image.open(img_path) as im:
-                        # convert to RGB and resize to 224x224 as requested
-                        im = im.convert('RGB')
-                        try:
-                            resample = Image.LANCZOS
-                        except Exception:
-                            # Pillow older versions
-                            resample = Image.ANTIALIAS
-                        im = im.resize((224, 224), resample=resample)
-                        arr = np.array(im)
-                        imgs.append(arr)
-
-            if len(imgs) < 2:
-                messages.error(request, 'Gagal memproses gambar. Pastikan kedua gambar diupload.')
-            else:
-                # stack arrays
-                stacked = np.stack(imgs, axis=0)
-
-                # load model (lazy)
-                model_path = os.path.join(os.path.dirname(__file__), 'model', 'model_1.pkl')
-                try:
-                    clf = joblib.load(model_path)
-                except Exception:
-                    # fallback to pickle
-                    import pickle
-
-                    with open(model_path, 'rb') as f:
-                        clf = pickle.load(f)
-
-                # predict — depending on model expected shape, adjust if necessary
-                try:
-                    hasil_prediksi = clf.predict(stacked)
-                    # Jika model mengembalikan probabilitas (mis. shape (n, num_classes)),
-                    # ambil argmax sepanjang axis=1.
-                    try:
-                        if hasattr(hasil_prediksi, 'ndim') and hasil_prediksi.ndim > 1 and hasil_prediksi.shape[-1] > 1:
-                            y_pred = np.argmax(hasil_prediksi, axis=1)
-                            # Konversi indeks ke nama penyakit dengan label mata kiri/kanan
-                            disease_left = DISEASE_LABELS.get(int(y_pred[0]), f"Unknown ({y_pred[0]})")
-                            disease_right = DISEASE_LABELS.get(int(y_pred[1]), f"Unknown ({y_pred[1]})") if len(y_pred) > 1 else "N/A"
-                            prediction = f"Mata Kiri: {disease_left}\nMata Kanan: {disease_right}"
-                        else:
-                            # jika sudah berupa label 1D
-                            if hasattr(hasil_prediksi, 'ndim') and hasil_prediksi.ndim == 1:
-                                # Asumsikan ini adalah indeks, konversi ke nama penyakit
-                                disease_names = [DISEASE_LABELS.get(int(val), f"Unknown ({val})") for val in hasil_prediksi.tolist()]
-                                disease_left = disease_names[0] if len(disease_names) > 0 else "N/A"
-                                disease_right = disease_names[1] if len(disease_names) > 1 else "N/A"
-                                prediction = f"Mata Kiri: {disease_left}\nMata Kanan: {disease_right}"
-                            else:
-                                prediction = str(hasil_prediksi)
-                    except Exception:
-                        # fallback stringify
-                        prediction = str(hasil_prediksi)
-                except Exception as e:
-                    prediction = f'Error saat prediksi: {e}'
-
-                # Analisis hasil prediksi menggunakan AI
-                ai_analysis = None
-                try:
-                    ai_analysis = analyze_eye_prediction(
-                        patient_name=patient.name,
-                        patient_age=patient.age,
-                        patient_gender=patient.gender,
-                        prediction=prediction
-                    )
-                except Exception as e:
-                    ai_analysis = f"AI Analysis Error: {str(e)}"
-
-                # simpan prediction ke instance
-                patient.prediction = prediction
-                patient.save()
-
-    return render(request, "core/dashboard.html", {"page": "dashboard", "form": form, "prediction": prediction, "ai_analysis": ai_analysis})
+
+def _encode_cursor(patient):
+    raw = f"{patient.created_at.isoformat()}|{patient.pk}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def _decode_cursor(cursor):
+    """Cursor = (created_at, id) baris terakhir halaman sebelumnya; None kalau tidak valid."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        created_at, pk = raw.rsplit("|", 1)
+        created_at = parse_datetime(created_at)
+        return (created_at, int(pk)) if created_at else None
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+
+def _history_queryset(user):
+    qs = Patient.objects.all()
+    if not user.is_staff:
+        # staff melihat semua screening, user biasa hanya miliknya (index patient_owner_created_idx)
+        qs = qs.filter(owner=user)
+    return qs
+
+
+@login_required(login_url='login')
+def history_view(request):
+    """
+    Riwayat screening dengan keyset pagination di (created_at, id): tiap halaman
+    cukup membaca `page_size` baris dari index, seberapa pun panjang riwayatnya.
+    """
+    page_size = getattr(settings, 'EYERIS_HISTORY_PAGE_SIZE', 25)
+    qs = (
+        _history_queryset(request.user)
+        .only('id', 'name', 'age', 'gender', 'prediction', 'created_at')
+        .order_by('-created_at', '-id')
+    )
+    cursor = _decode_cursor(request.GET.get('cursor', ''))
+    if cursor:
+        created_at, pk = cursor
+        qs = qs.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=pk))
+
+    # ambil satu baris lebih untuk tahu apakah masih ada halaman berikutnya
+    rows = list(qs[:page_size + 1])
+    patients = rows[:page_size]
+    next_cursor = _encode_cursor(patients[-1]) if len(rows) > page_size else None
+
+    return render(request, "core/history.html", {
+        "page": "history",
+        "patients": patients,
+        "next_cursor": next_cursor,
+        "is_first_page": cursor is None,
+    })
+
+
+@login_required(login_url='login')
+def patient_thumbnail(request, patient_id, eye):
+    """Thumbnail kecil gambar fundus (left/right) untuk halaman riwayat, dibuat sekali lalu di-cache di disk."""
+    fields = {'left': ('image1', 'image1_hash'), 'right': ('image2', 'image2_hash')}.get(eye)
+    if fields is None:
+        raise Http404("Mata harus left atau right")
+    field, hash_field = fields
+    patient = _history_queryset(request.user).filter(pk=patient_id).only('id', field, hash_field).first()
+    if patient is None or not getattr(patient, field):
+        raise Http404("Gambar tidak ditemukan")
+
+    try:
+        path = thumbnails.get_thumbnail(getattr(patient, field), getattr(patient, hash_field))
+    except (OSError, ValueError):
+        raise Http404("Gambar tidak bisa dibaca")
+    response = FileResponse(open(path, 'rb'), content_type='image/jpeg')
+    # isi gambar pasien tidak berubah, jadi browser boleh menyimpannya (tapi bukan cache bersama)
+    response["Cache-Control"] = "private, max-age=86400"
+    return response
+
+
+@login_required(login_url='login')
+def patient_saliency(request, patient_id, eye):
+    """
+    Heatmap saliency (PNG overlay) satu mata. Kalau belum ada, pembuatannya
+    diantrikan ke worker dan response 202 berisi id job untuk polling; kalau job
+    terakhirnya gagal, 503 berisi error-nya sampai boleh dicoba lagi (Retry-After).
+    """
+    if eye not in saliency.EYE_FIELDS:
+        raise Http404("Mata harus left atau right")
+    field, hash_field = saliency.EYE_FIELDS[eye]
+    patient = _history_queryset(request.user).filter(pk=patient_id).only('id', field, hash_field).first()
+    if patient is None or not getattr(patient, field):
+        raise Http404("Gambar tidak ditemukan")
+
+    # versi model dicari tanpa me-load model di proses web (lihat saliency.known_versions)
+    path = saliency.cached_path(patient, eye)
+    if path is None:
+        job = jobs.enqueue_saliency(patient, request.user)
+        if job.status == ScreeningJob.STATUS_FAILED:
+            # job terakhir gagal: laporkan, jangan antrikan ulang di setiap polling
+            response = JsonResponse({"status": job.status, "job": job.pk, "error": job.error}, status=503)
+            response["Retry-After"] = str(jobs.saliency_retry_after(job))
+            return response
+        response = JsonResponse({"status": job.status, "job": job.pk}, status=202)
+        # client cukup mengulang URL yang sama sampai PNG-nya siap
+        response["Retry-After"] = "2"
+        return response
+    response = FileResponse(open(path, 'rb'), content_type='image/png')
+    # key = hash gambar + versi model, isinya tidak berubah
+    response["Cache-Control"] = "private, max-age=86400"
+    return response
+
+
+@login_required(login_url='login')
+def screening_stats(request):
+    """
+    Prevalensi penyakit dari tabel rollup harian. Parameter opsional
+    `start` / `end` (YYYY-MM-DD, maksimal satu tahun); default 30 hari terakhir.
+    """
+    dates = {}
+    for name in ('start', 'end'):
+        value = request.GET.get(name)
+        try:
+            dates[name] = parse_date(value) if value else None
+        except ValueError:
+            dates[name] = None
+        if value and dates[name] is None:
+            return HttpResponseBadRequest("Format tanggal harus YYYY-MM-DD")
+    start, end = dates['start'], dates['end']
+    if start and end and (end < start or (end - start).days > 366):
+        return HttpResponseBadRequest("Rentang tanggal tidak valid (maksimal 1 tahun)")
+    return JsonResponse(rollups.summary(start, end))
+
+
+@staff_member_required
+def inference_stats(request):
+    """Statistik inference per worker: model aktif, micro-batching, prediction cache dan cache LLM."""
+    if model_registry.is_remote():
+        # model + batching ada di daemon inference node ini
+        try:
+            daemon = inference_daemon.info()
+        except (OSError, RuntimeError) as e:
+            daemon = {"error": str(e)}
+        model, batching_stats = daemon.get("model"), daemon.get("batching")
+    else:
+        loaded = model_registry.current()
+        model, batching_stats = (loaded.info() if loaded is not None else None), batching.get_batcher().metrics()
+    return JsonResponse({
+        "model": model,
+        "batching": batching_stats,
+        "prediction_cache": prediction_cache.get_cache().stats(),
+        "llm_analysis_cache": dict(analysis_cache_stats),
+    })
+
+
+def metrics_view(request):
+    """
+    Metrik Prometheus (format teks) untuk worker web yang melayani request ini saja;
+    stage screening async di `screening_worker` diekspor worker itu sendiri
+    (`--metrics-port`, lihat metrics.serve). Akses dengan header
+    `Authorization: Bearer <EYERIS_METRICS_TOKEN>` atau login staff.
+    """
+    token = getattr(settings, 'EYERIS_METRICS_TOKEN', None)
+    authorized = token and hmac.compare_digest(request.headers.get('Authorization', ''), f"Bearer {token}")
+    if not (authorized or request.user.is_staff):
+        return HttpResponse(status=403)
+    return HttpResponse(metrics.render(), content_type=metrics.CONTENT_TYPE)
+
+
+@staff_member_required
+@require_POST
+def import_upload(request):
+    """
+    Upload ZIP sesi screening (field `archive`). File ditulis per chunk ke
+    EYERIS_IMPORT_DIR lalu diproses oleh `manage.py import_screenings --pending`.
+    """
+    archive = request.FILES.get('archive')
+    if archive is None:
+        return HttpResponseBadRequest("`archive` is required")
+    if not archive.name.lower().endswith('.zip'):
+        return HttpResponseBadRequest("Hanya file ZIP yang didukung")
+
+    os.makedirs(settings.EYERIS_IMPORT_DIR, exist_ok=True)
+    path = os.path.join(settings.EYERIS_IMPORT_DIR, f"{uuid.uuid4().hex}.zip")
+    with open(path, 'wb') as f:
+        for chunk in archive.chunks():
+            f.write(chunk)
+    if not zipfile.is_zipfile(path):
+        os.remove(path)
+        return HttpResponseBadRequest("File bukan ZIP yang valid")
+
+    batch = ImportBatch.objects.create(source_path=path, uploaded_by=request.user)
+    return JsonResponse({"id": batch.pk, "status": batch.status}, status=202)
+
+
+@staff_member_required
+def import_status(request, batch_id):
+    batch = ImportBatch.objects.filter(pk=batch_id).first()
+    if batch is None:
+        return JsonResponse({"error": "Import tidak ditemukan"}, status=404)
+    return JsonResponse({
+        "id": batch.pk,
+        "status": batch.status,
+        "total_pairs": batch.total_pairs,
+        "imported": batch.imported,
+        "skipped": batch.skipped,
+        "images_per_second": batch.images_per_second,
+        "error": batch.error,
+    })
 
 
 def screening_view(request):
@@ -239,45 +505,137 @@ def logout_view(request):
     messages.success(request, 'Anda telah berhasil logout.')
     return redirect('landing')
 
-@csrf_exempt
-def ai_answer(request):
-    if request.method != "POST":
-        return HttpResponseBadRequest("POST only")
+def _sse(data, event=None):
+    """Format satu event Server-Sent Events."""
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+def _sse_response(events):
+    response = StreamingHttpResponse(events, content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    # matikan buffering di reverse proxy (nginx) supaya token langsung terkirim
+    response["X-Accel-Buffering"] = "no"
+    return response
+
+
+def _stream_answer(tokens):
+    """Ubah iterator token LLM jadi event SSE: `token`* lalu `done` (atau `error`)."""
+    parts = []
+    try:
+        for text in tokens:
+            parts.append(text)
+            yield _sse({"token": text})
+    except Exception as e:
+        yield _sse({"error": str(e)}, event="error")
+        return
+    answer = "".join(parts)
+    yield _sse({"answer": answer, "html": markdown.markdown(answer, extensions=["extra"])}, event="done")
+
+
+async def _astream_answer(tokens):
+    """Versi async dari _stream_answer untuk iterator token async (ASGI)."""
+    parts = []
+    try:
+        async for text in tokens:
+            parts.append(text)
+            yield _sse({"token": text})
+    except Exception as e:
+        yield _sse({"error": str(e)}, event="error")
+        return
+    answer = "".join(parts)
+    yield _sse({"answer": answer, "html": markdown.markdown(answer, extensions=["extra"])}, event="done")
+
+
+def _is_asgi(request):
+    # di bawah ASGI pakai iterator async (llm.astream), di WSGI iterator biasa
+    return isinstance(request, ASGIRequest)
+
+
+def _answer_events(request, variable, question):
+    if _is_asgi(request):
+        return _astream_answer(aask_ai_stream(variable, question))
+    return _stream_answer(ask_ai_stream(variable, question))
+
+
+def _read_question(request):
+    """Parse body JSON { "variable": "...", "question": "..." }; kembalikan (variable, question, error_response)."""
     try:
         body = json.loads(request.body.decode("utf-8"))
     except Exception:
-        return HttpResponseBadRequest("Invalid JSON")
+        return None, None, HttpResponseBadRequest("Invalid JSON")
     variable = body.get("variable", "")
     question = body.get("question", "")
     if not question:
-        return HttpResponseBadRequest("`question` is required")
+        return None, None, HttpResponseBadRequest("`question` is required")
+    return variable, question, None
+
+
+def _degraded(error):
+    """Jawaban cepat saat LLM penuh / timeout, supaya klien mencoba lagi nanti alih-alih menumpuk request."""
+    response = JsonResponse({"error": str(error), "degraded": True}, status=503)
+    response["Retry-After"] = "10"
+    return response
+
+
+@csrf_exempt
+@ratelimit.llm_rate_limit
+async def ai_answer(request):
+    if request.method != "POST":
+        return HttpResponseBadRequest("POST only")
+    variable, question, error = _read_question(request)
+    if error:
+        return error
 
     try:
-        answer, raw = ask_ai(variable, question)
+        answer, raw = await aask_ai(variable, question)
         return JsonResponse({"answer": answer})
+    except LLMUnavailable as e:
+        return _degraded(e)
     except Exception as e:
         return JsonResponse({"error": str(e)}, status=500)
-    
+
+
+@csrf_exempt
+@ratelimit.llm_rate_limit
+def ai_answer_stream(request):
+    """Versi SSE dari ai_answer: token dikirim begitu diterima dari LLM."""
+    if request.method != "POST":
+        return HttpResponseBadRequest("POST only")
+    variable, question, error = _read_question(request)
+    if error:
+        return error
+    return _sse_response(_answer_events(request, variable, question))
+
 
 @require_POST
 @login_required
-def trigger_ai_for_item(request):
+@ratelimit.llm_rate_limit
+async def trigger_ai_for_item(request):
     """
     Contoh: trigger AI dari backend (misal: user klik tombol 'Analyze' di dashboard)
     Body JSON: { "variable": "...", "question": "..." }
     """
+    variable, question, error = _read_question(request)
+    if error:
+        return error
+
     try:
-        body = json.loads(request.body.decode("utf-8"))
-    except Exception:
-        return HttpResponseBadRequest("Invalid JSON")
+        answer, raw = await aask_ai(variable, question)
+    except LLMUnavailable as e:
+        return _degraded(e)
 
-    variable = body.get("variable", "")
-    question = body.get("question", "")
-    if not question:
-        return HttpResponseBadRequest("`question` required")
+    html_answer = markdown.markdown(answer, extensions=["extra"])
 
-    answer, raw = ask_ai(variable, question)
+    return JsonResponse({"status": "ok", "answer": html_answer})
 
-    html_answer = markdown(answer, extensions=["extra"])
 
-    return JsonResponse({"status": "ok", "answer": html_answer})
\ No newline at end of file
+@require_POST
+@login_required
+@ratelimit.llm_rate_limit
+def trigger_ai_stream(request):
+    """Versi SSE dari trigger_ai_for_item; event `done` membawa jawaban final dalam HTML."""
+    variable, question, error = _read_question(request)
+    if error:
+        return error
+    return _sse_response(_answer_events(request, variable, question))
@@ -1,5 +1,6 @@
 from pathlib import Path
 from dotenv import load_dotenv
+import json
 import os
 load_dotenv()
 
@@ -23,6 +24,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # paling luar: durasi request + rincian stage (lihat core/metrics.py)
+    'core.middleware.StageTimingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -59,8 +62,42 @@ DATABASES = {
         'PASSWORD': os.getenv('DB_PASSWORD'),
         'HOST': os.getenv('DB_HOST'),
         'PORT': os.getenv('DB_PORT'),
+        # koneksi dipakai ulang antar request (detik); dicek dulu sebelum dipakai lagi
+        'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', '60')),
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {},
     }
 }
+# DB_POOL=1: pool koneksi psycopg 3 per proses (dianjurkan untuk worker ASGI, karena
+# koneksi persisten per thread tidak cocok dengan thread sync_to_async). Pool butuh
+# CONN_MAX_AGE = 0; ukuran pool x jumlah worker harus di bawah max_connections PostgreSQL.
+if os.getenv('DB_POOL', '0') == '1':
+    DATABASES['default']['CONN_MAX_AGE'] = 0
+    DATABASES['default']['OPTIONS']['pool'] = {
+        'min_size': int(os.getenv('DB_POOL_MIN_SIZE', '2')),
+        'max_size': int(os.getenv('DB_POOL_MAX_SIZE', '10')),
+        'timeout': float(os.getenv('DB_POOL_TIMEOUT', '10')),
+    }
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    # Cache jawaban analisis LLM (key = prompt ternormalisasi, tanpa nama pasien)
+    'llm': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'eyeris-llm',
+        'TIMEOUT': int(os.getenv('EYERIS_LLM_CACHE_TTL', str(24 * 3600))),
+        'OPTIONS': {
+            'MAX_ENTRIES': int(os.getenv('EYERIS_LLM_CACHE_SIZE', '2048')),
+        },
+    },
+    # Token bucket rate limit endpoint AI, dibagi semua worker (tabel dibuat oleh migrasi core 0009)
+    'ratelimit': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'eyeris_ratelimit',
+    },
+}
 
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -97,3 +134,120 @@ LOGIN_URL = 'login'
 LOGIN_REDIRECT_URL = 'dashboard'
 LOGOUT_REDIRECT_URL = 'landing'
 
+
+# Model inference
+# Path file pickle model; default core/model/model_1.pkl
+EYERIS_MODEL_PATH = os.getenv('EYERIS_MODEL_PATH')
+# Load + warm-up model saat worker start (1 = ya)
+EYERIS_MODEL_WARMUP = os.getenv('EYERIS_MODEL_WARMUP', '0') == '1'
+# Backend inference: auto (pakai hasil export .onnx/.tflite di samping pickle kalau
+# runtime-nya terpasang), keras, onnx, atau tflite
+EYERIS_MODEL_BACKEND = os.getenv('EYERIS_MODEL_BACKEND', 'auto')
+# Jumlah thread runtime ONNX/TFLite; 0 = default runtime
+EYERIS_RUNTIME_THREADS = int(os.getenv('EYERIS_RUNTIME_THREADS', '0')) or None
+# Interval (detik) cek perubahan file model untuk hot-reload; negatif = nonaktif
+EYERIS_MODEL_RELOAD_INTERVAL = float(os.getenv('EYERIS_MODEL_RELOAD_INTERVAL', '5'))
+# Micro-batching inference antar request (1 = aktif)
+EYERIS_BATCHING = os.getenv('EYERIS_BATCHING', '1') == '1'
+# Jumlah gambar maksimum per batch predict
+EYERIS_BATCH_MAX_SIZE = int(os.getenv('EYERIS_BATCH_MAX_SIZE', '32'))
+# Waktu tunggu maksimum (ms) sebelum batch di-flush
+EYERIS_BATCH_MAX_WAIT_MS = float(os.getenv('EYERIS_BATCH_MAX_WAIT_MS', '5'))
+# Batas waktu (detik) menunggu hasil micro-batcher sebelum request gagal dengan TimeoutError
+EYERIS_BATCH_TIMEOUT = float(os.getenv('EYERIS_BATCH_TIMEOUT', '30'))
+# Unix socket daemon inference per node (`manage.py inference_daemon`); kosong = model di-load di tiap worker
+EYERIS_INFERENCE_SOCKET = os.getenv('EYERIS_INFERENCE_SOCKET') or None
+# Timeout (detik) menunggu balasan daemon inference
+EYERIS_INFERENCE_TIMEOUT = float(os.getenv('EYERIS_INFERENCE_TIMEOUT', '30'))
+# Test-time augmentation: off, auto (hanya mata dengan confidence < EYERIS_TTA_THRESHOLD), always
+EYERIS_TTA = os.getenv('EYERIS_TTA', 'off')
+EYERIS_TTA_THRESHOLD = float(os.getenv('EYERIS_TTA_THRESHOLD', '0.6'))
+
+# Pipeline screening
+# 1 = POST hanya enqueue job (diproses `manage.py screening_worker`), 0 = diproses langsung di request
+EYERIS_SCREENING_ASYNC = os.getenv('EYERIS_SCREENING_ASYNC', '1') == '1'
+# Berapa kali satu stage job dicoba sebelum ditandai gagal
+EYERIS_JOB_MAX_ATTEMPTS = int(os.getenv('EYERIS_JOB_MAX_ATTEMPTS', '3'))
+# Job `running` yang tidak selesai dalam waktu ini (detik) dianggap worker-nya mati dan diambil ulang
+EYERIS_JOB_LEASE_SECONDS = int(os.getenv('EYERIS_JOB_LEASE_SECONDS', '600'))
+# Jumlah thread untuk decode gambar paralel (kedua mata sekaligus)
+EYERIS_PREPROCESS_THREADS = int(os.getenv('EYERIS_PREPROCESS_THREADS', '2'))
+
+# Cek kualitas foto fundus di form upload sebelum inference (1 = aktif)
+EYERIS_QUALITY_GATE = os.getenv('EYERIS_QUALITY_GATE', '1') == '1'
+
+# Ambang batas cek kualitas (pada salinan 256 px); dikalibrasi dari contoh di media/patients
+EYERIS_QUALITY_MIN_SHARPNESS = float(os.getenv('EYERIS_QUALITY_MIN_SHARPNESS', '4'))
+EYERIS_QUALITY_MIN_BRIGHTNESS = float(os.getenv('EYERIS_QUALITY_MIN_BRIGHTNESS', '35'))
+EYERIS_QUALITY_MIN_CONTRAST = float(os.getenv('EYERIS_QUALITY_MIN_CONTRAST', '8'))
+
+# Upload gambar fundus: di-stream ke file sementara (tidak ditampung di memori), dengan
+# batas ukuran file dan jumlah piksel (decompression bomb) yang dicek selama streaming
+FILE_UPLOAD_HANDLERS = [
+    'core.uploads.FundusUploadHandler',
+    'django.core.files.uploadhandler.MemoryFileUploadHandler',
+    'django.core.files.uploadhandler.TemporaryFileUploadHandler',
+]
+EYERIS_UPLOAD_MAX_BYTES = int(os.getenv('EYERIS_UPLOAD_MAX_BYTES', str(20 * 1024 * 1024)))
+EYERIS_UPLOAD_MAX_PIXELS = int(os.getenv('EYERIS_UPLOAD_MAX_PIXELS', '50000000'))
+# Jumlah gambar hasil decode upload yang disimpan per proses untuk screening inline
+EYERIS_DECODED_CACHE_SIZE = int(os.getenv('EYERIS_DECODED_CACHE_SIZE', '32'))
+# Hasil decode upload untuk screening_worker (.npy 224px per hash; kosong = media/patients/decoded/)
+# dan umurnya (detik) sebelum dianggap basi lalu dihapus worker
+EYERIS_DECODED_DIR = os.getenv('EYERIS_DECODED_DIR') or None
+EYERIS_DECODED_TTL = float(os.getenv('EYERIS_DECODED_TTL', '3600'))
+
+# Cache hasil predict per (hash gambar kiri, hash gambar kanan, versi model)
+EYERIS_PREDICTION_CACHE = os.getenv('EYERIS_PREDICTION_CACHE', '1') == '1'
+# Jumlah entri maksimum di LRU memori per proses
+EYERIS_PREDICTION_CACHE_SIZE = int(os.getenv('EYERIS_PREDICTION_CACHE_SIZE', '1024'))
+# Entri database untuk versi model lama dihapus `manage.py prune_prediction_cache` setelah sekian hari
+EYERIS_PREDICTION_CACHE_RETENTION_DAYS = float(os.getenv('EYERIS_PREDICTION_CACHE_RETENTION_DAYS', '7'))
+# Jumlah thread untuk kerja CPU (decode/predict) yang dipanggil dari view async
+EYERIS_INFERENCE_THREADS = int(os.getenv('EYERIS_INFERENCE_THREADS', '4'))
+
+# Import massal (manage.py import_screenings)
+# Folder penyimpanan arsip ZIP yang diupload lewat /api/imports/ (tidak dipublikasikan seperti MEDIA)
+EYERIS_IMPORT_DIR = os.getenv('EYERIS_IMPORT_DIR', str(BASE_DIR / 'imports'))
+# Jumlah proses preprocessing; kosong = jumlah CPU
+EYERIS_IMPORT_WORKERS = int(os.getenv('EYERIS_IMPORT_WORKERS', '0')) or None
+
+# Observability
+# Request lebih lambat dari ini (ms) di-log beserta rincian stage; 0 = nonaktif
+EYERIS_SLOW_REQUEST_MS = float(os.getenv('EYERIS_SLOW_REQUEST_MS', '2000'))
+# Batas query per view (nama url -> jumlah), menimpa query_budget.DEFAULT_BUDGETS
+EYERIS_QUERY_BUDGETS = json.loads(os.getenv('EYERIS_QUERY_BUDGETS', '{}'))
+# 1 = request yang melewati budget gagal (QueryBudgetExceeded); selain itu hanya warning
+EYERIS_QUERY_BUDGET_STRICT = os.getenv('EYERIS_QUERY_BUDGET_STRICT') == '1'
+# Token Bearer untuk scrape /metrics tanpa login (kosong = hanya staff)
+EYERIS_METRICS_TOKEN = os.getenv('EYERIS_METRICS_TOKEN') or None
+# Port /metrics milik `screening_worker` (stage screening async tidak terlihat di /metrics web); 0 = nonaktif
+EYERIS_WORKER_METRICS_PORT = int(os.getenv('EYERIS_WORKER_METRICS_PORT', '0'))
+
+# LLM (Groq)
+# Timeout (detik) satu panggilan Groq; sebelumnya tanpa batas
+EYERIS_LLM_TIMEOUT = float(os.getenv('EYERIS_LLM_TIMEOUT', '30'))
+# Maksimum panggilan LLM bersamaan per proses (thread + coroutine); sisanya menunggu slot.
+# Panggilan async tidak memakan thread selama menunggu Groq, jadi batas ini soal kuota
+# Groq (request/token per menit) dibagi jumlah proses, bukan soal thread pool
+EYERIS_LLM_MAX_CONCURRENCY = int(os.getenv('EYERIS_LLM_MAX_CONCURRENCY', '16'))
+# Lama (detik) menunggu slot LLM sebelum dijawab "sedang sibuk" (503)
+EYERIS_LLM_QUEUE_TIMEOUT = float(os.getenv('EYERIS_LLM_QUEUE_TIMEOUT', '2'))
+# Rate limit endpoint AI per user/IP: token per menit (0 = nonaktif) dan kapasitas burst
+EYERIS_LLM_RATE_PER_MINUTE = float(os.getenv('EYERIS_LLM_RATE_PER_MINUTE', '6'))
+EYERIS_LLM_BURST = int(os.getenv('EYERIS_LLM_BURST', '3'))
+# Budget token output per profil: ringkasan analisis di dashboard dan tanya-jawab bebas
+EYERIS_LLM_SUMMARY_MAX_TOKENS = int(os.getenv('EYERIS_LLM_SUMMARY_MAX_TOKENS', '512'))
+EYERIS_LLM_QA_MAX_TOKENS = int(os.getenv('EYERIS_LLM_QA_MAX_TOKENS', '1024'))
+
+# Riwayat screening
+# Folder cache thumbnail (dibuat sekali per gambar); kosong = MEDIA_ROOT/thumbs
+EYERIS_THUMBNAIL_DIR = os.getenv('EYERIS_THUMBNAIL_DIR') or None
+# Folder heatmap saliency per (hash gambar, versi model); kosong = MEDIA_ROOT/patients/saliency
+EYERIS_SALIENCY_DIR = os.getenv('EYERIS_SALIENCY_DIR') or None
+# Jumlah proses `manage.py backfill_saliency`; kosong = min(jumlah CPU, 4) (tiap proses me-load model)
+EYERIS_SALIENCY_WORKERS = int(os.getenv('EYERIS_SALIENCY_WORKERS', '0')) or None
+# Lama (detik) job heatmap yang gagal dilaporkan apa adanya sebelum boleh diantrikan ulang
+EYERIS_SALIENCY_RETRY_SECONDS = int(os.getenv('EYERIS_SALIENCY_RETRY_SECONDS', '600'))
+# Jumlah baris per halaman riwayat
+EYERIS_HISTORY_PAGE_SIZE = int(os.getenv('EYERIS_HISTORY_PAGE_SIZE', '25'))